@@ -1,17 +1,24 @@
+import importlib.util
 from mojo.pipTools import installNeededPackages
 
-try:
-    import tracer
-except ModuleNotFoundError:
-    installNeededPackages(
-        "Tracer",
-        [
-            dict(
-                packageName="simplification"
-            ),
-            dict(
-                packageName="Pillow",
-                importName="PIL"
-            )
-        ]
-    )
\ No newline at end of file
+neededPackages = [
+    dict(
+        packageName="simplification"
+    ),
+    dict(
+        packageName="Pillow",
+        importName="PIL"
+    ),
+    dict(
+        packageName="potracer",
+        importName="potrace"
+    )
+]
+
+# find_spec only looks for the packages, so
+# nothing heavy is imported at startup.
+for package in neededPackages:
+    importName = package.get("importName", package["packageName"])
+    if importlib.util.find_spec(importName) is None:
+        installNeededPackages("Tracer", neededPackages)
+        break
@@ -1,7 +1,46 @@
-from .trace import traceGlyphImage
-from .simplify import (
-    simplifyGlyphContours,
-    countGlyphPoints,
-    SimplifyContoursPen,
-    CountPen
-)
\ No newline at end of file
+"""
+The public names are loaded when they are first used.
+The extension imports this package when RoboFont starts,
+so importing it must not import AppKit, DrawBot or the
+simplification extension.
+"""
+
+import importlib
+
+_lazyNames = dict(
+    traceGlyphImage=".trace",
+    traceAndSimplifyGlyphImage=".trace",
+    simplifyGlyphContours=".simplify",
+    countGlyphPoints=".simplify",
+    SimplifyContoursPen=".simplify",
+    CountPen=".simplify",
+    TraceCache=".cache",
+    makeCacheKey=".cache",
+    PackedContours=".contours",
+    PackedContoursPen=".contours"
+)
+
+__all__ = list(_lazyNames)
+
+def __getattr__(name):
+    moduleName = _lazyNames.get(name)
+    if moduleName is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    try:
+        module = importlib.import_module(moduleName, __name__)
+    except ImportError as error:
+        if moduleName != ".trace":
+            raise
+        # AppKit and DrawBot are only available
+        # in RoboFont. The portable parts of the
+        # package can be used without them.
+        raise ImportError(
+            f"{name} needs AppKit and DrawBot, which are only available in RoboFont "
+            f"({error}). Use tracer.portable to trace without them."
+        ) from error
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazyNames))
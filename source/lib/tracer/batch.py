@@ -0,0 +1,835 @@
+"""
+Trace the images in a UFO without RoboFont.
+"""
+
+import os
+import sys
+import time
+import contextlib
+import functools
+import multiprocessing
+import concurrent.futures
+from fontTools.ufoLib import UFOReader
+from fontTools.misc.transform import Transform
+from fontTools.pens.recordingPen import (
+    RecordingPen,
+    RecordingPointPen,
+    replayRecording
+)
+from fontTools.pens.pointPen import PointToSegmentPen
+from . import portable
+from . import simplify
+from . import contours as tracerContours
+from . import cache
+from . import fingerprint
+from . import tune
+from . import imageIndex
+from . import checkpoint
+from . import sharedMemory
+from . import settings as tracerSettings
+from .layerWriter import StreamingLayerWriter, readLayerInfo
+
+# ------
+# Glyphs
+# ------
+
+class BatchGlyph:
+
+    """
+    A minimal glyph object for reading and writing
+    GLIF data with fontTools.ufoLib.
+    """
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.unicodes = []
+        self.note = None
+        self.image = None
+        self.anchors = []
+        self.guidelines = []
+        self.lib = {}
+
+
+def getImageTransformation(image):
+    """
+    Get the transformation from a GLIF image dict.
+
+    >>> getImageTransformation(dict(fileName="a.png", xOffset=10, yOffset=20))
+    <Transform [1 0 0 1 10 20]>
+    """
+    return Transform(
+        image.get("xScale", 1),
+        image.get("xyScale", 0),
+        image.get("yxScale", 0),
+        image.get("yScale", 1),
+        image.get("xOffset", 0),
+        image.get("yOffset", 0)
+    )
+
+# ----------
+# Processing
+# ----------
+
+def traceAndSimplifyImageData(
+        imageData,
+        traceSettings,
+        simplifySettings,
+        transformation=None,
+        pen=None
+    ):
+    """
+    Trace and simplify image data with the portable
+    trace implementation. The result is drawn into pen,
+    a segment pen. If pen is None, the result is returned
+    as a RecordingPen value. If simplifySettings is None,
+    the trace will not be simplified.
+    """
+    recordingPen = None
+    if pen is None:
+        pen = recordingPen = RecordingPen()
+    if simplifySettings is not None:
+        pen = simplify.SimplifyContoursPen(
+            pen,
+            **simplifySettings
+        )
+    portable.traceImageData(
+        imageData,
+        PointToSegmentPen(pen),
+        transformation=transformation,
+        **traceSettings
+    )
+    if recordingPen is not None:
+        return recordingPen.value
+
+def _traceJob(glyphName, imageData, traceSettings, simplifySettings, transformation, tuneSettings=None):
+    # the result is sent back as PackedContours,
+    # which are much faster to pickle.
+    contoursPen = tracerContours.PackedContoursPen()
+    if tuneSettings is None:
+        traceAndSimplifyImageData(
+            imageData,
+            traceSettings,
+            simplifySettings,
+            transformation,
+            pen=contoursPen
+        )
+        return glyphName, contoursPen.getContours(), None
+    # the raw trace is made once and every
+    # candidate is simplified from it.
+    traced = traceAndSimplifyImageData(
+        imageData,
+        traceSettings,
+        None,
+        transformation
+    )
+    tunedSettings, info = tune.tuneSimplifySettings(
+        traced,
+        initialSettings=simplifySettings,
+        **tuneSettings
+    )
+    replayRecording(traced, simplify.SimplifyContoursPen(contoursPen, **tunedSettings))
+    return glyphName, contoursPen.getContours(), tunedSettings
+
+def _traceCompatibleJob(glyphName, imageData, traceSettings, simplifySettings, transformation, tuneSettings=None, layerContours=None):
+    # the traced glyph and the glyphs in the other
+    # layers are converted to quadratic curves
+    # together, so the pen must not convert them.
+    if not layerContours:
+        return _traceJob(glyphName, imageData, traceSettings, simplifySettings, transformation, tuneSettings) + ({},)
+    quadraticTolerance = simplifySettings["quadraticTolerance"]
+    simplifySettings = dict(simplifySettings, quadraticTolerance=0)
+    glyphName, contours, tunedSettings = _traceJob(glyphName, imageData, traceSettings, simplifySettings, transformation, tuneSettings)
+    if tunedSettings is not None:
+        tunedSettings["quadraticTolerance"] = quadraticTolerance
+    contours, *converted = convertCompatibleGlyphsToQuadratic(
+        [contours] + list(layerContours.values()),
+        quadraticTolerance,
+        roundToIntegers=simplifySettings.get("roundToIntegers", True)
+    )
+    return glyphName, contours, tunedSettings, dict(zip(layerContours.keys(), converted))
+
+def convertCompatibleGlyphsToQuadratic(glyphContours, tolerance, roundToIntegers=True):
+    """
+    Convert a list of PackedContours to quadratic curves.
+    Glyphs that are compatible with each other are
+    converted together so that they stay compatible.
+
+    >>> pen = tracerContours.PackedContoursPen()
+    >>> pen.moveTo((0, 0))
+    >>> pen.curveTo((0, 30), (30, 30), (30, 0))
+    >>> pen.closePath()
+    >>> small = pen.getContours()
+    >>> large = tracerContours.PackedContours(small.coordinates * 10, small.pointTypes, small.contourOffsets, small.closed)
+    >>> converted = convertCompatibleGlyphsToQuadratic([small, large, tracerContours.PackedContours()], 1.0)
+    >>> [contours.getPointCount() for contours in converted]
+    [8, 8, 0]
+    >>> converted = convertCompatibleGlyphsToQuadratic([tracerContours.PackedContours(), small, large], 1.0)
+    >>> [contours.getPointCount() for contours in converted]
+    [0, 8, 8]
+    >>> converted = convertCompatibleGlyphsToQuadratic([small], 1.0)
+    >>> [contours.getPointCount() for contours in converted]
+    [5]
+    """
+    # the outlines are read in the same way that
+    # they will be written and read from the UFO.
+    glyphContourLists = []
+    for contours in glyphContours:
+        pointPen = tracerContours.PackedContoursPointPen()
+        contours.drawPoints(pointPen)
+        glyphContourLists.append(list(pointPen.getContours().iterateContours()))
+    # glyphs with the same structure are compatible.
+    groups = {}
+    for index, contourList in enumerate(glyphContourLists):
+        structure = tuple(
+            tuple((operator, len(operands)) for operator, operands in contour)
+            for contour in contourList
+        )
+        groups.setdefault(structure, []).append(index)
+    converted = [[] for contourList in glyphContourLists]
+    for indexes in groups.values():
+        for contourSet in zip(*[glyphContourLists[index] for index in indexes]):
+            convertedContours = simplify.convertCompatibleContoursToQuadratic(contourSet, tolerance)
+            for index, contour in zip(indexes, convertedContours):
+                converted[index].append(contour)
+    result = []
+    for contourList in converted:
+        pen = tracerContours.PackedContoursPen()
+        for contour in contourList:
+            if roundToIntegers:
+                contour = simplify.filterRoundedPoints(contour)
+            replayRecording(contour, pen)
+        result.append(pen.getContours())
+    return result
+
+def _readGlyph(glyphSet, glyphName):
+    glyph = BatchGlyph()
+    recordingPointPen = RecordingPointPen()
+    glyphSet.readGlyph(glyphName, glyph, recordingPointPen)
+    components = [
+        item for item in recordingPointPen.value
+        if item[0] == "addComponent"
+    ]
+    return glyph, components
+
+def _getGlyphOrder(reader, glyphSet):
+    glyphOrder = reader.readLib().get("public.glyphOrder", [])
+    glyphNames = [glyphName for glyphName in glyphOrder if glyphName in glyphSet]
+    remaining = set(glyphSet.keys()) - set(glyphNames)
+    glyphNames += sorted(remaining)
+    return glyphNames
+
+def _iterateJobs(
+        reader,
+        imageGlyphSet,
+        destinationGlyphSet,
+        glyphNames,
+        traceSettings,
+        simplifySettings,
+        incremental,
+        tuneSettings=None,
+        quadraticGlyphSets=None,
+        completed=None
+    ):
+    if quadraticGlyphSets is None:
+        quadraticGlyphSets = {}
+    if completed is None:
+        completed = {}
+    fingerprintSimplifySettings = tune.combineSettings(simplifySettings, tuneSettings)
+    # image data is only read when a job is
+    # about to be submitted to the pool.
+    for glyphName in glyphNames:
+        if glyphName not in imageGlyphSet:
+            yield None
+            continue
+        imageGlyph = BatchGlyph()
+        imageGlyphSet.readGlyph(glyphName, imageGlyph)
+        if not imageGlyph.image:
+            yield None
+            continue
+        imageData = reader.readImage(imageGlyph.image["fileName"], validate=False)
+        transformation = getImageTransformation(imageGlyph.image)
+        glyphFingerprint = fingerprint.makeFingerprint(
+            imageData,
+            traceSettings,
+            fingerprintSimplifySettings,
+            imageTransformation=tuple(transformation),
+            backend=cache.traceBackendPortable
+        )
+        imageHash = glyphFingerprint["image"]
+        if checkpoint.isCompleted(completed, glyphName, imageHash):
+            yield None
+            continue
+        if destinationGlyphSet is not None and glyphName in destinationGlyphSet:
+            destinationGlyph, components = _readGlyph(destinationGlyphSet, glyphName)
+            if incremental:
+                status = fingerprint.getFingerprintStatus(destinationGlyph, glyphFingerprint)
+                if status == fingerprint.fingerprintStatusCurrent:
+                    yield None
+                    continue
+        else:
+            destinationGlyph = BatchGlyph()
+            components = []
+        destinationGlyph.width = imageGlyph.width
+        destinationGlyph.unicodes = list(imageGlyph.unicodes)
+        fingerprint.writeFingerprint(destinationGlyph, glyphFingerprint)
+        layerContours = {}
+        layerGlyphs = {}
+        for layerName, glyphSet in quadraticGlyphSets.items():
+            if glyphName not in glyphSet:
+                continue
+            layerGlyph = BatchGlyph()
+            recordingPointPen = RecordingPointPen()
+            glyphSet.readGlyph(glyphName, layerGlyph, recordingPointPen)
+            pointPen = tracerContours.PackedContoursPointPen()
+            try:
+                recordingPointPen.replay(pointPen)
+            except ValueError:
+                # quadratic contours without on curve
+                # points have already been converted.
+                continue
+            contours = pointPen.getContours()
+            if not len(contours):
+                continue
+            layerComponents = [
+                item for item in recordingPointPen.value
+                if item[0] == "addComponent"
+            ]
+            layerContours[layerName] = contours
+            layerGlyphs[layerName] = (layerGlyph, layerComponents)
+        job = (glyphName, imageData, traceSettings, simplifySettings, transformation, tuneSettings, layerContours)
+        yield job, (destinationGlyph, components, layerGlyphs, imageHash)
+
+def _writeResult(layerWriter, glyphName, contours, destinationGlyph, components, tunedSettings=None):
+    if tunedSettings is not None:
+        destinationGlyph.lib[tune.tunedSettingsLibKey] = dict(tunedSettings)
+    else:
+        destinationGlyph.lib.pop(tune.tunedSettingsLibKey, None)
+
+    _writeGlyph(layerWriter, glyphName, contours, destinationGlyph, components)
+
+def _writeGlyph(layerWriter, glyphName, contours, glyph, components):
+
+    def drawPoints(pointPen):
+        contours.drawPoints(pointPen)
+        for method, args, kwargs in components:
+            getattr(pointPen, method)(*args, **kwargs)
+
+    layerWriter.writeGlyph(glyphName, glyph, drawPoints)
+
+# -------
+# Running
+# -------
+
+@functools.lru_cache(maxsize=None)
+def _findPythonExecutable():
+    # when Python is embedded in an application,
+    # sys.executable is the application and it
+    # can't be used to start worker processes.
+    executable = sys.executable
+    if executable and os.path.basename(executable).lower().startswith("python"):
+        return executable
+    version = "%d.%d" % sys.version_info[:2]
+    for directory in (sys.exec_prefix, sys.prefix):
+        for name in ("python" + version, "python3"):
+            candidate = os.path.join(directory, "bin", name)
+            if os.access(candidate, os.X_OK):
+                return candidate
+    return None
+
+def canUseWorkerProcesses():
+    """
+    Find out if a Python interpreter can be found to
+    run worker processes. Without one, makeExecutor
+    makes a pool of threads, which can only trace on
+    one core at a time.
+    """
+    return _findPythonExecutable() is not None
+
+def makeExecutor(workers):
+    """
+    Make a pool of worker processes. If no Python
+    interpreter can be found to run the workers,
+    a pool of threads is made instead.
+    """
+    executable = _findPythonExecutable()
+    if executable is None:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    if executable == sys.executable:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(executable)
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context
+    )
+
+def formatDuration(seconds):
+    """
+    >>> formatDuration(75)
+    '1:15'
+    >>> formatDuration(3725)
+    '1:02:05'
+    """
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class BatchRunner:
+
+    """
+    Run trace jobs in a pool of workers. The caller
+    collects the results by calling poll, so the runner
+    can be driven from a loop or from a timer on the
+    main thread of an application.
+
+    - jobs: iterable
+      Yields (job, context) tuples, where job is a tuple
+      of arguments for the trace job and context is
+      anything the caller needs to store the result.
+      None is yielded for each skipped glyph.
+    - total: int
+      The number of glyphs, including skipped glyphs.
+    - workers: int
+      The number of workers. If None, the number of
+      processors is used.
+    - executor: concurrent.futures.Executor
+      The pool to run the jobs in. If None, one is made
+      with makeExecutor and it is shut down when the
+      runner is closed.
+    - function: function
+      The function each job is run with. It must be
+      importable by the workers.
+    - shareLargeArguments: bool
+      If the pool is a pool of processes, large bytes
+      and numpy array arguments, such as scans, are
+      given to the workers in shared memory instead
+      of being pickled.
+
+    Only a few jobs per worker are submitted at a time,
+    so jobs are only pulled from the iterable as they
+    are needed.
+    """
+
+    def __init__(self, jobs, total, workers=None, executor=None, function=None, shareLargeArguments=True):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self._ownsExecutor = executor is None
+        if executor is None:
+            executor = makeExecutor(workers)
+        self.executor = executor
+        if function is None:
+            function = _traceJob
+        self.function = function
+        self._sharedMemory = None
+        if shareLargeArguments and isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            self._sharedMemory = sharedMemory.SharedMemoryStore()
+        self._sharedBlocks = {}
+        self.total = total
+        self.maximumPending = workers * 2
+        self.completed = 0
+        self.skipped = 0
+        self.cancelled = False
+        self.startTime = time.monotonic()
+        self._jobs = iter(jobs)
+        self._exhausted = False
+        self._pending = {}
+        self._fill()
+
+    def _fill(self):
+        while len(self._pending) < self.maximumPending:
+            if self._exhausted or self.cancelled:
+                break
+            try:
+                item = next(self._jobs)
+            except StopIteration:
+                self._exhausted = True
+                break
+            if item is None:
+                self.skipped += 1
+                continue
+            job, context = item
+            if self._sharedMemory is None:
+                future = self.executor.submit(self.function, *job)
+            else:
+                job, sharedBlocks = self._sharedMemory.shareArguments(job)
+                future = self.executor.submit(
+                    sharedMemory.runWithSharedArguments,
+                    self.function,
+                    *job
+                )
+                self._sharedBlocks[future] = sharedBlocks
+            self._pending[future] = context
+
+    def _releaseSharedBlocks(self, future):
+        for sharedBlock in self._sharedBlocks.pop(future, []):
+            self._sharedMemory.release(sharedBlock)
+
+    def isFinished(self):
+        return not self._pending and (self._exhausted or self.cancelled)
+
+    def poll(self, timeout=0):
+        """
+        Get a list of (context, result) for the jobs that
+        have finished. For trace jobs the result is (glyph
+        name, PackedContours, tuned settings). This waits
+        up to timeout seconds for a job to finish. If
+        timeout is None, it waits until one has finished.
+        """
+        if not self._pending:
+            return []
+        done, notDone = concurrent.futures.wait(
+            self._pending,
+            timeout=timeout,
+            return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        results = []
+        for future in done:
+            context = self._pending.pop(future)
+            self._releaseSharedBlocks(future)
+            if future.cancelled():
+                continue
+            results.append((context, future.result()))
+        self.completed += len(results)
+        self._fill()
+        return results
+
+    def cancel(self):
+        """
+        Stop submitting jobs and cancel the jobs that
+        haven't started. Jobs that are running will
+        still be returned by poll.
+        """
+        self.cancelled = True
+        for future in list(self._pending):
+            if future.cancel():
+                del self._pending[future]
+                self._releaseSharedBlocks(future)
+
+    def close(self):
+        self.cancel()
+        if self._ownsExecutor:
+            self.executor.shutdown(wait=False)
+        # running workers have already mapped their blocks,
+        # so removing the blocks doesn't disturb them.
+        if self._sharedMemory is not None:
+            self._sharedMemory.close()
+            self._sharedBlocks.clear()
+
+    def getThroughput(self):
+        """
+        The number of glyphs traced per second.
+        """
+        duration = time.monotonic() - self.startTime
+        if not duration:
+            return 0
+        return self.completed / duration
+
+    def getRemainingTime(self):
+        """
+        The estimated number of seconds until all
+        glyphs are traced or None if not known yet.
+        """
+        throughput = self.getThroughput()
+        if not throughput:
+            return None
+        remaining = self.total - self.completed - self.skipped
+        return max(0, remaining) / throughput
+
+    def getProgressText(self):
+        done = self.completed + self.skipped
+        text = f"Traced {done} of {self.total} glyphs"
+        throughput = self.getThroughput()
+        if throughput:
+            text += f" | {throughput:.1f} glyphs per second"
+        remaining = self.getRemainingTime()
+        if remaining is not None:
+            text += f" | {formatDuration(remaining)} remaining"
+        return text
+
+
+def traceUFO(
+        path,
+        traceSettings=None,
+        simplifySettings=None,
+        layerName=None,
+        glyphNames=None,
+        workers=None,
+        incremental=False,
+        tuneMaximumDeviation=None,
+        tuneTimeBudget=tune.defaultTimeBudget,
+        resume=True,
+        progressCallback=None,
+        quadraticLayerNames=None
+    ):
+    """
+    Trace and simplify the images in the default layer
+    of the UFO located at path and write the results
+    into layerName. The tracing is done in a pool of
+    worker processes. If workers is None, the number
+    of workers will be the number of processors.
+
+    Each glyph is written as soon as it has been traced
+    and only a few glyphs per worker are in progress at
+    any time, so memory use doesn't depend on the size
+    of the font. If the run is interrupted, the glyphs
+    that have been written are kept.
+
+    If incremental is True, glyphs that have a current
+    fingerprint in the destination layer will be skipped.
+
+    If tuneMaximumDeviation is given, the simplify settings
+    are tuned for each glyph so that the point count is as
+    low as possible while the outline stays within
+    tuneMaximumDeviation of the trace. The tuning of each
+    glyph is limited to tuneTimeBudget seconds. The tuned
+    settings are stored in the glyph lib.
+
+    The names and image hashes of the glyphs that have
+    been written are recorded in a checkpoint file in the
+    UFO's data directory. If resume is True and the
+    checkpoint was made with the same settings and glyphs,
+    those glyphs are skipped unless their images have
+    changed. The checkpoint is removed when the run is
+    complete.
+
+    If the simplify settings have a quadraticTolerance,
+    the outlines are converted to quadratic curves in
+    the workers. The glyphs with the same names in the
+    layers in quadraticLayerNames are converted together
+    with the traced glyphs and are written back into
+    their layers. The glyphs that are compatible with
+    each other stay compatible, even if the traced
+    glyph isn't compatible with them.
+
+    progressCallback will be called with the glyph name,
+    the number of completed glyphs and the total number
+    of glyphs with images after each glyph is traced.
+
+    Returns a list of the names of the traced glyphs.
+    """
+    if traceSettings is None:
+        traceSettings = dict(tracerSettings.defaultTraceSettings)
+    if simplifySettings is None:
+        simplifySettings = dict(tracerSettings.defaultSimplifySettings)
+    if layerName is None:
+        layerName = tracerSettings.defaultDestinationSettings["layer"]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tuneSettings = None
+    if tuneMaximumDeviation is not None:
+        tuneSettings = dict(
+            maximumDeviation=tuneMaximumDeviation,
+            timeBudget=tuneTimeBudget
+        )
+    if not simplifySettings.get("quadraticTolerance"):
+        quadraticLayerNames = None
+    if quadraticLayerNames:
+        quadraticLayerNames = list(quadraticLayerNames)
+        if layerName in quadraticLayerNames:
+            raise ValueError("The destination layer can't be one of the quadratic layers.")
+    reader = UFOReader(path, validate=False)
+    imageGlyphSet = reader.getGlyphSet(validateRead=False)
+    quadraticGlyphSets = {}
+    for quadraticLayerName in quadraticLayerNames or []:
+        if quadraticLayerName not in reader.getLayerNames():
+            raise ValueError(f"The layer \"{quadraticLayerName}\" doesn't exist.")
+        quadraticGlyphSets[quadraticLayerName] = reader.getGlyphSet(quadraticLayerName, validateRead=False)
+    if glyphNames is None:
+        glyphNames = _getGlyphOrder(reader, imageGlyphSet)
+    # only glyphs with images are read
+    imageGlyphNames = imageIndex.findImageGlyphNames(path)
+    glyphNames = [glyphName for glyphName in glyphNames if glyphName in imageGlyphNames]
+    checkpointPath = checkpoint.getCheckpointPath(path)
+    checkpointSimplifySettings = dict(tune.combineSettings(simplifySettings, tuneSettings))
+    if quadraticLayerNames:
+        checkpointSimplifySettings["quadraticLayerNames"] = quadraticLayerNames
+    checkpointHash = checkpoint.makeCheckpointHash(
+        traceSettings,
+        checkpointSimplifySettings,
+        layerName,
+        glyphNames
+    )
+    completed = {}
+    if resume:
+        completed = checkpoint.readCheckpointFile(checkpointPath, checkpointHash)
+    destinationGlyphSet = None
+    if layerName in reader.getLayerNames():
+        destinationGlyphSet = reader.getGlyphSet(layerName, validateRead=False)
+    jobs = _iterateJobs(
+        reader,
+        imageGlyphSet,
+        destinationGlyphSet,
+        glyphNames,
+        traceSettings,
+        simplifySettings,
+        incremental,
+        tuneSettings,
+        quadraticGlyphSets,
+        completed
+    )
+    total = len(glyphNames)
+    traced = []
+
+    checkpointWriter = checkpoint.CheckpointWriter(checkpointPath, checkpointHash, resume=resume)
+    with contextlib.ExitStack() as stack:
+        # the existing layer info is kept and a new
+        # layer gets an empty layerinfo.plist.
+        layerWriter = stack.enter_context(
+            StreamingLayerWriter(path, layerName, readLayerInfo(path, layerName))
+        )
+        quadraticLayerWriters = {
+            quadraticLayerName : stack.enter_context(
+                StreamingLayerWriter(path, quadraticLayerName, readLayerInfo(path, quadraticLayerName))
+            )
+            for quadraticLayerName in quadraticGlyphSets
+        }
+        stack.enter_context(checkpointWriter)
+        runner = BatchRunner(jobs, total, workers=workers, function=_traceCompatibleJob)
+        try:
+            while not runner.isFinished():
+                for (destinationGlyph, components, layerGlyphs, imageHash), result in runner.poll(timeout=None):
+                    glyphName, contours, tunedSettings, layerContours = result
+                    _writeResult(layerWriter, glyphName, contours, destinationGlyph, components, tunedSettings)
+                    for quadraticLayerName, convertedContours in layerContours.items():
+                        layerGlyph, layerComponents = layerGlyphs[quadraticLayerName]
+                        _writeGlyph(quadraticLayerWriters[quadraticLayerName], glyphName, convertedContours, layerGlyph, layerComponents)
+                    checkpointWriter.add(glyphName, imageHash)
+                    traced.append(glyphName)
+                    if progressCallback is not None:
+                        progressCallback(glyphName, len(traced), total)
+        finally:
+            runner.close()
+    checkpoint.removeCheckpointFile(checkpointPath)
+    return traced
+
+# --------------------
+# Command Line Support
+# --------------------
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="python -m tracer",
+        description="Trace the images in a UFO."
+    )
+    parser.add_argument(
+        "ufo",
+        help="The UFO to trace."
+    )
+    parser.add_argument(
+        "-s", "--settings",
+        help="A .rftracer settings file. If not given, the default settings are used."
+    )
+    parser.add_argument(
+        "-l", "--layer",
+        help="The destination layer. This overrides the layer in the settings file."
+    )
+    parser.add_argument(
+        "-g", "--glyphs",
+        nargs="+",
+        help="The glyphs to trace. If not given, all glyphs with an image are traced."
+    )
+    parser.add_argument(
+        "-j", "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes. Defaults to the number of processors."
+    )
+    parser.add_argument(
+        "-i", "--incremental",
+        action="store_true",
+        help="Skip glyphs that haven't changed since they were last traced."
+    )
+    parser.add_argument(
+        "-t", "--tune",
+        type=float,
+        default=None,
+        metavar="DEVIATION",
+        help="Tune the simplify settings for each glyph to use as few points as possible within this deviation from the trace."
+    )
+    parser.add_argument(
+        "--tune-budget",
+        type=float,
+        default=tune.defaultTimeBudget,
+        metavar="SECONDS",
+        help="The maximum time to spend tuning each glyph."
+    )
+    parser.add_argument(
+        "--quadratic",
+        type=float,
+        default=None,
+        metavar="TOLERANCE",
+        help="Convert the outlines to quadratic curves within this distance of the cubic curves. This overrides the setting in the settings file."
+    )
+    parser.add_argument(
+        "--quadratic-layers",
+        nargs="+",
+        default=None,
+        metavar="LAYER",
+        help="Layers whose glyphs are converted to quadratic curves together with the traced glyphs, so that they stay compatible."
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Trace every glyph instead of continuing a run that was interrupted."
+    )
+    parser.add_argument(
+        "-q", "--quiet",
+        action="store_true",
+        help="Don't report progress."
+    )
+    args = parser.parse_args(args)
+
+    traceSettings = dict(tracerSettings.defaultTraceSettings)
+    simplifySettings = dict(tracerSettings.defaultSimplifySettings)
+    layerName = tracerSettings.defaultDestinationSettings["layer"]
+    if args.settings:
+        traceSettings, simplifySettings, destinationSettings = tracerSettings.readSettingsFile(args.settings)
+        layerName = destinationSettings["layer"]
+    if args.layer:
+        layerName = args.layer
+    if args.quadratic is not None:
+        simplifySettings["quadraticTolerance"] = args.quadratic
+    if args.quadratic_layers and not simplifySettings.get("quadraticTolerance"):
+        parser.error("--quadratic-layers needs a quadratic tolerance.")
+    if args.quadratic_layers and layerName in args.quadratic_layers:
+        parser.error("The destination layer can't be one of the quadratic layers.")
+
+    progressCallback = None
+    if not args.quiet:
+        def progressCallback(glyphName, completed, total):
+            print(f"[{completed}/{total}] {glyphName}")
+
+    start = time.time()
+    try:
+        traced = traceUFO(
+            args.ufo,
+            traceSettings=traceSettings,
+            simplifySettings=simplifySettings,
+            layerName=layerName,
+            glyphNames=args.glyphs,
+            workers=args.workers,
+            incremental=args.incremental,
+            tuneMaximumDeviation=args.tune,
+            tuneTimeBudget=args.tune_budget,
+            resume=not args.restart,
+            progressCallback=progressCallback,
+            quadraticLayerNames=args.quadratic_layers
+        )
+    except KeyboardInterrupt:
+        print("Cancelled. Run the same command again to continue where this run stopped.")
+        return 1
+    if not args.quiet:
+        duration = time.time() - start
+        print(f"Traced {len(traced)} glyphs into \"{layerName}\" in {duration:.1f} seconds.")
+    return 0
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,404 @@
+"""
+Benchmarks for the trace and simplify code.
+
+Run the benchmarks and write the results to a file:
+
+    python -m tracer.benchmark --output after.json
+
+Compare two result files and report regressions:
+
+    python -m tracer.benchmark --compare before.json after.json
+
+The comparison exits with a non-zero status if any
+benchmark is slower than the threshold allows.
+"""
+
+import os
+import sys
+import json
+import types
+import time
+import subprocess
+import platform
+import statistics
+from fontTools.pens.recordingPen import RecordingPen, RecordingPointPen, replayRecording
+from . import simplify
+from . import corpus as tracerCorpus
+from .cache import tracerVersion
+
+defaultRepeat = 5
+defaultTraceRepeat = 1
+defaultRegressionThreshold = 0.1
+
+# these must not be imported by "import tracer"
+# because the extension imports it at startup.
+heavyModules = (
+    "AppKit",
+    "drawBot",
+    "simplification",
+    "numpy",
+    "PIL",
+    "tracer.trace",
+    "tracer.simplify"
+)
+
+# ------
+# Timing
+# ------
+
+def timeFunction(function, repeat=defaultRepeat):
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def summarizeDurations(durations):
+    return dict(
+        median=statistics.median(durations),
+        minimum=min(durations),
+        repeat=len(durations)
+    )
+
+def countRecordingPoints(recording):
+    pen = simplify.CountPen()
+    replayRecording(recording, pen)
+    return pen.pointCount
+
+# ----------
+# Benchmarks
+# ----------
+
+def getFilters():
+    """
+    Get a list of (name, function, arguments) for
+    the filters in the simplify module.
+    """
+    return [
+        ("removeOverlappingPoints", simplify.filterOverlappingPoints, ()),
+        ("spikes", simplify.filterSpikes, (simplify.defaultSpikeTolerance,)),
+        ("minimumContourSegments", simplify.filterContourSegmentCounts, (simplify.defaultMinimumContourSegments,)),
+        ("minimumContourArea", simplify.filterContourAreas, (simplify.defaultMinimumContourArea,)),
+        ("minimumIntegerContourArea", simplify.filterIntegerContourAreas, (simplify.defaultMinimumContourArea,)),
+        ("minimumCurveLength", simplify.filterCurveLengths, (simplify.defaultMinimumCurveLength,)),
+        ("shallowCurves", simplify.filterShallowCurves, (simplify.defaultShallowCurveTolerance,)),
+        ("douglasPeucker", simplify.filterDouglasPeucker, (simplify.defaultDouglasPeuckerTolerance,)),
+        ("visvalingamWhyatt", simplify.filterVisvalingamWhyatt, (simplify.defaultVisvalingamWhyattTolerance,)),
+        ("roundToIntegers", simplify.filterRoundedPoints, ()),
+        ("quadraticCurves", simplify.filterQuadraticCurves, (simplify.defaultQuadraticTolerance,))
+    ]
+
+def benchmarkFilters(outlineCorpus, repeat=defaultRepeat):
+    results = {}
+    for filterName, function, arguments in getFilters():
+        for glyphName, recording in sorted(outlineCorpus.items()):
+            contours = tracerCorpus.splitContours(recording)
+            output = []
+
+            def run():
+                output.clear()
+                for contour in contours:
+                    output.extend(function(contour, *arguments))
+
+            result = summarizeDurations(timeFunction(run, repeat))
+            result["pointsIn"] = countRecordingPoints(recording)
+            result["pointsOut"] = countRecordingPoints(output)
+            results[f"filter.{filterName}.{glyphName}"] = result
+    return results
+
+def benchmarkSimplifyPen(outlineCorpus, simplifySettings=None, repeat=defaultRepeat):
+    if simplifySettings is None:
+        simplifySettings = {}
+    results = {}
+    for glyphName, recording in sorted(outlineCorpus.items()):
+        output = RecordingPen()
+
+        def run():
+            output.value = []
+            pen = simplify.SimplifyContoursPen(output, **simplifySettings)
+            replayRecording(recording, pen)
+
+        result = summarizeDurations(timeFunction(run, repeat))
+        result["pointsIn"] = countRecordingPoints(recording)
+        result["pointsOut"] = countRecordingPoints(output.value)
+        results[f"simplify.SimplifyContoursPen.{glyphName}"] = result
+    return results
+
+def benchmarkPortableTrace(bitmapCorpus, repeat=defaultTraceRepeat):
+    try:
+        from . import portable
+    except ImportError:
+        return {}
+    results = {}
+    for (glyphName, resolution), bitmap in sorted(bitmapCorpus.items()):
+        output = RecordingPointPen()
+
+        def run():
+            output.value = []
+            portable.traceBitmap(bitmap, output, turdSize=2, tolerance=0.2)
+
+        result = summarizeDurations(timeFunction(run, repeat))
+        result["pixels"] = int(bitmap.size)
+        result["pointsOut"] = sum(1 for item in output.value if item[0] == "addPoint")
+        results[f"trace.portable.{glyphName}@{resolution}"] = result
+    return results
+
+_importScript = """
+import sys
+import time
+start = time.perf_counter()
+import tracer
+duration = time.perf_counter() - start
+heavy = [name for name in sys.argv[1:] if name in sys.modules]
+print(duration, " ".join(heavy))
+"""
+
+def benchmarkImport(repeat=defaultRepeat):
+    """
+    Time "import tracer" in a fresh interpreter and
+    list the heavy modules that it imported. Anything
+    listed is a regression.
+    """
+    packageDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(
+        [packageDirectory] + [path for path in environment.get("PYTHONPATH", "").split(os.pathsep) if path]
+    )
+    durations = []
+    heavy = set()
+    for i in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _importScript, *heavyModules],
+            env=environment,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.split()
+        durations.append(float(output[0]))
+        heavy.update(output[1:])
+    result = summarizeDurations(durations)
+    result["heavyModules"] = sorted(heavy)
+    return {"import.tracer" : result}
+
+# -----------
+# Real Corpus
+# -----------
+
+def loadUFOOutlineCorpus(path, layerName=None):
+    """
+    Load the outlines in a UFO layer as an outline corpus.
+    """
+    from fontTools.ufoLib import UFOReader
+    reader = UFOReader(path, validate=False)
+    glyphSet = reader.getGlyphSet(layerName, validateRead=False)
+    outlineCorpus = {}
+    for glyphName in sorted(glyphSet.keys()):
+        pen = RecordingPen()
+        glyphSet[glyphName].draw(pen)
+        if pen.value:
+            outlineCorpus[glyphName] = pen.value
+    return outlineCorpus
+
+def loadUFOBitmapCorpus(path, threshold=0.5):
+    """
+    Load the images in the default layer of
+    a UFO as a bitmap corpus.
+    """
+    from fontTools.ufoLib import UFOReader
+    from . import bitmap as tracerBitmap
+    reader = UFOReader(path, validate=False)
+    glyphSet = reader.getGlyphSet(validateRead=False)
+    bitmapCorpus = {}
+    for glyphName in sorted(glyphSet.keys()):
+        glyph = types.SimpleNamespace()
+        glyphSet.readGlyph(glyphName, glyph)
+        image = getattr(glyph, "image", None)
+        if not image:
+            continue
+        imageData = reader.readImage(image["fileName"], validate=False)
+        decoded = tracerBitmap.decodeImageData(imageData)
+        bitmap = tracerBitmap.makeBitmap(decoded, threshold=threshold)
+        bitmapCorpus[glyphName, bitmap.shape[0]] = bitmap
+    return bitmapCorpus
+
+# -------
+# Running
+# -------
+
+def runBenchmarks(
+        outlineCorpus=None,
+        bitmapCorpus=None,
+        repeat=defaultRepeat,
+        traceRepeat=defaultTraceRepeat,
+        skipTrace=False
+    ):
+    """
+    Run all of the benchmarks. If no corpora are given,
+    the synthetic corpora are used.
+    """
+    if outlineCorpus is None:
+        outlineCorpus = tracerCorpus.makeOutlineCorpus()
+    results = {}
+    results.update(benchmarkImport(repeat=repeat))
+    results.update(benchmarkFilters(outlineCorpus, repeat=repeat))
+    results.update(benchmarkSimplifyPen(outlineCorpus, repeat=repeat))
+    if not skipTrace:
+        if bitmapCorpus is None:
+            bitmapCorpus = tracerCorpus.makeBitmapCorpus()
+        results.update(benchmarkPortableTrace(bitmapCorpus, repeat=traceRepeat))
+    metadata = dict(
+        tracerVersion=tracerVersion,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        machine=platform.machine(),
+        time=time.strftime("%Y-%m-%dT%H:%M:%S")
+    )
+    return dict(
+        metadata=metadata,
+        results=results
+    )
+
+def compareResults(before, after, threshold=defaultRegressionThreshold):
+    """
+    Compare two sets of results. Returns a list of
+    (name, before median, after median, ratio, regressed)
+    for the benchmarks that are in both sets.
+
+    >>> before = dict(results=dict(a=dict(median=1.0), b=dict(median=1.0)))
+    >>> after = dict(results=dict(a=dict(median=1.05), b=dict(median=1.5)))
+    >>> for name, b, a, ratio, regressed in compareResults(before, after):
+    ...     print(name, ratio, regressed)
+    a 1.05 False
+    b 1.5 True
+    """
+    comparison = []
+    beforeResults = before["results"]
+    afterResults = after["results"]
+    for name in sorted(set(beforeResults) & set(afterResults)):
+        beforeTime = beforeResults[name]["median"]
+        afterTime = afterResults[name]["median"]
+        if beforeTime:
+            ratio = afterTime / beforeTime
+        else:
+            ratio = 1.0
+        regressed = ratio > 1.0 + threshold
+        # importing a heavy module is a regression
+        # no matter how long it took.
+        if afterResults[name].get("heavyModules"):
+            regressed = True
+        comparison.append((name, beforeTime, afterTime, ratio, regressed))
+    return comparison
+
+def formatComparison(comparison):
+    lines = []
+    nameWidth = max([len(item[0]) for item in comparison] + [4])
+    for name, beforeTime, afterTime, ratio, regressed in comparison:
+        flag = "REGRESSED" if regressed else ""
+        lines.append(
+            f"{name.ljust(nameWidth)}  {beforeTime * 1000:10.3f} ms  {afterTime * 1000:10.3f} ms  {ratio:6.2f}x  {flag}"
+        )
+    return "\n".join(lines)
+
+def formatResults(results):
+    lines = []
+    items = results["results"]
+    nameWidth = max([len(name) for name in items] + [4])
+    for name, result in sorted(items.items()):
+        points = ""
+        if "pointsIn" in result:
+            points = f"{result['pointsIn']} -> {result['pointsOut']} points"
+        elif "pointsOut" in result:
+            points = f"{result['pointsOut']} points"
+        elif result.get("heavyModules"):
+            points = "imported " + ", ".join(result["heavyModules"])
+        lines.append(f"{name.ljust(nameWidth)}  {result['median'] * 1000:10.3f} ms  {points}")
+    return "\n".join(lines)
+
+# --------------------
+# Command Line Support
+# --------------------
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="python -m tracer.benchmark",
+        description="Benchmark the trace and simplify code."
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="Write the results as JSON to this path."
+    )
+    parser.add_argument(
+        "-c", "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="Compare two result files instead of running the benchmarks."
+    )
+    parser.add_argument(
+        "-t", "--threshold",
+        type=float,
+        default=defaultRegressionThreshold,
+        help="The allowed slowdown ratio before a benchmark is considered a regression."
+    )
+    parser.add_argument(
+        "-r", "--repeat",
+        type=int,
+        default=defaultRepeat,
+        help="The number of times to run each simplify benchmark."
+    )
+    parser.add_argument(
+        "--trace-repeat",
+        type=int,
+        default=defaultTraceRepeat,
+        help="The number of times to run each trace benchmark."
+    )
+    parser.add_argument(
+        "--skip-trace",
+        action="store_true",
+        help="Don't run the trace benchmarks."
+    )
+    parser.add_argument(
+        "--ufo",
+        help="Use the outlines and images in this UFO instead of the synthetic corpora."
+    )
+    parser.add_argument(
+        "--layer",
+        help="The layer containing the outlines in the UFO. Defaults to the default layer."
+    )
+    args = parser.parse_args(args)
+
+    if args.compare:
+        beforePath, afterPath = args.compare
+        with open(beforePath, "r") as f:
+            before = json.load(f)
+        with open(afterPath, "r") as f:
+            after = json.load(f)
+        comparison = compareResults(before, after, threshold=args.threshold)
+        print(formatComparison(comparison))
+        if any(item[-1] for item in comparison):
+            return 1
+        return 0
+
+    outlineCorpus = None
+    bitmapCorpus = None
+    if args.ufo:
+        outlineCorpus = loadUFOOutlineCorpus(args.ufo, args.layer)
+        if not args.skip_trace:
+            bitmapCorpus = loadUFOBitmapCorpus(args.ufo)
+    results = runBenchmarks(
+        outlineCorpus=outlineCorpus,
+        bitmapCorpus=bitmapCorpus,
+        repeat=args.repeat,
+        traceRepeat=args.trace_repeat,
+        skipTrace=args.skip_trace
+    )
+    print(formatResults(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import io
+import collections
+import threading
+import numpy
+from PIL import Image as PILImage
+from PIL import ImageFilter
+from fontTools.misc.transform import Transform
+from .cache import hashImageData
+
+# decoded images are kept until together
+# they use more than this many bytes.
+maximumDecodedImageBytes = 256 * 1024 * 1024
+
+# --------
+# Decoding
+# --------
+
+def decodeImageData(imageData):
+    """
+    Decode image data to a grayscale PIL image.
+    Transparent areas are composited onto white.
+    """
+    return convertToGrayscale(PILImage.open(io.BytesIO(imageData)))
+
+def convertToGrayscale(image):
+    """
+    Convert a PIL image to grayscale.
+    Transparent areas are composited onto white.
+    """
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = PILImage.new("RGBA", image.size, (255, 255, 255, 255))
+        background.alpha_composite(image)
+        image = background
+    if image.mode != "L":
+        image = image.convert("L")
+    return image
+
+class DecodedImage:
+
+    """
+    A decoded image and the values calculated from it.
+    Values are calculated when they are first requested.
+    """
+
+    def __init__(self, imageData):
+        self.image = decodeImageData(imageData)
+        self.byteCount = self.image.width * self.image.height * len(self.image.getbands())
+        self._automaticThreshold = None
+
+    def getAutomaticThreshold(self):
+        if self._automaticThreshold is None:
+            self._automaticThreshold = calculateAutomaticThreshold(self.image)
+        return self._automaticThreshold
+
+
+# the decoded images are used by the preview and
+# thumbnail threads and the main thread.
+_decodedImages = collections.OrderedDict()
+_decodedImagesLock = threading.Lock()
+
+def getDecodedImage(imageData):
+    """
+    Get a DecodedImage for image data. The most recently
+    used images are kept, up to maximumDecodedImageBytes,
+    so that an image isn't decoded and measured again
+    every time it is traced. The most recent image is
+    always kept.
+
+    >>> def makeImageData(size):
+    ...     stream = io.BytesIO()
+    ...     PILImage.new("L", (size, size)).save(stream, "PNG")
+    ...     return stream.getvalue()
+    >>> small = makeImageData(10)
+    >>> large = makeImageData(20)
+    >>> getDecodedImage(small) is getDecodedImage(small)
+    True
+    >>> isImageDecoded(small)
+    True
+    >>> from tracer import bitmap
+    >>> previous = bitmap.maximumDecodedImageBytes
+    >>> bitmap.maximumDecodedImageBytes = 450
+    >>> decoded = getDecodedImage(large)
+    >>> isImageDecoded(small), isImageDecoded(large)
+    (False, True)
+    >>> bitmap.maximumDecodedImageBytes = previous
+    """
+    key = hashImageData(imageData)
+    with _decodedImagesLock:
+        decoded = _decodedImages.get(key)
+        if decoded is not None:
+            _decodedImages.move_to_end(key)
+            return decoded
+    # the image is decoded outside of the lock so
+    # that other threads aren't kept waiting. if two
+    # threads decode the same image, both get one.
+    decoded = DecodedImage(imageData)
+    with _decodedImagesLock:
+        _decodedImages[key] = decoded
+        _decodedImages.move_to_end(key)
+        byteCount = sum(image.byteCount for image in _decodedImages.values())
+        while len(_decodedImages) > 1 and byteCount > maximumDecodedImageBytes:
+            removedKey, removed = _decodedImages.popitem(last=False)
+            byteCount -= removed.byteCount
+    return decoded
+
+def isImageDecoded(imageData):
+    """
+    Find out if a DecodedImage for image data
+    is being kept by getDecodedImage.
+    """
+    key = hashImageData(imageData)
+    with _decodedImagesLock:
+        return key in _decodedImages
+
+def downsampleImageData(imageData, maximumSize):
+    """
+    Reduce image data so that its longest side is no
+    longer than maximumSize pixels. Returns PNG data
+    and the factor the image was reduced by. If the
+    image is already small enough, the original data
+    and a factor of 1 are returned.
+
+    >>> image = PILImage.new("L", (400, 200), 255)
+    >>> stream = io.BytesIO()
+    >>> image.save(stream, "PNG")
+    >>> data, factor = downsampleImageData(stream.getvalue(), 100)
+    >>> factor
+    4.0
+    >>> decodeImageData(data).size
+    (100, 50)
+    """
+    image = getDecodedImage(imageData).image
+    width, height = image.size
+    longestSide = max(width, height)
+    if longestSide <= maximumSize:
+        return imageData, 1
+    factor = longestSide / maximumSize
+    size = (
+        max(1, round(width / factor)),
+        max(1, round(height / factor))
+    )
+    reduced = image.resize(size, PILImage.BOX)
+    stream = io.BytesIO()
+    reduced.save(stream, "PNG")
+    return stream.getvalue(), width / size[0]
+
+# ---------------
+# Transformations
+# ---------------
+
+def makeTraceTransformation(transformation=None, pixelScale=1, pixelOffset=(0, 0)):
+    """
+    Compose everything that takes traced pixel coordinates
+    to glyph coordinates into one transformation, so that
+    it can be applied while the trace is drawn. pixelOffset
+    is added first, for tracing a cropped part of an image.
+    Then the coordinates are scaled by pixelScale to convert
+    pixels to image units and to undo any resampling. Last,
+    the image transformation, including any skew or rotation,
+    is applied.
+
+    >>> t = makeTraceTransformation((2, 0, 0, 2, 10, 20), pixelScale=0.5, pixelOffset=(4, 0))
+    >>> t.transformPoint((0, 0))
+    (14.0, 20.0)
+    >>> makeTraceTransformation(pixelScale=2).transformPoint((3, 4))
+    (6, 8)
+    """
+    if transformation is None:
+        transformation = Transform()
+    else:
+        transformation = Transform(*transformation)
+    return transformation.scale(pixelScale).translate(*pixelOffset)
+
+# ----------
+# Thresholds
+# ----------
+
+def calculateHistogram(image):
+    """
+    Get the 256 bin histogram of a grayscale image.
+    """
+    pixels = numpy.asarray(image)
+    return numpy.bincount(pixels.ravel(), minlength=256)
+
+def calculateOtsuThreshold(histogram):
+    """
+    Find the threshold, from 0 to 1, that best separates
+    the two classes of pixels in a histogram by maximizing
+    the variance between the classes (Otsu's method).
+
+    >>> histogram = numpy.zeros(256)
+    >>> histogram[20] = 100
+    >>> histogram[220] = 300
+    >>> threshold = calculateOtsuThreshold(histogram)
+    >>> 20 / 255 < threshold <= 220 / 255
+    True
+    """
+    histogram = numpy.asarray(histogram, dtype=numpy.float64)
+    total = histogram.sum()
+    if not total:
+        return 0.5
+    levels = numpy.arange(len(histogram))
+    # weight and mean of the class at or below each level
+    weight = numpy.cumsum(histogram)
+    cumulativeMean = numpy.cumsum(histogram * levels)
+    totalMean = cumulativeMean[-1]
+    backgroundWeight = total - weight
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        variance = (totalMean * weight - total * cumulativeMean) ** 2 / (weight * backgroundWeight)
+    variance[~numpy.isfinite(variance)] = 0
+    if not variance.any():
+        return 0.5
+    # use the middle of a plateau of best levels
+    best = numpy.flatnonzero(variance == variance.max())
+    level = (best[0] + best[-1]) / 2
+    # pixels below the threshold are ink, so the
+    # threshold sits just above the chosen level.
+    return float((level + 1) / (len(histogram) - 1))
+
+def calculateAutomaticThreshold(image):
+    """
+    Calculate a threshold for a grayscale image.
+
+    >>> image = PILImage.new("L", (4, 1))
+    >>> image.putdata([10, 30, 200, 240])
+    >>> threshold = calculateAutomaticThreshold(image)
+    >>> makeBitmap(image, threshold=threshold).tolist()
+    [[True, True, False, False]]
+    """
+    return calculateOtsuThreshold(calculateHistogram(image))
+
+# -------------
+# Preprocessing
+# -------------
+
+def makeBitmap(
+        image,
+        threshold=0.5,
+        blur=0,
+        invert=False
+    ):
+    """
+    Convert a grayscale image to a bitmap.
+    In the bitmap, True indicates ink.
+
+    >>> image = PILImage.new("L", (4, 1))
+    >>> image.putdata([0, 100, 200, 255])
+    >>> makeBitmap(image, threshold=0.5).tolist()
+    [[True, True, False, False]]
+    >>> makeBitmap(image, threshold=0.5, invert=True).tolist()
+    [[False, False, True, True]]
+    """
+    if blur:
+        image = image.filter(ImageFilter.GaussianBlur(radius=blur))
+    pixels = numpy.asarray(image)
+    bitmap = pixels < (threshold * 255)
+    if invert:
+        bitmap = ~bitmap
+    return bitmap
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
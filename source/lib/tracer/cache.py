@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import struct
+import hashlib
+import tempfile
+from .contours import PackedContours
+
+tracerVersion = "2.1"
+cacheFormatVersion = 5
+
+defaultMaximumCacheSize = 256 * 1024 * 1024
+cacheFileExtension = ".trace"
+
+# the trace implementations give different outlines
+# for the same image and settings, so the one used
+# is part of cache keys and fingerprints.
+traceBackendDrawBot = "drawBot"
+traceBackendPortable = "portable"
+
+# ---------
+# Locations
+# ---------
+
+def defaultCacheDirectory():
+    """
+    The per user cache directory.
+    """
+    if sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+        return os.path.join(base, "com.typesupply.Tracer")
+    base = os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.expanduser("~/.cache")
+    return os.path.join(base, "tracer")
+
+def fontCacheDirectory(fontPath):
+    """
+    A cache directory located next to a font.
+
+    >>> fontCacheDirectory("/fonts/MyFont-Regular.ufo")
+    '/fonts/MyFont-Regular.tracercache'
+    """
+    base = os.path.splitext(os.path.normpath(fontPath))[0]
+    return base + ".tracercache"
+
+# -------
+# Hashing
+# -------
+
+def hashImageData(imageData):
+    return hashlib.sha256(imageData).hexdigest()
+
+def _normalizeSettingValue(value):
+    if isinstance(value, (bool, int, float)):
+        return float(value)
+    return value
+
+def normalizeSettings(settings):
+    """
+    Normalize a settings dict so that values read from
+    the UI and values read from a settings file hash
+    to the same thing.
+
+    >>> normalizeSettings(dict(blur=1, invert=True, threshold=0.5))
+    {'blur': 1.0, 'invert': 1.0, 'threshold': 0.5}
+    """
+    if settings is None:
+        return None
+    return {
+        key : _normalizeSettingValue(value)
+        for key, value in sorted(settings.items())
+    }
+
+def hashSettings(*settings):
+    """
+    >>> a = hashSettings(dict(blur=1, invert=False), None)
+    >>> b = hashSettings(dict(invert=0, blur=1.0), None)
+    >>> a == b
+    True
+    >>> a == hashSettings(dict(blur=2, invert=False), None)
+    False
+    """
+    data = [normalizeSettings(s) for s in settings]
+    text = json.dumps(data, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def makeCacheKey(
+        imageData,
+        traceSettings,
+        simplifySettings=None,
+        imageTransformation=None,
+        backend=traceBackendDrawBot
+    ):
+    """
+    Make a key for a trace result. The key covers the
+    image, the trace settings, the simplify settings
+    (None if the result is not simplified), the image
+    transformation, the trace backend and the tracer
+    version.
+
+    >>> a = makeCacheKey(b"image", dict(blur=1))
+    >>> a == makeCacheKey(b"image", dict(blur=1), backend=traceBackendDrawBot)
+    True
+    >>> a == makeCacheKey(b"image", dict(blur=1), backend=traceBackendPortable)
+    False
+    """
+    if imageTransformation is not None:
+        imageTransformation = [float(v) for v in imageTransformation]
+    parts = [
+        tracerVersion,
+        str(cacheFormatVersion),
+        hashImageData(imageData),
+        hashSettings(traceSettings, simplifySettings),
+        json.dumps(imageTransformation),
+        backend
+    ]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+# -----
+# Cache
+# -----
+
+class TraceCache:
+
+    """
+    A content addressed on-disk store of trace results.
+
+    - directory: str
+      The directory to store the data in.
+    - maximumSize: int
+      The maximum number of bytes the cache may use.
+      When exceeded, the least recently used entries
+      are removed.
+
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> cache = TraceCache(directory.name)
+    >>> contours = PackedContours.fromRecording([
+    ...     ("moveTo", ((0, 0),)),
+    ...     ("lineTo", ((10.5, 0),)),
+    ...     ("lineTo", ((0, 10),)),
+    ...     ("closePath", ())
+    ... ])
+    >>> cache.set("abc", contours)
+    >>> cache.get("abc") == contours, cache.get("def")
+    (True, None)
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    The tuned settings a result was simplified with
+    can be stored with it.
+
+    >>> cache.set("abc", contours, tunedSettings=dict(spikeTolerance=5))
+    >>> storedContours, tunedSettings = cache.getWithTunedSettings("abc")
+    >>> storedContours == contours, tunedSettings
+    (True, {'spikeTolerance': 5})
+    >>> cache.set("abc", contours)
+    >>> cache.getWithTunedSettings("abc")[1] is None
+    True
+    >>> directory.cleanup()
+    """
+
+    def __init__(self, directory=None, maximumSize=defaultMaximumCacheSize):
+        if directory is None:
+            directory = defaultCacheDirectory()
+        self.directory = directory
+        self.maximumSize = maximumSize
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    def _pathForKey(self, key):
+        return os.path.join(self.directory, key[:2], key + cacheFileExtension)
+
+    def _iterateEntries(self):
+        if not os.path.exists(self.directory):
+            return
+        for root, directories, fileNames in os.walk(self.directory):
+            for fileName in fileNames:
+                if not fileName.endswith(cacheFileExtension):
+                    continue
+                path = os.path.join(root, fileName)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat
+
+    def getSize(self):
+        if self._size is None:
+            self._size = sum(stat.st_size for path, stat in self._iterateEntries())
+        return self._size
+
+    def get(self, key):
+        """
+        Get the PackedContours stored for key. None is
+        returned if nothing is stored for key.
+        """
+        entry = self.getWithTunedSettings(key)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def getWithTunedSettings(self, key):
+        """
+        Get the PackedContours and the tuned settings
+        (None if they weren't given) stored for key.
+        None is returned if nothing is stored for key.
+        """
+        path = self._pathForKey(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # the entry starts with the length of the
+            # tuned settings, stored as JSON.
+            (settingsLength,) = struct.unpack_from("<I", data)
+            offset = 4 + settingsLength
+            tunedSettings = json.loads(data[4:offset])
+            contours = PackedContours.fromBytes(memoryview(data)[offset:])
+        except (OSError, ValueError, struct.error):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return contours, tunedSettings
+
+    def set(self, key, contours, tunedSettings=None):
+        """
+        Store PackedContours for key and the tuned
+        settings they were simplified with, if any.
+        """
+        settingsData = json.dumps(tunedSettings).encode("utf-8")
+        data = struct.pack("<I", len(settingsData)) + settingsData + contours.toBytes()
+        path = self._pathForKey(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        previousSize = 0
+        if os.path.exists(path):
+            previousSize = os.path.getsize(path)
+        fd, tempPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tempPath, path)
+        except OSError:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+        self._size = self.getSize() - previousSize + len(data)
+        if self._size > self.maximumSize:
+            self.evict()
+
+    def evict(self, targetSize=None):
+        """
+        Remove the least recently used entries until the
+        cache is smaller than targetSize. If targetSize
+        is None, 90% of the maximum size will be used.
+        """
+        if targetSize is None:
+            targetSize = int(self.maximumSize * 0.9)
+        entries = sorted(
+            self._iterateEntries(),
+            key=lambda entry: entry[1].st_mtime
+        )
+        size = sum(stat.st_size for path, stat in entries)
+        for path, stat in entries:
+            if size <= targetSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= stat.st_size
+        self._size = size
+
+    def clear(self):
+        self.evict(targetSize=0)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
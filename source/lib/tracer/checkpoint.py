@@ -0,0 +1,184 @@
+"""
+Checkpoints for batch runs.
+
+A checkpoint records the names and the image hashes of
+the glyphs that a batch run has finished along with a hash
+of the settings and the glyph names it was run with. When
+a run with the same settings and glyphs is started after
+an earlier run was cancelled or interrupted, the glyphs in
+the checkpoint are skipped if their images haven't changed.
+
+The command line tracer writes its checkpoint to a file
+in the UFO's data directory. A line is appended after
+each glyph is written, so the file is current even if
+the process is killed. The Tracer window stores its
+checkpoint in the font lib, so that it is saved together
+with the traced glyphs.
+"""
+
+import os
+import json
+import hashlib
+from .cache import hashSettings
+
+checkpointLibKey = "com.typesupply.tracer.checkpoint"
+checkpointFileName = "com.typesupply.tracer.checkpoint.txt"
+
+def makeCheckpointHash(traceSettings, simplifySettings, layerName, glyphNames=()):
+    """
+    Hash the settings and the glyph names that a
+    batch run depends on.
+
+    >>> a = makeCheckpointHash(dict(blur=1), dict(spikeTolerance=10), "traced", ["A", "B"])
+    >>> b = makeCheckpointHash(dict(blur=1), dict(spikeTolerance=10), "other", ["A", "B"])
+    >>> c = makeCheckpointHash(dict(blur=1), dict(spikeTolerance=10), "traced", ["A"])
+    >>> a == b or a == c
+    False
+    >>> a == makeCheckpointHash(dict(blur=1), dict(spikeTolerance=10), "traced", ["B", "A"])
+    True
+    """
+    glyphsHash = hashlib.sha256("\n".join(sorted(glyphNames)).encode("utf-8")).hexdigest()
+    return hashSettings(traceSettings, simplifySettings, dict(layer=layerName, glyphs=glyphsHash))
+
+def isCompleted(completed, glyphName, imageHash):
+    """
+    Find out if a glyph in a checkpoint can be skipped.
+    completed is a dict of glyph names and image hashes.
+
+    >>> isCompleted(dict(A="abc"), "A", "abc")
+    True
+    >>> isCompleted(dict(A="abc"), "A", "xyz")
+    False
+    >>> isCompleted(dict(A="abc"), "B", "abc")
+    False
+    """
+    return glyphName in completed and completed[glyphName] == imageHash
+
+# -----------------
+# Command Line Runs
+# -----------------
+
+def getCheckpointPath(ufoPath):
+    return os.path.join(ufoPath, "data", checkpointFileName)
+
+def readCheckpointFile(path, checkpointHash):
+    """
+    Read the glyph names and image hashes in a checkpoint
+    file. If the file doesn't exist or was written with
+    different settings, an empty dict is returned.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    if not lines:
+        return {}
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        return {}
+    if header.get("settings") != checkpointHash:
+        return {}
+    completed = {}
+    for line in lines[1:]:
+        # a line cut off by a crash is ignored
+        try:
+            glyphName, imageHash = json.loads(line)
+        except ValueError:
+            continue
+        completed[glyphName] = imageHash
+    return completed
+
+def removeCheckpointFile(path):
+    if os.path.exists(path):
+        os.remove(path)
+    # don't leave an empty data directory behind
+    directory = os.path.dirname(path)
+    if os.path.isdir(directory) and not os.listdir(directory):
+        os.rmdir(directory)
+
+
+class CheckpointWriter:
+
+    """
+    Append the names and image hashes of finished glyphs
+    to a checkpoint file. If resume is False or the file
+    was written with different settings, the file is
+    started again.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "data", checkpointFileName)
+    >>> with CheckpointWriter(path, "abc") as writer:
+    ...     writer.add("A", "1")
+    ...     writer.add("B", "2")
+    >>> sorted(readCheckpointFile(path, "abc").items())
+    [('A', '1'), ('B', '2')]
+    >>> with CheckpointWriter(path, "abc", resume=True) as writer:
+    ...     writer.add("C", "3")
+    >>> sorted(readCheckpointFile(path, "abc"))
+    ['A', 'B', 'C']
+    >>> readCheckpointFile(path, "xyz")
+    {}
+    """
+
+    def __init__(self, path, checkpointHash, resume=False):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume and readCheckpointFile(path, checkpointHash):
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._file.write(json.dumps(dict(settings=checkpointHash)) + "\n")
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, glyphName, imageHash):
+        self._file.write(json.dumps([glyphName, imageHash]) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+# --------
+# Font Lib
+# --------
+
+def readCheckpointLib(lib, checkpointHash):
+    """
+    Read the glyph names and image hashes in a
+    checkpoint stored in a lib.
+
+    >>> lib = {}
+    >>> writeCheckpointLib(lib, "abc", dict(A="1", B="2"))
+    >>> sorted(readCheckpointLib(lib, "abc").items())
+    [('A', '1'), ('B', '2')]
+    >>> readCheckpointLib(lib, "xyz")
+    {}
+    """
+    stored = lib.get(checkpointLibKey)
+    if not stored or stored.get("settings") != checkpointHash:
+        return {}
+    completed = stored.get("completed")
+    if not isinstance(completed, dict):
+        return {}
+    return dict(completed)
+
+def writeCheckpointLib(lib, checkpointHash, completed):
+    lib[checkpointLibKey] = dict(
+        settings=checkpointHash,
+        completed=dict(completed)
+    )
+
+def removeCheckpointLib(lib):
+    if checkpointLibKey in lib:
+        del lib[checkpointLibKey]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
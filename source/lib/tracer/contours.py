@@ -0,0 +1,312 @@
+"""
+A compact format for outlines.
+
+Traced outlines move between the trace, the simplify
+filters, the trace cache and worker processes. As
+RecordingPen values they are lists of tuples, which
+take a lot of memory and are slow to pickle. Here
+they are stored in a few numpy arrays:
+
+- coordinates: the points, float64, or int32 if
+  every coordinate is an integer.
+- pointTypes: a byte for the segment type of each
+  point. Off curve points are 0.
+- contourOffsets: the index of the first point of
+  each contour, followed by the number of points.
+- closed: a byte for each contour, 1 if it is closed.
+
+The first point of each contour is its moveTo point.
+Packed data can be read without copying the arrays.
+"""
+
+import struct
+import numpy
+from fontTools.pens.basePen import AbstractPen
+from fontTools.pens.pointPen import SegmentToPointPen, PointToSegmentPen
+
+_magic = b"TRC2"
+_headerFormat = "<4sIII"
+_headerSize = struct.calcsize(_headerFormat)
+
+offCurveType = 0
+moveType = 1
+lineType = 2
+curveType = 3
+qCurveType = 4
+
+_operatorTypes = {
+    "moveTo" : moveType,
+    "lineTo" : lineType,
+    "curveTo" : curveType,
+    "qCurveTo" : qCurveType
+}
+_typeOperators = {pointType : operator for operator, pointType in _operatorTypes.items()}
+
+# float32 is only read, for data packed by
+# earlier versions.
+_coordinateTypes = [numpy.float32, numpy.int32, numpy.float64]
+
+
+class PackedContours:
+
+    """
+    Outlines stored in numpy arrays.
+
+    >>> recording = [
+    ...     ("moveTo", ((0, 0),)),
+    ...     ("lineTo", ((10, 0),)),
+    ...     ("curveTo", ((10, 5), (5, 10), (0, 10))),
+    ...     ("closePath", ()),
+    ...     ("moveTo", ((20, 0),)),
+    ...     ("qCurveTo", ((25, 5), (30, 0))),
+    ...     ("endPath", ())
+    ... ]
+    >>> contours = PackedContours.fromRecording(recording)
+    >>> len(contours), contours.getPointCount(), contours.coordinates.dtype.name
+    (2, 8, 'int32')
+    >>> contours.toRecording() == recording
+    True
+    >>> PackedContours.fromBytes(contours.toBytes()) == contours
+    True
+    """
+
+    def __init__(self, coordinates=None, pointTypes=None, contourOffsets=None, closed=None):
+        if coordinates is None:
+            coordinates = numpy.zeros((0, 2), dtype=numpy.int32)
+            pointTypes = numpy.zeros(0, dtype=numpy.uint8)
+            contourOffsets = numpy.zeros(1, dtype=numpy.int32)
+            closed = numpy.zeros(0, dtype=numpy.uint8)
+        self.coordinates = coordinates
+        self.pointTypes = pointTypes
+        self.contourOffsets = contourOffsets
+        self.closed = closed
+
+    def __len__(self):
+        return len(self.closed)
+
+    def __repr__(self):
+        return f"<PackedContours {len(self)} contours {self.getPointCount()} points>"
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedContours):
+            return NotImplemented
+        return (
+            numpy.array_equal(self.coordinates, other.coordinates)
+            and numpy.array_equal(self.pointTypes, other.pointTypes)
+            and numpy.array_equal(self.contourOffsets, other.contourOffsets)
+            and numpy.array_equal(self.closed, other.closed)
+        )
+
+    def __reduce__(self):
+        # pickle as one block of bytes
+        return (self.__class__.fromBytes, (self.toBytes(),))
+
+    def getPointCount(self):
+        return len(self.pointTypes)
+
+    # -------
+    # Reading
+    # -------
+
+    def iterateContours(self):
+        """
+        Yield each contour as a list of (operator, operands)
+        in the form that SimplifyContoursPen filters take.
+        """
+        coordinates = self.coordinates.tolist()
+        if self.coordinates.dtype.kind == "f":
+            # give integers as integers, as
+            # the pen that packed them did.
+            coordinates = [
+                [int(value) if value.is_integer() else value for value in point]
+                for point in coordinates
+            ]
+        pointTypes = self.pointTypes.tolist()
+        offsets = self.contourOffsets.tolist()
+        for contourIndex, isClosed in enumerate(self.closed.tolist()):
+            contour = []
+            offCurves = []
+            for index in range(offsets[contourIndex], offsets[contourIndex + 1]):
+                point = tuple(coordinates[index])
+                pointType = pointTypes[index]
+                if pointType == offCurveType:
+                    offCurves.append(point)
+                    continue
+                offCurves.append(point)
+                contour.append((_typeOperators[pointType], tuple(offCurves)))
+                offCurves = []
+            contour.append(("closePath" if isClosed else "endPath", ()))
+            yield contour
+
+    def toRecording(self):
+        """
+        Get the outlines as a RecordingPen value.
+        """
+        recording = []
+        for contour in self.iterateContours():
+            recording.extend(contour)
+        return recording
+
+    def draw(self, pen):
+        for contour in self.iterateContours():
+            for operator, operands in contour:
+                getattr(pen, operator)(*operands)
+
+    def drawPoints(self, pointPen):
+        self.draw(SegmentToPointPen(pointPen))
+
+    # -------
+    # Packing
+    # -------
+
+    def toBytes(self):
+        coordinateType = _coordinateTypes.index(self.coordinates.dtype.type)
+        header = struct.pack(
+            _headerFormat,
+            _magic,
+            coordinateType,
+            self.getPointCount(),
+            len(self)
+        )
+        # the four byte arrays come first so that
+        # every array is aligned when it is read.
+        return b"".join((
+            header,
+            numpy.ascontiguousarray(self.coordinates, dtype=self.coordinates.dtype.newbyteorder("<")).tobytes(),
+            numpy.ascontiguousarray(self.contourOffsets, dtype="<i4").tobytes(),
+            numpy.ascontiguousarray(self.pointTypes, dtype=numpy.uint8).tobytes(),
+            numpy.ascontiguousarray(self.closed, dtype=numpy.uint8).tobytes()
+        ))
+
+    @classmethod
+    def fromBytes(cls, data):
+        """
+        Read packed data. The arrays are read only
+        views of data, so nothing is copied.
+        """
+        try:
+            magic, coordinateType, pointCount, contourCount = struct.unpack_from(_headerFormat, data)
+        except struct.error:
+            raise ValueError("Unknown contour data.")
+        if magic != _magic or coordinateType >= len(_coordinateTypes):
+            raise ValueError("Unknown contour data.")
+        offset = _headerSize
+        arrays = []
+        for dtype, count in (
+                (numpy.dtype(_coordinateTypes[coordinateType]).newbyteorder("<"), pointCount * 2),
+                (numpy.dtype("<i4"), contourCount + 1),
+                (numpy.dtype(numpy.uint8), pointCount),
+                (numpy.dtype(numpy.uint8), contourCount)
+            ):
+            if offset + count * dtype.itemsize > len(data):
+                raise ValueError("Incomplete contour data.")
+            arrays.append(numpy.frombuffer(data, dtype=dtype, count=count, offset=offset))
+            offset += count * dtype.itemsize
+        coordinates, contourOffsets, pointTypes, closed = arrays
+        return cls(coordinates.reshape(pointCount, 2), pointTypes, contourOffsets, closed)
+
+    @classmethod
+    def fromRecording(cls, recording):
+        """
+        Pack a RecordingPen value.
+        """
+        pen = PackedContoursPen()
+        for operator, operands in recording:
+            getattr(pen, operator)(*operands)
+        return pen.getContours()
+
+
+class PackedContoursPen(AbstractPen):
+
+    """
+    A segment pen that packs what is drawn into it.
+    Use getContours to get the PackedContours. Implied
+    on curve points can't be packed and components are
+    ignored.
+
+    >>> pen = PackedContoursPen()
+    >>> pen.moveTo((0, 0))
+    >>> pen.lineTo((10.5, 0))
+    >>> pen.lineTo((0, 10))
+    >>> pen.closePath()
+    >>> contours = pen.getContours()
+    >>> contours.coordinates.dtype.name, contours.pointTypes.tolist(), contours.closed.tolist()
+    ('float64', [1, 2, 2], [1])
+    >>> contours.toRecording()[1]
+    ('lineTo', ((10.5, 0),))
+    """
+
+    def __init__(self):
+        self._coordinates = []
+        self._pointTypes = []
+        self._contourOffsets = [0]
+        self._closed = []
+
+    def _addSegment(self, pointType, points):
+        for point in points[:-1]:
+            if point is None:
+                raise ValueError("Implied on curve points can't be packed.")
+            self._coordinates.extend(point)
+            self._pointTypes.append(offCurveType)
+        if points[-1] is None:
+            raise ValueError("Implied on curve points can't be packed.")
+        self._coordinates.extend(points[-1])
+        self._pointTypes.append(pointType)
+
+    def moveTo(self, pt):
+        self._addSegment(moveType, (pt,))
+
+    def lineTo(self, pt):
+        self._addSegment(lineType, (pt,))
+
+    def curveTo(self, *points):
+        self._addSegment(curveType, points)
+
+    def qCurveTo(self, *points):
+        self._addSegment(qCurveType, points)
+
+    def closePath(self):
+        self._endContour(True)
+
+    def endPath(self):
+        self._endContour(False)
+
+    def _endContour(self, isClosed):
+        self._contourOffsets.append(len(self._pointTypes))
+        self._closed.append(isClosed)
+
+    def addComponent(self, glyphName, transformation):
+        pass
+
+    def getContours(self):
+        coordinates = numpy.array(self._coordinates, dtype=numpy.float64).reshape(-1, 2)
+        isInteger = (
+            numpy.array_equal(coordinates, numpy.round(coordinates))
+            and (not len(coordinates) or numpy.abs(coordinates).max() < 2 ** 31)
+        )
+        coordinateType = numpy.int32 if isInteger else numpy.float64
+        return PackedContours(
+            coordinates.astype(coordinateType),
+            numpy.array(self._pointTypes, dtype=numpy.uint8),
+            numpy.array(self._contourOffsets, dtype=numpy.int32),
+            numpy.array(self._closed, dtype=numpy.uint8)
+        )
+
+
+class PackedContoursPointPen(PointToSegmentPen):
+
+    """
+    A point pen that packs what is drawn into it.
+    Use getContours to get the PackedContours.
+    """
+
+    def __init__(self):
+        super().__init__(PackedContoursPen())
+
+    def getContours(self):
+        return self.pen.getContours()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
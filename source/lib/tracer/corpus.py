@@ -0,0 +1,248 @@
+"""
+Synthetic glyph corpora for benchmarking and measurement.
+
+The outline corpora imitate the output of an autotracer:
+long runs of short, slightly noisy line segments mixed
+with tiny curves and the occasional spike. The bitmap
+corpora imitate scans of the same shapes, with speckles,
+at several resolutions.
+"""
+
+import math
+import random
+import numpy
+from PIL import Image as PILImage
+from PIL import ImageDraw
+
+defaultSeed = 1
+defaultResolutions = (128, 256, 512)
+
+# ------
+# Shapes
+# ------
+
+def makeEllipse(cx, cy, rx, ry, pointCount=64, clockwise=False):
+    points = []
+    for i in range(pointCount):
+        angle = 2 * math.pi * i / pointCount
+        if clockwise:
+            angle = -angle
+        points.append((cx + rx * math.cos(angle), cy + ry * math.sin(angle)))
+    return points
+
+def makeSerifLetterforms():
+    """
+    Get a dict of simple serif letterforms. Each letterform
+    is a list of polygons. Outer polygons are counter-clockwise
+    and inner polygons are clockwise.
+
+    >>> sorted(makeSerifLetterforms().keys())
+    ['H', 'I', 'O']
+    """
+    serif = 40
+    stem = 90
+    # I
+    I = [
+        (150, 0), (450, 0), (450, 30), (300 + stem / 2 + serif, 40),
+        (300 + stem / 2, 60), (300 + stem / 2, 640), (300 + stem / 2 + serif, 660),
+        (450, 670), (450, 700), (150, 700), (150, 670),
+        (300 - stem / 2 - serif, 660), (300 - stem / 2, 640), (300 - stem / 2, 60),
+        (300 - stem / 2 - serif, 40), (150, 30)
+    ]
+    # H
+    H = [
+        (40, 0), (280, 0), (280, 30), (190, 45), (190, 320), (530, 320),
+        (530, 45), (440, 30), (440, 0), (680, 0), (680, 30), (620, 45),
+        (620, 655), (680, 670), (680, 700), (440, 700), (440, 670),
+        (530, 655), (530, 400), (190, 400), (190, 655), (280, 670),
+        (280, 700), (40, 700), (40, 670), (100, 655), (100, 45), (40, 30)
+    ]
+    # O
+    O = [
+        makeEllipse(360, 350, 320, 360, pointCount=96),
+        makeEllipse(360, 350, 200, 290, pointCount=96, clockwise=True)
+    ]
+    return dict(
+        I=[I],
+        H=[H],
+        O=O
+    )
+
+# ---------------
+# Trace Imitation
+# ---------------
+
+def _densify(polygon, segmentLength):
+    points = []
+    count = len(polygon)
+    for i in range(count):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % count]
+        length = math.hypot(x2 - x1, y2 - y1)
+        steps = max(1, int(length / segmentLength))
+        for step in range(steps):
+            t = step / steps
+            points.append((x1 + (x2 - x1) * t, y1 + (y2 - y1) * t))
+    return points
+
+def polygonToTracedContour(
+        polygon,
+        randomGenerator,
+        segmentLength=3,
+        noise=0.5,
+        spikeProbability=0.01,
+        curveProbability=0.05
+    ):
+    """
+    Convert a polygon to a RecordingPen contour that
+    looks like it came from an autotracer.
+    """
+    points = _densify(polygon, segmentLength)
+    contour = []
+    for i, (x, y) in enumerate(points):
+        x += randomGenerator.gauss(0, noise)
+        y += randomGenerator.gauss(0, noise)
+        point = (x, y)
+        if i == 0:
+            contour.append(("moveTo", (point,)))
+            continue
+        roll = randomGenerator.random()
+        if roll < spikeProbability:
+            spike = (x + randomGenerator.uniform(-15, 15), y + randomGenerator.uniform(-15, 15))
+            contour.append(("lineTo", (spike,)))
+            contour.append(("lineTo", (point,)))
+        elif roll < spikeProbability + curveProbability:
+            px, py = contour[-1][1][-1]
+            h1 = (px + (x - px) / 3 + randomGenerator.gauss(0, noise), py + (y - py) / 3 + randomGenerator.gauss(0, noise))
+            h2 = (px + (x - px) * 2 / 3 + randomGenerator.gauss(0, noise), py + (y - py) * 2 / 3 + randomGenerator.gauss(0, noise))
+            contour.append(("curveTo", (h1, h2, point)))
+        else:
+            contour.append(("lineTo", (point,)))
+    contour.append(("closePath", ()))
+    return contour
+
+def makeSpeckleContours(randomGenerator, count, bounds=(0, 0, 700, 700)):
+    xMin, yMin, xMax, yMax = bounds
+    contours = []
+    for i in range(count):
+        cx = randomGenerator.uniform(xMin, xMax)
+        cy = randomGenerator.uniform(yMin, yMax)
+        r = randomGenerator.uniform(1, 6)
+        polygon = makeEllipse(cx, cy, r, r, pointCount=8)
+        contours.append(polygonToTracedContour(polygon, randomGenerator, segmentLength=1, noise=0.2))
+    return contours
+
+# -------
+# Corpora
+# -------
+
+def makeOutlineCorpus(seed=defaultSeed, noise=0.5, speckles=20):
+    """
+    Make a dict of glyph name : RecordingPen value pairs.
+
+    >>> corpus = makeOutlineCorpus()
+    >>> sorted(corpus.keys())
+    ['H', 'I', 'O', 'circle-large', 'circle-small', 'speckled-H']
+    >>> corpus == makeOutlineCorpus()
+    True
+    """
+    randomGenerator = random.Random(seed)
+    corpus = {}
+    circles = [
+        ("circle-small", makeEllipse(100, 100, 50, 50, pointCount=32)),
+        ("circle-large", makeEllipse(400, 400, 350, 350, pointCount=256))
+    ]
+    for name, polygon in circles:
+        corpus[name] = polygonToTracedContour(polygon, randomGenerator, noise=noise)
+    letterforms = makeSerifLetterforms()
+    for name, polygons in sorted(letterforms.items()):
+        recording = []
+        for polygon in polygons:
+            recording += polygonToTracedContour(polygon, randomGenerator, noise=noise)
+        corpus[name] = recording
+    recording = list(corpus["H"])
+    for contour in makeSpeckleContours(randomGenerator, speckles):
+        recording += contour
+    corpus["speckled-H"] = recording
+    return corpus
+
+def renderPolygons(polygons, resolution, speckles=0, seed=defaultSeed, unitsPerEm=1000):
+    """
+    Render polygons in font units to a bitmap that
+    is resolution pixels tall. True indicates ink.
+
+    >>> letterforms = makeSerifLetterforms()
+    >>> bitmap = renderPolygons(letterforms["O"], 100)
+    >>> bitmap.shape
+    (100, 100)
+    >>> bool(bitmap[50, 36]), bool(bitmap[50, 10])
+    (False, True)
+    """
+    scale = resolution / unitsPerEm
+    image = PILImage.new("1", (resolution, resolution), 0)
+    draw = ImageDraw.Draw(image)
+    for polygon in polygons:
+        area = 0
+        for i in range(len(polygon)):
+            x1, y1 = polygon[i - 1]
+            x2, y2 = polygon[i]
+            area += x1 * y2 - x2 * y1
+        fill = 1 if area > 0 else 0
+        points = [(x * scale, resolution - y * scale) for x, y in polygon]
+        draw.polygon(points, fill=fill)
+    if speckles:
+        randomGenerator = random.Random(seed)
+        for i in range(speckles):
+            x = randomGenerator.uniform(0, resolution)
+            y = randomGenerator.uniform(0, resolution)
+            r = randomGenerator.uniform(0.5, 2) * resolution / 256
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=randomGenerator.choice((0, 1)))
+    return numpy.array(image, dtype=bool)
+
+def makeBitmapCorpus(resolutions=defaultResolutions, seed=defaultSeed, speckles=40):
+    """
+    Make a dict of (glyph name, resolution) : bitmap pairs.
+
+    >>> corpus = makeBitmapCorpus(resolutions=(64,))
+    >>> sorted(corpus.keys())
+    [('H', 64), ('I', 64), ('O', 64), ('speckled-H', 64)]
+    """
+    corpus = {}
+    letterforms = makeSerifLetterforms()
+    for resolution in resolutions:
+        for name, polygons in sorted(letterforms.items()):
+            corpus[name, resolution] = renderPolygons(polygons, resolution)
+        corpus["speckled-H", resolution] = renderPolygons(
+            letterforms["H"],
+            resolution,
+            speckles=speckles,
+            seed=seed
+        )
+    return corpus
+
+def splitContours(recording):
+    """
+    Split a RecordingPen value into a list of contours.
+
+    >>> recording = [
+    ...     ("moveTo", ((0, 0),)), ("lineTo", ((1, 1),)), ("closePath", ()),
+    ...     ("moveTo", ((2, 2),)), ("lineTo", ((3, 3),)), ("endPath", ())
+    ... ]
+    >>> len(splitContours(recording))
+    2
+    """
+    contours = []
+    contour = []
+    for operator, operands in recording:
+        contour.append((operator, operands))
+        if operator in ("closePath", "endPath"):
+            contours.append(contour)
+            contour = []
+    if contour:
+        contours.append(contour)
+    return contours
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
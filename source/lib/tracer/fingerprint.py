@@ -0,0 +1,97 @@
+from .cache import hashImageData, hashSettings, traceBackendDrawBot
+
+fingerprintLibKey = "com.typesupply.tracer.fingerprint"
+
+fingerprintStatusCurrent = "current"
+fingerprintStatusStale = "stale"
+fingerprintStatusUntraced = "untraced"
+
+def makeFingerprint(
+        imageData,
+        traceSettings,
+        simplifySettings,
+        imageTransformation=None,
+        imageHash=None,
+        backend=traceBackendDrawBot
+    ):
+    """
+    Make a fingerprint describing the image, the settings
+    and the trace backend that a traced glyph was made
+    from. If the image hash has already been calculated
+    it can be given as imageHash.
+
+    >>> a = makeFingerprint(b"image", dict(blur=1), dict(spikeTolerance=10))
+    >>> b = makeFingerprint(b"image", dict(blur=1.0), dict(spikeTolerance=10))
+    >>> a == b
+    True
+    >>> sorted(a.keys())
+    ['image', 'settings']
+    >>> a == makeFingerprint(b"other", dict(blur=1), dict(spikeTolerance=10))
+    False
+    >>> a == makeFingerprint(b"image", dict(blur=1), dict(spikeTolerance=10), backend="portable")
+    False
+    """
+    if imageHash is None:
+        imageHash = hashImageData(imageData)
+    if imageTransformation is not None:
+        imageTransformation = {
+            "transformation" : [float(v) for v in imageTransformation]
+        }
+    settingsHash = hashSettings(
+        traceSettings,
+        simplifySettings,
+        imageTransformation,
+        dict(backend=backend)
+    )
+    return dict(
+        image=imageHash,
+        settings=settingsHash
+    )
+
+def readFingerprint(glyph):
+    """
+    Read the fingerprint stored in the glyph's lib.
+    None is returned if the glyph doesn't have one.
+    """
+    fingerprint = glyph.lib.get(fingerprintLibKey)
+    if fingerprint is None:
+        return None
+    return dict(fingerprint)
+
+def writeFingerprint(glyph, fingerprint):
+    glyph.lib[fingerprintLibKey] = dict(fingerprint)
+
+def getFingerprintStatus(glyph, fingerprint):
+    """
+    Compare the fingerprint in the glyph's lib with
+    the given fingerprint.
+
+    >>> class Glyph:
+    ...     def __init__(self):
+    ...         self.lib = {}
+    >>> fingerprint = makeFingerprint(b"image", dict(blur=1), dict())
+    >>> glyph = Glyph()
+    >>> getFingerprintStatus(None, fingerprint)
+    'untraced'
+    >>> getFingerprintStatus(glyph, fingerprint)
+    'untraced'
+    >>> writeFingerprint(glyph, fingerprint)
+    >>> getFingerprintStatus(glyph, fingerprint)
+    'current'
+    >>> fingerprint = makeFingerprint(b"image", dict(blur=2), dict())
+    >>> getFingerprintStatus(glyph, fingerprint)
+    'stale'
+    """
+    if glyph is None:
+        return fingerprintStatusUntraced
+    existing = readFingerprint(glyph)
+    if existing is None:
+        return fingerprintStatusUntraced
+    if existing == fingerprint:
+        return fingerprintStatusCurrent
+    return fingerprintStatusStale
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
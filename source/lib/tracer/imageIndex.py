@@ -0,0 +1,144 @@
+"""
+Find the glyphs in a UFO layer that have an image without
+loading the glyphs.
+
+Each .glif file is searched for an <image> element. The
+result for each file is stored in an index along with the
+file's modification time and size, so only files that have
+changed since the last search are read again.
+"""
+
+import os
+import re
+import json
+import hashlib
+import tempfile
+from fontTools.ufoLib import UFOReader
+from .cache import defaultCacheDirectory
+
+indexFormatVersion = 1
+
+_imageElementRE = re.compile(rb"<image\b[^>]*\bfileName\s*=")
+
+def _hasImageElement(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return _imageElementRE.search(data) is not None
+
+def defaultIndexPath(layerDirectory):
+    """
+    The location of the index for a layer directory
+    in the per user cache directory.
+    """
+    layerDirectory = os.path.abspath(layerDirectory)
+    name = hashlib.sha256(layerDirectory.encode("utf-8")).hexdigest()
+    return os.path.join(defaultCacheDirectory(), "imageIndex", name + ".json")
+
+def readIndex(path):
+    if path is None or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("formatVersion") != indexFormatVersion:
+        return {}
+    return data.get("files", {})
+
+def writeIndex(path, index):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    data = dict(
+        formatVersion=indexFormatVersion,
+        files=index
+    )
+    fd, tempPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tempPath, path)
+    except BaseException:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+
+def scanLayerDirectory(layerDirectory, contents, index=None):
+    """
+    Find the glyphs that have an image in a layer
+    directory. contents is the glyph name to file name
+    mapping from contents.plist. index is a previous
+    index. Returns a set of glyph names and the updated
+    index.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> contents = {"A" : "A_.glif", "B" : "B_.glif"}
+    >>> with open(os.path.join(directory, "A_.glif"), "w") as f:
+    ...     _ = f.write('<glyph name="A"><image fileName="A.png"/></glyph>')
+    >>> with open(os.path.join(directory, "B_.glif"), "w") as f:
+    ...     _ = f.write('<glyph name="B"><note>image</note></glyph>')
+    >>> names, index = scanLayerDirectory(directory, contents)
+    >>> sorted(names)
+    ['A']
+    >>> sorted(index.keys())
+    ['A_.glif', 'B_.glif']
+    """
+    if index is None:
+        index = {}
+    names = set()
+    newIndex = {}
+    for glyphName, fileName in contents.items():
+        path = os.path.join(layerDirectory, fileName)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature = [stat.st_mtime_ns, stat.st_size]
+        entry = index.get(fileName)
+        if entry is not None and entry[:2] == signature:
+            hasImage = entry[2]
+        else:
+            hasImage = _hasImageElement(path)
+        newIndex[fileName] = signature + [hasImage]
+        if hasImage:
+            names.add(glyphName)
+    return names, newIndex
+
+def findImageGlyphNames(path, layerName=None, indexPath=None, useIndex=True):
+    """
+    Get a set of the names of the glyphs that have an image
+    in a layer of the UFO located at path. If layerName is
+    None, the default layer is used. If indexPath is None,
+    the index is stored in the per user cache directory.
+    """
+    reader = UFOReader(path, validate=False)
+    glyphSet = reader.getGlyphSet(layerName, validateRead=False)
+    layerDirectory = None
+    if os.path.isdir(path):
+        layerDirectory = os.path.join(path, glyphSet.dirName)
+    if layerDirectory is None or not os.path.isdir(layerDirectory):
+        # zipped UFOs can't be indexed
+        names = set()
+        for glyphName in glyphSet.keys():
+            data = glyphSet.getGLIF(glyphName)
+            if _imageElementRE.search(data) is not None:
+                names.add(glyphName)
+        return names
+    index = None
+    if useIndex:
+        if indexPath is None:
+            indexPath = defaultIndexPath(layerDirectory)
+        index = readIndex(indexPath)
+    names, newIndex = scanLayerDirectory(layerDirectory, glyphSet.contents, index)
+    if useIndex and newIndex != index:
+        try:
+            writeIndex(indexPath, newIndex)
+        except OSError:
+            pass
+    return names
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,784 @@
+"""
+Trace images that are too large to decode whole.
+
+Poster size scans can be tens of thousands of pixels on
+each side. Decoding one of these whole, and making the
+blurred copy and the bitmap from it, takes several times
+the size of the image in memory. A large image is instead
+converted to grayscale strip by strip into a memory-mapped
+buffer in a temporary file.
+
+PNG images, which is what UFOs contain, are decompressed
+a strip at a time, so the decoded image is never in memory
+whole. Interlaced PNGs and PNGs with 16 bit color can't be
+read a strip at a time. These, and images in other formats,
+are decoded whole by Pillow before they are converted, so
+memory use for them still grows with the size of the image.
+
+The bitmap is then made one horizontal strip at a time.
+Strips are blurred with enough of the neighbouring rows
+to give the same result as blurring the whole image. The
+ink in each strip is stored as runs, horizontal spans of
+ink pixels, and runs that touch runs in the row above are
+joined into connected shapes. The shapes are traced one
+at a time from a bitmap of their bounding box, so peak
+memory depends on the size of the largest shape rather
+than the size of the image.
+"""
+
+import io
+import os
+import math
+import zlib
+import bisect
+import struct
+import tempfile
+import contextlib
+import threading
+import collections
+import numpy
+from PIL import Image as PILImage
+from . import bitmap as tracerBitmap
+from .cache import hashImageData
+
+# images with more pixels than this are large
+largeImagePixels = 8192 * 8192
+defaultStripHeight = 1024
+maximumThresholds = 32
+# shapes are packed into bitmaps of about this
+# size to be traced together.
+defaultBatchWidth = 4096
+defaultBatchPixels = 4096 * 4096
+
+
+@contextlib.contextmanager
+def _allowLargeImages():
+    # Pillow refuses to open images that are
+    # large enough to be a decompression bomb.
+    maximumPixels = PILImage.MAX_IMAGE_PIXELS
+    PILImage.MAX_IMAGE_PIXELS = None
+    try:
+        yield
+    finally:
+        PILImage.MAX_IMAGE_PIXELS = maximumPixels
+
+def getImageSize(imageData):
+    """
+    Get the pixel size of image data. Only the
+    header of the image is read.
+    """
+    with _allowLargeImages():
+        with PILImage.open(io.BytesIO(imageData)) as image:
+            return image.size
+
+def isLargeImage(imageData, maximumPixels=None):
+    """
+    Find out if image data has more than maximumPixels
+    pixels. If maximumPixels is None, largeImagePixels
+    is used.
+
+    >>> image = PILImage.new("L", (100, 50))
+    >>> stream = io.BytesIO()
+    >>> image.save(stream, "PNG")
+    >>> isLargeImage(stream.getvalue())
+    False
+    >>> isLargeImage(stream.getvalue(), maximumPixels=1000)
+    True
+    """
+    if not imageData:
+        return False
+    if maximumPixels is None:
+        maximumPixels = largeImagePixels
+    width, height = getImageSize(imageData)
+    return width * height > maximumPixels
+
+
+# -------------
+# PNG Streaming
+# -------------
+
+_pngSignature = b"\x89PNG\r\n\x1a\n"
+_pngChannels = {0 : 1, 2 : 3, 3 : 1, 4 : 2, 6 : 4}
+# 8 bit color types with each number of bytes per pixel
+_pngColorTypeForPixelSize = {1 : 0, 2 : 4, 3 : 2, 4 : 6}
+
+def _iteratePNGChunks(imageData):
+    offset = len(_pngSignature)
+    while offset + 8 <= len(imageData):
+        length, chunkType = struct.unpack_from(">I4s", imageData, offset)
+        start = offset + 8
+        yield chunkType, imageData[start:start + length]
+        offset = start + length + 4
+
+def _makePNGChunk(chunkType, data):
+    return (
+        struct.pack(">I", len(data))
+        + chunkType
+        + data
+        + struct.pack(">I", zlib.crc32(chunkType + data) & 0xffffffff)
+    )
+
+
+class PNGStripReader:
+
+    """
+    Read the rows of a PNG a strip at a time. The
+    compressed data is inflated as the rows are read.
+    Use PNGStripReader.canRead to find out if a PNG
+    can be read.
+
+    >>> image = PILImage.linear_gradient("L").resize((40, 30))
+    >>> stream = io.BytesIO()
+    >>> image.save(stream, "PNG")
+    >>> reader = PNGStripReader(stream.getvalue())
+    >>> strips = [numpy.asarray(strip) for strip in reader.iterateStrips(7)]
+    >>> [len(strip) for strip in strips]
+    [7, 7, 7, 7, 2]
+    >>> numpy.array_equal(numpy.concatenate(strips), numpy.asarray(image))
+    True
+    """
+
+    def __init__(self, imageData):
+        self.imageData = imageData
+        self.palette = None
+        self.transparency = None
+        for chunkType, data in _iteratePNGChunks(imageData):
+            if chunkType == b"IHDR":
+                (
+                    self.width,
+                    self.height,
+                    self.bitDepth,
+                    self.colorType,
+                    compression,
+                    filterMethod,
+                    self.interlace
+                ) = struct.unpack(">IIBBBBB", data)
+            elif chunkType == b"PLTE":
+                self.palette = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 3)
+            elif chunkType == b"tRNS":
+                self.transparency = numpy.frombuffer(data, dtype=numpy.uint8)
+            elif chunkType == b"IDAT":
+                break
+        self.channels = _pngChannels[self.colorType]
+        bitsPerPixel = self.channels * self.bitDepth
+        self.rowBytes = (self.width * bitsPerPixel + 7) // 8
+        self.pixelBytes = max(1, bitsPerPixel // 8)
+
+    @staticmethod
+    def canRead(imageData):
+        """
+        Find out if image data is a PNG that can
+        be read a strip at a time.
+
+        >>> image = PILImage.new("RGB", (10, 10))
+        >>> stream = io.BytesIO()
+        >>> image.save(stream, "PNG")
+        >>> PNGStripReader.canRead(stream.getvalue())
+        True
+        >>> stream = io.BytesIO()
+        >>> image.save(stream, "BMP")
+        >>> PNGStripReader.canRead(stream.getvalue())
+        False
+        """
+        if not imageData.startswith(_pngSignature):
+            return False
+        try:
+            reader = PNGStripReader(imageData)
+        except (struct.error, KeyError, AttributeError, ValueError):
+            return False
+        return not reader.interlace and reader.pixelBytes in _pngColorTypeForPixelSize
+
+    def _iterateCompressedData(self):
+        for chunkType, data in _iteratePNGChunks(self.imageData):
+            if chunkType == b"IDAT":
+                yield data
+
+    def _iterateFilteredRows(self, stripHeight):
+        decompressor = zlib.decompressobj()
+        compressed = self._iterateCompressedData()
+        pending = b""
+        for y in range(0, self.height, stripHeight):
+            size = min(stripHeight, self.height - y) * (self.rowBytes + 1)
+            filtered = bytearray()
+            while len(filtered) < size:
+                if not pending:
+                    pending = next(compressed, None)
+                    if pending is None:
+                        raise ValueError("The PNG data is incomplete.")
+                filtered += decompressor.decompress(pending, size - len(filtered))
+                pending = decompressor.unconsumed_tail
+            yield bytes(filtered)
+
+    def _unfilterRows(self, filtered, previousRow):
+        # Pillow removes the filters. The rows are given
+        # to it as an 8 bit PNG with the same number of
+        # bytes per pixel, so the filters work the same,
+        # and the previous row is added as an unfiltered
+        # first row for the filters that refer to it.
+        rowCount = len(filtered) // (self.rowBytes + 1)
+        header = struct.pack(
+            ">IIBBBBB",
+            self.rowBytes // self.pixelBytes,
+            rowCount + 1,
+            8,
+            _pngColorTypeForPixelSize[self.pixelBytes],
+            0,
+            0,
+            0
+        )
+        data = b"".join((
+            _pngSignature,
+            _makePNGChunk(b"IHDR", header),
+            _makePNGChunk(b"IDAT", zlib.compress(b"\x00" + previousRow + filtered, 0)),
+            _makePNGChunk(b"IEND", b"")
+        ))
+        with PILImage.open(io.BytesIO(data)) as image:
+            raw = numpy.frombuffer(image.tobytes(), dtype=numpy.uint8)
+        return raw.reshape(rowCount + 1, self.rowBytes)[1:]
+
+    def _rowsToImage(self, rows):
+        # convert raw rows to a PIL image
+        bitDepth = self.bitDepth
+        if bitDepth == 16:
+            # keep the high byte of each sample
+            rows = rows[:, 0::2]
+        elif bitDepth < 8:
+            bits = numpy.unpackbits(rows, axis=1)
+            bits = bits.reshape(len(rows), -1, bitDepth)[:, :self.width]
+            weights = 1 << numpy.arange(bitDepth - 1, -1, -1, dtype=numpy.uint8)
+            rows = (bits * weights).sum(axis=2, dtype=numpy.uint8)
+            if self.colorType == 0:
+                rows = rows * numpy.uint8(255 // ((1 << bitDepth) - 1))
+        height = len(rows)
+        colorType = self.colorType
+        if colorType == 3:
+            palette = self.palette
+            if self.transparency is not None:
+                alpha = numpy.full(len(palette), 255, dtype=numpy.uint8)
+                count = min(len(alpha), len(self.transparency))
+                alpha[:count] = self.transparency[:count]
+                palette = numpy.concatenate([palette, alpha[:, None]], axis=1)
+            return PILImage.fromarray(palette[rows])
+        if colorType == 0:
+            return PILImage.fromarray(numpy.ascontiguousarray(rows))
+        mode = {2 : "RGB", 4 : "LA", 6 : "RGBA"}[colorType]
+        rows = numpy.ascontiguousarray(rows).reshape(height, self.width, self.channels)
+        return PILImage.fromarray(rows, mode)
+
+    def iterateStrips(self, stripHeight):
+        """
+        Yield a PIL image of each strip.
+        """
+        previousRow = bytes(self.rowBytes)
+        for filtered in self._iterateFilteredRows(stripHeight):
+            rows = self._unfilterRows(filtered, previousRow)
+            previousRow = rows[-1].tobytes()
+            yield self._rowsToImage(rows)
+
+
+class LargeImage:
+
+    """
+    Image data decoded to a memory-mapped grayscale
+    buffer in a temporary directory. The directory
+    is removed when the image is closed.
+
+    - stripHeight: int
+      The number of rows converted and processed
+      at a time.
+
+    >>> image = PILImage.new("RGBA", (30, 20), (0, 0, 0, 0))
+    >>> image.paste((0, 0, 0, 255), (5, 5, 10, 15))
+    >>> stream = io.BytesIO()
+    >>> image.save(stream, "PNG")
+    >>> with LargeImage(stream.getvalue(), stripHeight=4) as large:
+    ...     large.width, large.height
+    ...     int(large.pixels[0, 0]), int(large.pixels[10, 7])
+    ...     int(large.calculateHistogram()[0])
+    (30, 20)
+    (255, 0)
+    50
+
+    PNGs are decoded a strip at a time. Other
+    images are decoded whole and then converted.
+
+    >>> image = image.quantize(4)
+    >>> for imageFormat in ("PNG", "BMP"):
+    ...     stream = io.BytesIO()
+    ...     image.save(stream, imageFormat)
+    ...     expected = tracerBitmap.convertToGrayscale(PILImage.open(stream))
+    ...     with LargeImage(stream.getvalue(), stripHeight=3) as large:
+    ...         numpy.array_equal(large.pixels, numpy.asarray(expected))
+    True
+    True
+    """
+
+    def __init__(self, imageData, stripHeight=defaultStripHeight):
+        self.stripHeight = stripHeight
+        self._directory = tempfile.TemporaryDirectory(prefix="tracer-")
+        if PNGStripReader.canRead(imageData):
+            reader = PNGStripReader(imageData)
+            self.width = reader.width
+            self.height = reader.height
+            self.pixels = self._makePixels()
+            y = 0
+            for strip in reader.iterateStrips(stripHeight):
+                strip = tracerBitmap.convertToGrayscale(strip)
+                self.pixels[y:y + strip.size[1]] = numpy.asarray(strip)
+                y += strip.size[1]
+            return
+        # other images are decoded whole by Pillow.
+        imagePath = os.path.join(self._directory.name, "image")
+        with open(imagePath, "wb") as f:
+            f.write(imageData)
+        # opening the image from a file lets
+        # Pillow map uncompressed images.
+        with _allowLargeImages():
+            image = PILImage.open(imagePath)
+        with image:
+            self.width, self.height = image.size
+            self.pixels = self._makePixels()
+            for y in range(0, self.height, stripHeight):
+                box = (0, y, self.width, min(self.height, y + stripHeight))
+                strip = tracerBitmap.convertToGrayscale(image.crop(box))
+                self.pixels[box[1]:box[3]] = numpy.asarray(strip)
+        os.remove(imagePath)
+
+    def _makePixels(self):
+        return numpy.memmap(
+            os.path.join(self._directory.name, "pixels"),
+            dtype=numpy.uint8,
+            mode="w+",
+            shape=(self.height, self.width)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # the map is closed when the array is released
+        self.pixels = None
+        self._directory.cleanup()
+
+    def iterateStrips(self, margin=0):
+        """
+        Yield the y of each strip and a grayscale PIL
+        image of it with up to margin rows above and
+        below. The number of rows added above the strip
+        is yielded too.
+        """
+        for y in range(0, self.height, self.stripHeight):
+            top = max(0, y - margin)
+            bottom = min(self.height, y + self.stripHeight + margin)
+            strip = PILImage.fromarray(numpy.array(self.pixels[top:bottom]))
+            yield y, strip, y - top
+
+    def calculateHistogram(self):
+        """
+        Get the 256 bin histogram of the image.
+        """
+        histogram = numpy.zeros(256, dtype=numpy.int64)
+        for y, strip, top in self.iterateStrips():
+            histogram += tracerBitmap.calculateHistogram(strip)
+        return histogram
+
+    def calculateAutomaticThreshold(self):
+        return tracerBitmap.calculateOtsuThreshold(self.calculateHistogram())
+
+    def iterateBitmapStrips(self, threshold=0.5, blur=0, invert=False):
+        """
+        Yield the y of each strip and a bitmap of it made
+        with tracerBitmap.makeBitmap. Blurred strips are the
+        same as the rows of the blurred image.
+        """
+        margin = 0
+        if blur:
+            # Pillow's gaussian blur doesn't reach
+            # further than three times its radius.
+            margin = int(math.ceil(blur * 3)) + 1
+        for y, strip, top in self.iterateStrips(margin):
+            bitmap = tracerBitmap.makeBitmap(
+                strip,
+                threshold=threshold,
+                blur=blur,
+                invert=invert
+            )
+            yield y, bitmap[top:top + self.stripHeight]
+
+    def downsample(self, maximumSize):
+        """
+        Reduce the image so that its longest side is no
+        longer than maximumSize pixels. Returns a grayscale
+        PIL image and the factor the image was reduced by.
+        """
+        factor = max(1, math.ceil(max(self.width, self.height) / maximumSize))
+        reducedStrips = []
+        # each strip is reduced on its own, so it
+        # must be a whole number of reduced rows.
+        stripHeight = max(1, self.stripHeight // factor) * factor
+        for y in range(0, self.height, stripHeight):
+            strip = PILImage.fromarray(numpy.array(self.pixels[y:y + stripHeight]))
+            reducedStrips.append(numpy.asarray(strip.reduce(factor)))
+        reduced = PILImage.fromarray(numpy.concatenate(reducedStrips))
+        return reduced, self.width / reduced.size[0]
+
+
+# ----------
+# Components
+# ----------
+
+def findRuns(bitmap, y=0):
+    """
+    Find the runs of ink in a bitmap. Returns arrays of
+    the row, start and end of each run, in reading order.
+    Ends are exclusive. y is added to the rows.
+
+    >>> bitmap = numpy.array([[0, 1, 1, 0, 1], [1, 1, 0, 0, 0]], dtype=bool)
+    >>> [array.tolist() for array in findRuns(bitmap, y=10)]
+    [[10, 10, 11], [1, 4, 0], [3, 5, 2]]
+    """
+    height, width = bitmap.shape
+    padded = numpy.zeros((height, width + 2), dtype=numpy.int8)
+    padded[:, 1:-1] = bitmap
+    edges = numpy.diff(padded, axis=1)
+    rows, starts = numpy.nonzero(edges == 1)
+    ends = numpy.nonzero(edges == -1)[1]
+    return rows + y, starts, ends
+
+
+class ComponentLabeller:
+
+    """
+    Join runs of ink into 8-connected shapes. Runs are
+    added in strips from top to bottom and are connected
+    to the runs in the last row of the previous strip.
+
+    >>> bitmap = numpy.array([
+    ...     [1, 0, 0, 1],
+    ...     [0, 1, 0, 1],
+    ...     [0, 0, 0, 1],
+    ...     [1, 1, 0, 0],
+    ... ], dtype=bool)
+    >>> labeller = ComponentLabeller(4)
+    >>> labeller.addStrip(bitmap[:2], 0)
+    >>> labeller.addStrip(bitmap[2:], 2)
+    >>> [(rows.tolist(), starts.tolist(), ends.tolist()) for rows, starts, ends in labeller.iterateComponents()]
+    [([0, 1], [0, 1], [1, 2]), ([0, 1, 2], [3, 3, 3], [4, 4, 4]), ([3], [0], [2])]
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self._parents = []
+        self._rows = []
+        self._starts = []
+        self._ends = []
+        self._previousRow = None
+
+    def _find(self, index):
+        parents = self._parents
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def _union(self, first, second):
+        first = self._find(first)
+        second = self._find(second)
+        # the earliest run is the root so the
+        # shapes are ordered by where they begin.
+        if first < second:
+            self._parents[second] = first
+        elif second < first:
+            self._parents[first] = second
+
+    def addStrip(self, bitmap, y):
+        rows, starts, ends = findRuns(bitmap, y)
+        first = len(self._parents)
+        indexes = numpy.arange(first, first + len(rows))
+        self._parents.extend(indexes.tolist())
+        self._rows.append(rows)
+        self._starts.append(starts)
+        self._ends.append(ends)
+        # include the last row of the previous strip
+        # so that shapes are joined across strips.
+        if self._previousRow is not None:
+            previous = self._previousRow
+            self._connect(*(numpy.concatenate(arrays) for arrays in zip(previous, (indexes, rows, starts, ends))))
+        else:
+            self._connect(indexes, rows, starts, ends)
+        last = rows == y + bitmap.shape[0] - 1
+        self._previousRow = (indexes[last], rows[last], starts[last], ends[last])
+
+    def _connect(self, indexes, rows, starts, ends):
+        # runs are touching if they are in neighbouring
+        # rows and overlap, diagonals included. Both keys
+        # are sorted, so the runs touching each run can be
+        # found in the row above with a binary search.
+        stride = self.width + 2
+        startKeys = rows * stride + starts
+        endKeys = rows * stride + ends
+        lowest = numpy.searchsorted(endKeys, (rows - 1) * stride + starts, side="left")
+        highest = numpy.searchsorted(startKeys, (rows - 1) * stride + ends, side="right")
+        counts = numpy.maximum(highest - lowest, 0)
+        current = numpy.repeat(indexes, counts)
+        steps = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        above = indexes[numpy.repeat(lowest, counts) + steps]
+        for a, b in zip(current.tolist(), above.tolist()):
+            self._union(a, b)
+
+    def iterateComponents(self):
+        """
+        Yield arrays of the rows, starts and ends of the
+        runs in each shape, in the order the shapes begin.
+        """
+        if not self._parents:
+            return
+        rows = numpy.concatenate(self._rows)
+        starts = numpy.concatenate(self._starts)
+        ends = numpy.concatenate(self._ends)
+        roots = numpy.array([self._find(index) for index in range(len(self._parents))])
+        order = numpy.argsort(roots, kind="stable")
+        boundaries = numpy.flatnonzero(numpy.diff(roots[order])) + 1
+        for indexes in numpy.split(order, boundaries):
+            yield rows[indexes], starts[indexes], ends[indexes]
+
+
+def makeComponentBitmap(rows, starts, ends):
+    """
+    Make a bitmap of the bounding box of the runs
+    in a shape. Returns the bitmap and the position
+    of its top left corner in the image.
+
+    >>> bitmap, (x, y) = makeComponentBitmap(numpy.array([4, 5]), numpy.array([2, 3]), numpy.array([4, 5]))
+    >>> bitmap.astype(int).tolist(), x, y
+    ([[1, 1, 0], [0, 1, 1]], 2, 4)
+    """
+    left = int(starts.min())
+    top = int(rows.min())
+    width = int(ends.max()) - left
+    height = int(rows.max()) + 1 - top
+    # mark where each run starts and ends and
+    # fill the runs with a cumulative sum.
+    edges = numpy.zeros((height, width + 1), dtype=numpy.int32)
+    numpy.add.at(edges, (rows - top, starts - left), 1)
+    numpy.add.at(edges, (rows - top, ends - left), -1)
+    bitmap = numpy.cumsum(edges, axis=1)[:, :width] > 0
+    return bitmap, (left, top)
+
+
+def iterateComponentBitmaps(
+        largeImage,
+        threshold=0.5,
+        blur=0,
+        invert=False,
+        minimumArea=0
+    ):
+    """
+    Yield a bitmap of each shape in a LargeImage and the
+    pixel offset of the bitmap's bottom left corner, with
+    the origin in the bottom left corner of the image.
+    Shapes with a bounding box no larger than minimumArea
+    can't be larger than that when traced and are skipped.
+    """
+    labeller = ComponentLabeller(largeImage.width)
+    for y, bitmap in largeImage.iterateBitmapStrips(threshold=threshold, blur=blur, invert=invert):
+        labeller.addStrip(bitmap, y)
+    for rows, starts, ends in labeller.iterateComponents():
+        width = int(ends.max() - starts.min())
+        height = int(rows.max() - rows.min()) + 1
+        if width * height <= minimumArea:
+            continue
+        bitmap, (left, top) = makeComponentBitmap(rows, starts, ends)
+        yield bitmap, (left, largeImage.height - top - bitmap.shape[0])
+
+
+class ComponentBatch:
+
+    """
+    Shape bitmaps packed into rows of one bitmap, so
+    that many shapes can be traced at once. The shapes
+    are kept apart by spacing pixels. findPixelOffset
+    gives the offset from a point in the batch to the
+    same point in the image.
+
+    >>> batch = ComponentBatch(maximumWidth=6)
+    >>> batch.add(numpy.ones((2, 3), dtype=bool), (100, 200))
+    >>> batch.add(numpy.ones((1, 2), dtype=bool), (300, 400))
+    >>> batch.add(numpy.ones((3, 1), dtype=bool), (500, 600))
+    >>> len(batch), batch.width, batch.height
+    (3, 5, 7)
+    >>> for row in batch.makeBitmap().astype(int).tolist():
+    ...     print(row)
+    [1, 1, 1, 0, 0]
+    [1, 1, 1, 0, 0]
+    [0, 0, 0, 0, 0]
+    [0, 0, 0, 0, 0]
+    [1, 1, 0, 0, 1]
+    [0, 0, 0, 0, 1]
+    [0, 0, 0, 0, 1]
+
+    Points are in pixels with the origin in the
+    bottom left corner of the batch.
+
+    >>> batch.findPixelOffset(1.5, 6)
+    (100, 195)
+    >>> batch.findPixelOffset(1, 2.5)
+    (300, 398)
+    >>> batch.findPixelOffset(4.5, 1)
+    (496, 600)
+    >>> batch.findPixelOffset(4.5, 6) is None
+    True
+    """
+
+    def __init__(self, maximumWidth=defaultBatchWidth, spacing=2):
+        self.maximumWidth = maximumWidth
+        self.spacing = spacing
+        self.width = 0
+        self.height = 0
+        # (top, lefts, entries) for each row
+        self._rows = []
+        self._count = 0
+        self._x = 0
+        self._rowHeight = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, bitmap, pixelOffset):
+        """
+        Add a shape bitmap and the pixel offset of its
+        bottom left corner in the image.
+        """
+        height, width = bitmap.shape
+        if not self._rows or (self._x and self._x + width > self.maximumWidth):
+            top = 0
+            if self._rows:
+                top = self.height + self.spacing
+            self._rows.append((top, [], []))
+            self._x = 0
+            self._rowHeight = 0
+        top, lefts, entries = self._rows[-1]
+        left = self._x
+        lefts.append(left)
+        entries.append((bitmap, left, pixelOffset))
+        self._count += 1
+        self._x = left + width + self.spacing
+        self._rowHeight = max(self._rowHeight, height)
+        self.width = max(self.width, left + width)
+        self.height = top + self._rowHeight
+
+    def makeBitmap(self):
+        bitmap = numpy.zeros((self.height, self.width), dtype=bool)
+        for top, lefts, entries in self._rows:
+            for component, left, pixelOffset in entries:
+                height, width = component.shape
+                bitmap[top:top + height, left:left + width] = component
+        return bitmap
+
+    def findPixelOffset(self, x, y):
+        """
+        Find the shape that contains the point and get
+        the offset to add to the point to move it into
+        the image. None is returned if no shape is found.
+        """
+        # the traced outline of a shape can be up to
+        # a pixel outside of its bitmap.
+        row = self.height - y
+        tops = [top for top, lefts, entries in self._rows]
+        rowIndex = bisect.bisect_right(tops, row + 1) - 1
+        for top, lefts, entries in self._rows[max(0, rowIndex - 1):rowIndex + 1]:
+            index = bisect.bisect_right(lefts, x + 1) - 1
+            for component, left, pixelOffset in entries[max(0, index - 1):index + 1]:
+                height, width = component.shape
+                if left - 1 <= x <= left + width + 1 and top - 1 <= row <= top + height + 1:
+                    bottom = self.height - top - height
+                    return (pixelOffset[0] - left, pixelOffset[1] - bottom)
+        return None
+
+
+def iterateComponentBatches(
+        components,
+        maximumWidth=defaultBatchWidth,
+        maximumPixels=defaultBatchPixels
+    ):
+    """
+    Pack the shape bitmaps and offsets yielded by
+    iterateComponentBitmaps into ComponentBatch objects
+    of about maximumPixels pixels.
+
+    >>> components = [(numpy.ones((10, 10), dtype=bool), (i * 20, 0)) for i in range(5)]
+    >>> [len(batch) for batch in iterateComponentBatches(components, maximumWidth=30, maximumPixels=400)]
+    [3, 2]
+    """
+    batch = ComponentBatch(maximumWidth)
+    for bitmap, pixelOffset in components:
+        batch.add(bitmap, pixelOffset)
+        if batch.width * batch.height >= maximumPixels:
+            yield batch
+            batch = ComponentBatch(maximumWidth)
+    if len(batch):
+        yield batch
+
+
+# -----
+# Cache
+# -----
+
+# the thresholds are used by the preview and
+# thumbnail threads and the main thread.
+_automaticThresholds = collections.OrderedDict()
+_automaticThresholdsLock = threading.Lock()
+
+def getAutomaticThreshold(imageData, stripHeight=defaultStripHeight, image=None):
+    """
+    Calculate the automatic threshold for large
+    image data. The most recent thresholds are kept.
+    If the LargeImage for the data is already open,
+    give it as image so that it isn't made again.
+    """
+    key = hashImageData(imageData)
+    with _automaticThresholdsLock:
+        threshold = _automaticThresholds.get(key)
+        if threshold is not None:
+            _automaticThresholds.move_to_end(key)
+            return threshold
+    if image is not None:
+        threshold = image.calculateAutomaticThreshold()
+    else:
+        with LargeImage(imageData, stripHeight=stripHeight) as large:
+            threshold = large.calculateAutomaticThreshold()
+    with _automaticThresholdsLock:
+        _automaticThresholds[key] = threshold
+        _automaticThresholds.move_to_end(key)
+        while len(_automaticThresholds) > maximumThresholds:
+            _automaticThresholds.popitem(last=False)
+    return threshold
+
+def isAutomaticThresholdCached(imageData):
+    """
+    Find out if the automatic threshold for large
+    image data is being kept by getAutomaticThreshold.
+    """
+    key = hashImageData(imageData)
+    with _automaticThresholdsLock:
+        return key in _automaticThresholds
+
+def downsampleImageData(imageData, maximumSize, stripHeight=defaultStripHeight):
+    """
+    Reduce large image data so that its longest side
+    is no longer than maximumSize pixels. Returns PNG
+    data and the factor the image was reduced by.
+    """
+    with LargeImage(imageData, stripHeight=stripHeight) as large:
+        reduced, factor = large.downsample(maximumSize)
+    stream = io.BytesIO()
+    reduced.save(stream, "PNG")
+    return stream.getvalue(), factor
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,185 @@
+"""
+Write glyphs into a UFO layer one at a time.
+"""
+
+import os
+import tempfile
+from xml.etree import ElementTree
+from fontTools.misc import plistlib
+from fontTools.ufoLib.filenames import userNameToFileName
+from fontTools.ufoLib.glifLib import writeGlyphToString, glyphNameToFileName
+
+layerContentsFileName = "layercontents.plist"
+contentsFileName = "contents.plist"
+layerInfoFileName = "layerinfo.plist"
+defaultLayerName = "public.default"
+defaultLayerDirectoryName = "glyphs"
+
+def _writeFileAtomically(path, data):
+    directory = os.path.dirname(path)
+    fd, tempPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tempPath, path)
+    except BaseException:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+
+def _readPlist(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "rb") as f:
+        return plistlib.load(f)
+
+def _writePlist(path, data):
+    _writeFileAtomically(path, plistlib.dumps(data))
+
+def readLayerInfo(path, layerName):
+    """
+    Read the layer info of the layer with layerName in
+    the UFO at path. An empty dict is returned if the
+    layer or its layerinfo.plist doesn't exist.
+    """
+    layerContents = _readPlist(os.path.join(path, layerContentsFileName), [])
+    for existingLayerName, directoryName in layerContents:
+        if existingLayerName == layerName:
+            return _readPlist(os.path.join(path, directoryName, layerInfoFileName), {})
+    return {}
+
+def _readGlyphName(path):
+    for event, element in ElementTree.iterparse(path, events=("start",)):
+        return element.attrib.get("name")
+
+
+class StreamingLayerWriter:
+
+    """
+    Write .glif files into a UFO 3 layer as soon as they
+    are available instead of holding a complete layer in
+    memory. Each file is written to a temporary file and
+    then renamed so that a file is never partially written.
+    contents.plist, layerinfo.plist and layercontents.plist
+    are written when the writer is closed.
+
+    If a previous run was interrupted before it was closed,
+    the .glif files it wrote are found and registered when
+    the layer is opened again.
+
+    >>> import tempfile
+    >>> from fontTools.ufoLib import UFOWriter, UFOReader
+    >>> class Glyph:
+    ...     width = 500
+    >>> path = os.path.join(tempfile.mkdtemp(), "Test.ufo")
+    >>> ufoWriter = UFOWriter(path)
+    >>> ufoWriter.getGlyphSet().writeContents()
+    >>> ufoWriter.writeLayerContents()
+    >>> with StreamingLayerWriter(path, "traced") as writer:
+    ...     writer.writeGlyph("A", Glyph())
+    ...     writer.writeGlyph("a", Glyph())
+    >>> reader = UFOReader(path)
+    >>> reader.getLayerNames()
+    ['public.default', 'traced']
+    >>> sorted(reader.getGlyphSet("traced").contents.items())
+    [('A', 'A_.glif'), ('a', 'a.glif')]
+
+    layerinfo.plist is written if layerInfo is given,
+    even if it is empty.
+
+    >>> with StreamingLayerWriter(path, "traced", readLayerInfo(path, "traced")) as writer:
+    ...     pass
+    >>> os.path.exists(os.path.join(writer.directory, layerInfoFileName))
+    True
+    >>> with StreamingLayerWriter(path, "traced", dict(color="1,0,0,1")) as writer:
+    ...     pass
+    >>> readLayerInfo(path, "traced")
+    {'color': '1,0,0,1'}
+    """
+
+    def __init__(self, path, layerName, layerInfo=None):
+        self.path = path
+        self.layerName = layerName
+        self.layerInfo = layerInfo
+        layerContentsPath = os.path.join(path, layerContentsFileName)
+        if not os.path.exists(layerContentsPath):
+            raise ValueError("Layers can only be written to UFO 3 or later.")
+        self.layerContents = _readPlist(layerContentsPath, [])
+        directoryName = None
+        for existingLayerName, existingDirectoryName in self.layerContents:
+            if existingLayerName == layerName:
+                directoryName = existingDirectoryName
+                break
+        if directoryName is None:
+            if layerName == defaultLayerName:
+                directoryName = defaultLayerDirectoryName
+            else:
+                existing = {d.lower() for n, d in self.layerContents}
+                directoryName = userNameToFileName(layerName, existing=existing, prefix="glyphs.")
+            self.layerContents.append([layerName, directoryName])
+        self.directory = os.path.join(path, directoryName)
+        os.makedirs(self.directory, exist_ok=True)
+        self.contents = _readPlist(os.path.join(self.directory, contentsFileName), {})
+        self._existingFileNames = {fileName.lower() for fileName in self.contents.values()}
+        self._recoverGlyphs()
+        self.closed = False
+
+    def _recoverGlyphs(self):
+        for fileName in os.listdir(self.directory):
+            if fileName.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, fileName))
+                continue
+            if not fileName.endswith(".glif"):
+                continue
+            if fileName.lower() in self._existingFileNames:
+                continue
+            try:
+                glyphName = _readGlyphName(os.path.join(self.directory, fileName))
+            except ElementTree.ParseError:
+                continue
+            if glyphName is None or glyphName in self.contents:
+                continue
+            self.contents[glyphName] = fileName
+            self._existingFileNames.add(fileName.lower())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def writeGlyph(self, glyphName, glyphObject=None, drawPointsFunc=None):
+        """
+        Write a glyph. The arguments are the same as those
+        in fontTools.ufoLib.glifLib.GlyphSet.writeGlyph.
+        """
+        if self.closed:
+            raise ValueError("The layer writer has been closed.")
+        text = writeGlyphToString(glyphName, glyphObject, drawPointsFunc)
+        fileName = self.contents.get(glyphName)
+        if fileName is None:
+            fileName = glyphNameToFileName(glyphName, self._existingFileNames)
+            self._existingFileNames.add(fileName.lower())
+        _writeFileAtomically(
+            os.path.join(self.directory, fileName),
+            text.encode("utf-8")
+        )
+        self.contents[glyphName] = fileName
+
+    def close(self):
+        """
+        Write contents.plist, layerinfo.plist and
+        layercontents.plist.
+        """
+        if self.closed:
+            return
+        _writePlist(os.path.join(self.directory, contentsFileName), self.contents)
+        if self.layerInfo is not None:
+            _writePlist(os.path.join(self.directory, layerInfoFileName), self.layerInfo)
+        _writePlist(os.path.join(self.path, layerContentsFileName), self.layerContents)
+        self.closed = True
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,481 @@
+"""
+Measure what simplification costs in fidelity.
+
+For each set of simplify settings this reports the point
+count reduction and the deviation between the traced
+and the simplified outlines. The deviation is a sampled
+Hausdorff distance: both outlines are sampled densely and
+the distance from every sample to the nearest sample on
+the other outline is found with a uniform grid.
+
+Record raw traces from the images in a UFO:
+
+    python -m tracer.measure --record MyFont.ufo --settings Preset.rftracer recorded
+
+Measure presets against the recorded traces:
+
+    python -m tracer.measure recorded --presets A.rftracer B.rftracer --output report.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import numpy
+from fontTools.misc.bezierTools import approximateCubicArcLength, calcQuadraticArcLength
+from fontTools.pens.basePen import decomposeQuadraticSegment
+from fontTools.pens.recordingPen import RecordingPen, replayRecording
+from . import simplify
+from . import corpus as tracerCorpus
+from . import settings as tracerSettings
+
+defaultSampleSpacing = 2.0
+
+# --------
+# Sampling
+# --------
+
+def sampleRecording(recording, spacing=defaultSampleSpacing):
+    """
+    Sample the outline described by a RecordingPen value.
+    Returns an (N, 2) array.
+
+    >>> recording = [
+    ...     ("moveTo", ((0, 0),)),
+    ...     ("lineTo", ((10, 0),)),
+    ...     ("closePath", ())
+    ... ]
+    >>> sampleRecording(recording, spacing=5).tolist()
+    [[0.0, 0.0], [5.0, 0.0], [10.0, 0.0], [5.0, 0.0], [0.0, 0.0]]
+
+    Quadratic curves are sampled on the curve, including
+    the implied on curve points between off curve points.
+
+    >>> recording = [
+    ...     ("moveTo", ((0, 0),)),
+    ...     ("qCurveTo", ((0, 10), (10, 10), (10, 0))),
+    ...     ("endPath", ())
+    ... ]
+    >>> samples = sampleRecording(recording, spacing=100)
+    >>> samples.tolist()
+    [[0.0, 0.0], [5.0, 10.0], [10.0, 0.0]]
+    """
+    chunks = []
+    start = None
+    current = None
+    for operator, operands in recording:
+        if operator == "moveTo":
+            start = current = operands[0]
+            chunks.append(numpy.array([start], dtype=float))
+        elif operator == "lineTo":
+            point = operands[0]
+            chunks.append(_sampleLine(current, point, spacing))
+            current = point
+        elif operator == "curveTo":
+            pt1, pt2, pt3 = operands
+            chunks.append(_sampleCurve(current, pt1, pt2, pt3, spacing))
+            current = pt3
+        elif operator == "qCurveTo":
+            points = list(operands)
+            if points[-1] is None:
+                # a contour without on curve points
+                # starts and ends at an implied point.
+                points.pop()
+                current = _midPoint(points[-1], points[0])
+                chunks.append(numpy.array([current], dtype=float))
+                points.append(current)
+            if len(points) == 1:
+                chunks.append(_sampleLine(current, points[0], spacing))
+            else:
+                for pt1, pt2 in decomposeQuadraticSegment(points):
+                    chunks.append(_sampleQuadraticCurve(current, pt1, pt2, spacing))
+                    current = pt2
+            current = points[-1]
+        elif operator == "closePath":
+            if start is not None and current is not None and current != start:
+                chunks.append(_sampleLine(current, start, spacing))
+            current = start
+    if not chunks:
+        return numpy.zeros((0, 2))
+    return numpy.concatenate(chunks)
+
+def _sampleLine(pt1, pt2, spacing):
+    length = math.hypot(pt2[0] - pt1[0], pt2[1] - pt1[1])
+    steps = max(1, int(math.ceil(length / spacing)))
+    t = numpy.arange(1, steps + 1) / steps
+    pt1 = numpy.asarray(pt1, dtype=float)
+    pt2 = numpy.asarray(pt2, dtype=float)
+    return pt1 + (pt2 - pt1) * t[:, None]
+
+def _sampleCurve(pt0, pt1, pt2, pt3, spacing):
+    length = approximateCubicArcLength(pt0, pt1, pt2, pt3)
+    steps = max(1, int(math.ceil(length / spacing)))
+    t = (numpy.arange(1, steps + 1) / steps)[:, None]
+    mt = 1 - t
+    pt0, pt1, pt2, pt3 = [numpy.asarray(p, dtype=float) for p in (pt0, pt1, pt2, pt3)]
+    return (mt ** 3) * pt0 + 3 * (mt ** 2) * t * pt1 + 3 * mt * (t ** 2) * pt2 + (t ** 3) * pt3
+
+def _sampleQuadraticCurve(pt0, pt1, pt2, spacing):
+    length = calcQuadraticArcLength(pt0, pt1, pt2)
+    steps = max(1, int(math.ceil(length / spacing)))
+    t = (numpy.arange(1, steps + 1) / steps)[:, None]
+    mt = 1 - t
+    pt0, pt1, pt2 = [numpy.asarray(p, dtype=float) for p in (pt0, pt1, pt2)]
+    return (mt ** 2) * pt0 + 2 * mt * t * pt1 + (t ** 2) * pt2
+
+def _midPoint(pt1, pt2):
+    return ((pt1[0] + pt2[0]) * 0.5, (pt1[1] + pt2[1]) * 0.5)
+
+# ---------
+# Deviation
+# ---------
+
+_cellKeyOffset = 1 << 31
+
+def _cellKeys(cells):
+    return (cells[:, 0] + _cellKeyOffset) * (1 << 32) + (cells[:, 1] + _cellKeyOffset)
+
+def nearestDistances(points, reference, cellSize=None):
+    """
+    Get the distance from each point to the nearest
+    point in reference.
+
+    >>> points = numpy.array([[0, 0], [10, 0], [100, 100]], dtype=float)
+    >>> reference = numpy.array([[0, 1], [10, 3]], dtype=float)
+    >>> nearestDistances(points, reference, cellSize=5).round(3).tolist()
+    [1.0, 3.0, 132.322]
+    """
+    pointCount = len(points)
+    distances = numpy.full(pointCount, numpy.inf)
+    if not pointCount or not len(reference):
+        return distances
+    if cellSize is None:
+        cellSize = defaultSampleSpacing * 4
+    referenceCells = numpy.floor(reference / cellSize).astype(numpy.int64)
+    referenceKeys = _cellKeys(referenceCells)
+    order = numpy.argsort(referenceKeys)
+    sortedKeys = referenceKeys[order]
+    sortedReference = reference[order]
+    pointCells = numpy.floor(points / cellSize).astype(numpy.int64)
+    pointIndexes = numpy.arange(pointCount)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            keys = _cellKeys(pointCells + (dx, dy))
+            starts = numpy.searchsorted(sortedKeys, keys, side="left")
+            ends = numpy.searchsorted(sortedKeys, keys, side="right")
+            counts = ends - starts
+            total = counts.sum()
+            if not total:
+                continue
+            queryIndexes = numpy.repeat(pointIndexes, counts)
+            offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            referenceIndexes = numpy.repeat(starts, counts) + offsets
+            delta = points[queryIndexes] - sortedReference[referenceIndexes]
+            d = numpy.hypot(delta[:, 0], delta[:, 1])
+            numpy.minimum.at(distances, queryIndexes, d)
+    # anything further away than one cell may have a
+    # closer point outside of the neighboring cells.
+    far = numpy.nonzero(distances > cellSize)[0]
+    for chunk in numpy.array_split(far, max(1, len(far) // 256)):
+        if not len(chunk):
+            continue
+        delta = points[chunk][:, None, :] - reference[None, :, :]
+        distances[chunk] = numpy.hypot(delta[..., 0], delta[..., 1]).min(axis=1)
+    return distances
+
+def calculateDeviation(recording1, recording2, spacing=defaultSampleSpacing):
+    """
+    Calculate the maximum (the sampled Hausdorff distance)
+    and mean deviation between two outlines.
+
+    >>> square = [
+    ...     ("moveTo", ((0, 0),)), ("lineTo", ((100, 0),)),
+    ...     ("lineTo", ((100, 100),)), ("lineTo", ((0, 100),)),
+    ...     ("closePath", ())
+    ... ]
+    >>> moved = [
+    ...     ("moveTo", ((0, 0),)), ("lineTo", ((100, 0),)),
+    ...     ("lineTo", ((100, 103),)), ("lineTo", ((0, 103),)),
+    ...     ("closePath", ())
+    ... ]
+    >>> maximum, mean = calculateDeviation(square, moved, spacing=1)
+    >>> round(maximum, 3)
+    3.0
+    """
+    samples1 = sampleRecording(recording1, spacing)
+    samples2 = sampleRecording(recording2, spacing)
+    if not len(samples1) and not len(samples2):
+        return 0.0, 0.0
+    if not len(samples1) or not len(samples2):
+        return math.inf, math.inf
+    cellSize = spacing * 4
+    distances1 = nearestDistances(samples1, samples2, cellSize)
+    distances2 = nearestDistances(samples2, samples1, cellSize)
+    distances = numpy.concatenate((distances1, distances2))
+    return float(distances.max()), float(distances.mean())
+
+# -----------
+# Measurement
+# -----------
+
+def countRecordingPoints(recording):
+    pen = simplify.CountPen()
+    replayRecording(recording, pen)
+    return pen.pointCount
+
+def simplifyRecording(recording, simplifySettings):
+    recordingPen = RecordingPen()
+    simplifyPen = simplify.SimplifyContoursPen(recordingPen, **simplifySettings)
+    replayRecording(recording, simplifyPen)
+    return recordingPen.value
+
+def measureRecording(tracedRecording, simplifiedRecording, spacing=defaultSampleSpacing):
+    """
+    Compare a traced outline with its simplified version.
+    """
+    pointsIn = countRecordingPoints(tracedRecording)
+    pointsOut = countRecordingPoints(simplifiedRecording)
+    maximumDeviation, meanDeviation = calculateDeviation(
+        tracedRecording,
+        simplifiedRecording,
+        spacing
+    )
+    reduction = 0.0
+    if pointsIn:
+        reduction = 1.0 - pointsOut / pointsIn
+    return dict(
+        pointsIn=pointsIn,
+        pointsOut=pointsOut,
+        reduction=reduction,
+        maximumDeviation=maximumDeviation,
+        meanDeviation=meanDeviation
+    )
+
+def aggregateMeasurements(measurements):
+    """
+    Combine per glyph measurements.
+    """
+    pointsIn = sum(m["pointsIn"] for m in measurements)
+    pointsOut = sum(m["pointsOut"] for m in measurements)
+    reduction = 0.0
+    if pointsIn:
+        reduction = 1.0 - pointsOut / pointsIn
+    maximumDeviations = [m["maximumDeviation"] for m in measurements]
+    meanDeviations = [m["meanDeviation"] for m in measurements]
+    return dict(
+        glyphCount=len(measurements),
+        pointsIn=pointsIn,
+        pointsOut=pointsOut,
+        reduction=reduction,
+        maximumDeviation=max(maximumDeviations, default=0.0),
+        meanMaximumDeviation=sum(maximumDeviations) / max(1, len(maximumDeviations)),
+        meanDeviation=sum(meanDeviations) / max(1, len(meanDeviations))
+    )
+
+def measureSettings(recordings, simplifySettings, spacing=defaultSampleSpacing):
+    """
+    Simplify each recording with simplifySettings and
+    measure the result. Returns a dict with per glyph
+    measurements and an aggregate.
+    """
+    glyphs = {}
+    duration = 0
+    for glyphName, recording in sorted(recordings.items()):
+        start = time.perf_counter()
+        simplified = simplifyRecording(recording, simplifySettings)
+        elapsed = time.perf_counter() - start
+        duration += elapsed
+        measurement = measureRecording(recording, simplified, spacing)
+        measurement["duration"] = elapsed
+        glyphs[glyphName] = measurement
+    aggregate = aggregateMeasurements(list(glyphs.values()))
+    aggregate["duration"] = duration
+    return dict(
+        glyphs=glyphs,
+        aggregate=aggregate
+    )
+
+def findParetoFront(aggregates, costKey="pointsOut", errorKey="maximumDeviation"):
+    """
+    Get the names of the settings that are not beaten
+    on both point count and deviation by other settings.
+
+    >>> aggregates = dict(
+    ...     a=dict(pointsOut=100, maximumDeviation=1.0),
+    ...     b=dict(pointsOut=80, maximumDeviation=2.0),
+    ...     c=dict(pointsOut=120, maximumDeviation=2.0)
+    ... )
+    >>> findParetoFront(aggregates)
+    ['a', 'b']
+    """
+    front = []
+    for name, aggregate in aggregates.items():
+        dominated = False
+        for otherName, other in aggregates.items():
+            if otherName == name:
+                continue
+            noWorse = other[costKey] <= aggregate[costKey] and other[errorKey] <= aggregate[errorKey]
+            better = other[costKey] < aggregate[costKey] or other[errorKey] < aggregate[errorKey]
+            if noWorse and better:
+                dominated = True
+                break
+        if not dominated:
+            front.append(name)
+    return sorted(front)
+
+# -----------------
+# Recorded Contours
+# -----------------
+
+def readRecordedContours(directory):
+    """
+    Read a folder of .glif files, for example a UFO
+    layer folder, as a dict of glyph name : RecordingPen
+    value pairs.
+    """
+    from fontTools.ufoLib.glifLib import readGlyphFromString
+    from fontTools.pens.pointPen import PointToSegmentPen
+
+    class Glyph:
+        pass
+
+    recordings = {}
+    for fileName in sorted(os.listdir(directory)):
+        if not fileName.endswith(".glif"):
+            continue
+        with open(os.path.join(directory, fileName), "rb") as f:
+            data = f.read()
+        pen = RecordingPen()
+        glyph = Glyph()
+        readGlyphFromString(data, glyph, PointToSegmentPen(pen), validate=False)
+        if pen.value:
+            recordings[os.path.splitext(fileName)[0]] = pen.value
+    return recordings
+
+def recordTraces(ufoPath, directory, traceSettings, workers=None):
+    """
+    Trace the images in a UFO without simplification and
+    write the raw traces as .glif files into directory.
+    """
+    from fontTools.ufoLib import UFOReader
+    from fontTools.ufoLib.glifLib import writeGlyphToString
+    from . import batch
+    import concurrent.futures
+    reader = UFOReader(ufoPath, validate=False)
+    glyphSet = reader.getGlyphSet(validateRead=False)
+    os.makedirs(directory, exist_ok=True)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for glyphName in sorted(glyphSet.keys()):
+            glyph = batch.BatchGlyph()
+            glyphSet.readGlyph(glyphName, glyph)
+            if not glyph.image:
+                continue
+            imageData = reader.readImage(glyph.image["fileName"], validate=False)
+            transformation = batch.getImageTransformation(glyph.image)
+            futures.append(
+                executor.submit(batch._traceJob, glyphName, imageData, traceSettings, None, transformation)
+            )
+        for future in concurrent.futures.as_completed(futures):
+            glyphName, contours, tunedSettings = future.result()
+            text = writeGlyphToString(
+                glyphName,
+                drawPointsFunc=contours.drawPoints
+            )
+            fileName = glyphSet.contents[glyphName]
+            with open(os.path.join(directory, fileName), "w") as f:
+                f.write(text)
+
+# --------------------
+# Command Line Support
+# --------------------
+
+def formatReport(report):
+    lines = []
+    front = set(report["paretoFront"])
+    header = f"{'Settings':30}  {'Points':>15}  {'Reduction':>9}  {'Max Dev':>8}  {'Mean Dev':>8}  {'Time':>9}"
+    lines.append(header)
+    for name, result in report["settings"].items():
+        aggregate = result["aggregate"]
+        marker = "*" if name in front else " "
+        points = f"{aggregate['pointsIn']} -> {aggregate['pointsOut']}"
+        lines.append(
+            f"{marker}{name[:29]:29}  {points:>15}  {aggregate['reduction'] * 100:8.1f}%"
+            f"  {aggregate['maximumDeviation']:8.2f}  {aggregate['meanDeviation']:8.3f}"
+            f"  {aggregate['duration'] * 1000:7.1f}ms"
+        )
+    lines.append("* on the Pareto front of point count and maximum deviation")
+    return "\n".join(lines)
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="python -m tracer.measure",
+        description="Measure point reduction and deviation for simplify settings."
+    )
+    parser.add_argument(
+        "recorded",
+        nargs="?",
+        help="A folder of .glif files containing raw traces. If not given, a synthetic corpus is used."
+    )
+    parser.add_argument(
+        "-p", "--presets",
+        nargs="+",
+        default=[],
+        help=".rftracer files to measure. The default settings are always measured."
+    )
+    parser.add_argument(
+        "--spacing",
+        type=float,
+        default=defaultSampleSpacing,
+        help="The outline sampling distance in units."
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="Write the per glyph and aggregate results as JSON to this path."
+    )
+    parser.add_argument(
+        "--record",
+        metavar="UFO",
+        help="Trace the images in this UFO and write the raw traces into the recorded folder."
+    )
+    parser.add_argument(
+        "-s", "--settings",
+        help="The .rftracer file with the trace settings to use with --record."
+    )
+    args = parser.parse_args(args)
+
+    if args.record:
+        if not args.recorded:
+            parser.error("A folder to record into is required.")
+        traceSettings = dict(tracerSettings.defaultTraceSettings)
+        if args.settings:
+            traceSettings = tracerSettings.readSettingsFile(args.settings)[0]
+        recordTraces(args.record, args.recorded, traceSettings)
+        return 0
+
+    if args.recorded:
+        recordings = readRecordedContours(args.recorded)
+    else:
+        recordings = tracerCorpus.makeOutlineCorpus()
+    presets = {"default" : dict(tracerSettings.defaultSimplifySettings)}
+    for path in args.presets:
+        name = os.path.splitext(os.path.basename(path))[0]
+        presets[name] = tracerSettings.readSettingsFile(path)[1]
+    results = {}
+    for name, simplifySettings in presets.items():
+        results[name] = measureSettings(recordings, simplifySettings, spacing=args.spacing)
+    report = dict(
+        settings=results,
+        paretoFront=findParetoFront({name : result["aggregate"] for name, result in results.items()})
+    )
+    print(formatReport(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
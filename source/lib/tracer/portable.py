@@ -0,0 +1,177 @@
+"""
+A trace implementation that doesn't depend on AppKit
+or DrawBot. Images are decoded with Pillow and traced
+with potracer, a Python port of Potrace. This makes it
+possible to trace outside of RoboFont and in worker
+processes.
+"""
+
+import potrace
+from fontTools.pens.transformPen import TransformPointPen
+from fontTools.pens.pointPen import ReverseContourPointPen
+from . import bitmap as tracerBitmap
+from . import largeImage
+
+def traceBitmap(
+        bitmap,
+        pointPen,
+        turdSize=0,
+        tolerance=0
+    ):
+    """
+    Trace a bitmap into a point pen. True in the bitmap
+    indicates ink. The coordinates are in pixels with
+    the origin in the bottom left corner.
+    """
+    height = bitmap.shape[0]
+    # flipping the y axis reverses the contour
+    # direction so reverse it again to keep
+    # outer contours counter-clockwise.
+    pointPen = ReverseContourPointPen(pointPen)
+    # potrace.Bitmap inverts the data it is given.
+    traceData = potrace.Bitmap(~bitmap)
+    path = traceData.trace(
+        turdsize=int(turdSize),
+        opttolerance=tolerance
+    )
+    for curve in path:
+        pointPen.beginPath()
+        for segment in curve:
+            if segment.is_corner:
+                c = segment.c
+                end = segment.end_point
+                pointPen.addPoint((c.x, height - c.y), "line")
+                pointPen.addPoint((end.x, height - end.y), "line")
+            else:
+                c1 = segment.c1
+                c2 = segment.c2
+                end = segment.end_point
+                pointPen.addPoint((c1.x, height - c1.y))
+                pointPen.addPoint((c2.x, height - c2.y))
+                pointPen.addPoint((end.x, height - end.y), "curve")
+        pointPen.endPath()
+
+def traceImageData(
+        imageData,
+        pointPen,
+        threshold=0,
+        blur=0,
+        invert=False,
+        turdSize=0,
+        tolerance=0,
+        autoThreshold=False,
+        transformation=None
+    ):
+    """
+    Trace image data into a point pen. If autoThreshold
+    is True, the threshold is calculated from the image
+    and the given threshold is ignored. If a transformation
+    is given, it is applied to the pixel coordinates.
+    Images are decoded with bitmap.getDecodedImage, which
+    keeps the most recently traced images. Large images
+    are traced with traceLargeImageData.
+    """
+    if not imageData:
+        return
+    if largeImage.isLargeImage(imageData):
+        traceLargeImageData(
+            imageData,
+            pointPen,
+            threshold=threshold,
+            blur=blur,
+            invert=invert,
+            turdSize=turdSize,
+            tolerance=tolerance,
+            autoThreshold=autoThreshold,
+            transformation=transformation
+        )
+        return
+    # the decoded image and its automatic threshold
+    # are kept, so tracing the same image again with
+    # other settings doesn't decode it again.
+    decoded = tracerBitmap.getDecodedImage(imageData)
+    if autoThreshold:
+        threshold = decoded.getAutomaticThreshold()
+    traceImage(
+        decoded.image,
+        pointPen,
+        threshold=threshold,
+        blur=blur,
+        invert=invert,
+        turdSize=turdSize,
+        tolerance=tolerance,
+        transformation=transformation
+    )
+
+def traceImage(
+        image,
+        pointPen,
+        threshold=0,
+        blur=0,
+        invert=False,
+        turdSize=0,
+        tolerance=0,
+        autoThreshold=False,
+        transformation=None
+    ):
+    """
+    Trace a grayscale PIL image made by decodeImageData
+    into a point pen. This is used to trace one decoded
+    image with several settings.
+    """
+    if autoThreshold:
+        threshold = tracerBitmap.calculateAutomaticThreshold(image)
+    bitmap = tracerBitmap.makeBitmap(
+        image,
+        threshold=threshold,
+        blur=blur,
+        invert=invert
+    )
+    if transformation is not None:
+        pointPen = TransformPointPen(pointPen, transformation)
+    traceBitmap(
+        bitmap,
+        pointPen,
+        turdSize=turdSize,
+        tolerance=tolerance
+    )
+
+def traceLargeImageData(
+        imageData,
+        pointPen,
+        threshold=0,
+        blur=0,
+        invert=False,
+        turdSize=0,
+        tolerance=0,
+        autoThreshold=False,
+        transformation=None,
+        stripHeight=largeImage.defaultStripHeight
+    ):
+    """
+    Trace image data into a point pen without decoding
+    the image whole. The image is processed in strips
+    and each shape in it is traced on its own. See
+    largeImage for the details.
+    """
+    with largeImage.LargeImage(imageData, stripHeight=stripHeight) as image:
+        if autoThreshold:
+            threshold = image.calculateAutomaticThreshold()
+        components = largeImage.iterateComponentBitmaps(
+            image,
+            threshold=threshold,
+            blur=blur,
+            invert=invert,
+            minimumArea=turdSize
+        )
+        for bitmap, pixelOffset in components:
+            componentTransformation = tracerBitmap.makeTraceTransformation(
+                transformation,
+                pixelOffset=pixelOffset
+            )
+            traceBitmap(
+                bitmap,
+                TransformPointPen(pointPen, componentTransformation),
+                turdSize=turdSize,
+                tolerance=tolerance
+            )
@@ -0,0 +1,209 @@
+"""
+Compute previews on a background thread.
+
+Requests are debounced: a request only starts after no
+newer request has arrived for the delay. Every request
+gets a generation number and a result is only delivered
+if no newer request has been made, so stale results are
+discarded. Work is cancelled cooperatively: the work
+function calls job.checkCancelled() between stages and
+the job stops there if a newer request has been made.
+A job can publish intermediate results, such as a quick
+low resolution preview, before it returns its final result.
+"""
+
+import threading
+import time
+import traceback
+
+defaultDelay = 0.15
+
+
+class PreviewCancelled(Exception):
+
+    """
+    Raised by PreviewJob.checkCancelled when
+    the job has been superseded.
+    """
+
+
+class PreviewJob:
+
+    def __init__(self, worker, generation, callback):
+        self.worker = worker
+        self.generation = generation
+        self.callback = callback
+
+    def isCancelled(self):
+        return self.generation != self.worker.generation or self.worker.closed
+
+    def checkCancelled(self):
+        """
+        Stop the work if a newer request has been made.
+        """
+        if self.isCancelled():
+            raise PreviewCancelled
+
+    def publish(self, result):
+        """
+        Deliver an intermediate result. The callback
+        will be called with it, followed later by the
+        final result.
+        """
+        self.checkCancelled()
+        self.worker._send(self.generation, self.callback, result)
+
+
+class PreviewWorker:
+
+    """
+    Run work functions on a background thread.
+
+    - callAfter: function
+      Called with a function and its arguments to run the
+      function on the main thread. If None, results are
+      delivered on the worker thread.
+    - delay: value
+      The debounce delay in seconds.
+    - maximumDelay: value
+      The longest time a request will wait while newer
+      requests keep arriving. This keeps results coming
+      while a slider is dragged. If None, requests wait
+      until there haven't been any new requests for delay.
+
+    >>> results = []
+    >>> worker = PreviewWorker(delay=0.05)
+    >>> def work(job, value):
+    ...     job.checkCancelled()
+    ...     return value * 2
+    >>> for value in range(5):
+    ...     generation = worker.request(lambda job, value=value: work(job, value), results.append)
+    >>> worker.wait()
+    True
+    >>> results
+    [8]
+    >>> def progressiveWork(job):
+    ...     job.publish("draft")
+    ...     return "final"
+    >>> generation = worker.request(progressiveWork, results.append, delay=0)
+    >>> worker.wait()
+    True
+    >>> results
+    [8, 'draft', 'final']
+    >>> worker.close()
+    """
+
+    def __init__(self, callAfter=None, delay=defaultDelay, maximumDelay=None):
+        self.callAfter = callAfter
+        self.delay = delay
+        self.maximumDelay = maximumDelay
+        self.generation = 0
+        self.closed = False
+        self._condition = threading.Condition()
+        self._pending = None
+        self._running = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name="TracerPreviewWorker",
+            daemon=True
+        )
+        self._thread.start()
+
+    def request(self, work, callback, delay=None):
+        """
+        Request that work be run. work will be called with a
+        PreviewJob and callback will be called with the value
+        it returns. Any earlier request that hasn't delivered
+        its result is cancelled.
+        """
+        if delay is None:
+            delay = self.delay
+        with self._condition:
+            self.generation += 1
+            now = time.monotonic()
+            startTime = now + delay
+            firstRequestTime = now
+            if self._pending is not None:
+                firstRequestTime = self._pending[-1]
+                if self.maximumDelay is not None:
+                    startTime = min(startTime, firstRequestTime + self.maximumDelay)
+            self._pending = (self.generation, startTime, work, callback, firstRequestTime)
+            self._condition.notify_all()
+        return self.generation
+
+    def cancel(self):
+        """
+        Cancel all requests.
+        """
+        with self._condition:
+            self.generation += 1
+            self._pending = None
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """
+        Wait until there is no pending or running work.
+        Returns False if the timeout expired.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._pending is None and not self._running,
+                timeout
+            )
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._pending = None
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self.closed:
+                        return
+                    if self._pending is not None:
+                        generation, startTime, work, callback, firstRequestTime = self._pending
+                        remaining = startTime - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                self._pending = None
+                self._running = True
+            job = PreviewJob(self, generation, callback)
+            try:
+                result = work(job)
+                job.checkCancelled()
+            except PreviewCancelled:
+                pass
+            except Exception:
+                # keep the worker alive so that
+                # later requests are still run.
+                traceback.print_exc()
+            else:
+                self._send(generation, callback, result)
+            finally:
+                with self._condition:
+                    self._running = False
+                    self._condition.notify_all()
+
+    def _send(self, generation, callback, result):
+        if self.callAfter is None:
+            self._deliver(generation, callback, result)
+        else:
+            self.callAfter(self._deliver, generation, callback, result)
+
+    def _deliver(self, generation, callback, result):
+        # a newer request may have been made
+        # after the work finished.
+        if generation != self.generation or self.closed:
+            return
+        callback(result)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,140 @@
+settingsFileExtension = ".rftracer"
+
+defaultTraceSettings = dict(
+    threshold=0.5,
+    tolerance=1.0,
+    turdSize=10,
+    blur=1.0,
+    invert=False,
+    autoThreshold=False
+)
+
+defaultSimplifySettings = dict(
+    minimumContourSegments=4,
+    minimumCurveLength=10.0,
+    minimumContourArea=100,
+    douglasPeuckerTolerance=1.0,
+    visvalingamWhyattTolerance=1.0,
+    shallowCurveTolerance=0.2,
+    spikeTolerance=10.0,
+    roundToIntegers=True,
+    roundFirst=False,
+    removeOverlappingPoints=True,
+    iterateUntilStable=False,
+    quadraticTolerance=0
+)
+
+defaultDestinationSettings = dict(
+    layer="traced"
+)
+
+def _parseValue(value):
+    if value == "True":
+        return True
+    if value == "False":
+        return False
+    return float(value)
+
+def settingsFromText(text):
+    """
+    Read trace, simplify and destination settings
+    from text written by settingsToText.
+
+    >>> text = '''Trace:
+    ... - blur: 1.0
+    ... - invert: False
+    ...
+    ... Simplify:
+    ... - spikeTolerance: 10
+    ...
+    ... Destination:
+    ... - layer: traced
+    ... '''
+    >>> traceSettings, simplifySettings, destinationSettings = settingsFromText(text)
+    >>> traceSettings
+    {'blur': 1.0, 'invert': False}
+    >>> simplifySettings
+    {'spikeTolerance': 10.0}
+    >>> destinationSettings
+    {'layer': 'traced'}
+    """
+    traceSettings = {}
+    simplifySettings = {}
+    destinationSettings = {}
+    d = None
+    inDestination = False
+    for line in text.splitlines():
+        if not line:
+            continue
+        if line.startswith("Trace:"):
+            inDestination = False
+            d = traceSettings
+        elif line.startswith("Simplify:"):
+            inDestination = False
+            d = simplifySettings
+        elif line.startswith("Destination:"):
+            inDestination = True
+            d = destinationSettings
+        elif line.startswith("- "):
+            line = line[2:].strip()
+            key, value = line.split(": ", 1)
+            if not inDestination:
+                value = _parseValue(value)
+            d[key] = value
+    return traceSettings, simplifySettings, destinationSettings
+
+def settingsToText(traceSettings, simplifySettings, destinationSettings):
+    """
+    >>> text = settingsToText(
+    ...     dict(invert=False, blur=1.0),
+    ...     dict(spikeTolerance=10.0),
+    ...     dict(layer="traced")
+    ... )
+    >>> print(text)
+    Trace:
+    - blur: 1.0
+    - invert: False
+    <BLANKLINE>
+    Simplify:
+    - spikeTolerance: 10.0
+    <BLANKLINE>
+    Destination:
+    - layer: traced
+    >>> settingsFromText(text)[0]
+    {'blur': 1.0, 'invert': False}
+    """
+    def dictToLines(d):
+        l = []
+        for key, value in sorted(d.items()):
+            l.append(f"- {key}: {value}")
+        return l
+
+    text = []
+    text.append("Trace:")
+    text += dictToLines(traceSettings)
+    text.append("")
+    text.append("Simplify:")
+    text += dictToLines(simplifySettings)
+    text.append("")
+    text.append("Destination:")
+    text += dictToLines(destinationSettings)
+    return "\n".join(text)
+
+def readSettingsFile(path):
+    """
+    Read a .rftracer file. Settings that are not
+    defined in the file are filled with the defaults.
+    """
+    with open(path, "r") as f:
+        text = f.read()
+    traceSettings, simplifySettings, destinationSettings = settingsFromText(text)
+    return (
+        {**defaultTraceSettings, **traceSettings},
+        {**defaultSimplifySettings, **simplifySettings},
+        {**defaultDestinationSettings, **destinationSettings}
+    )
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
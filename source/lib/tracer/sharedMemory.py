@@ -0,0 +1,185 @@
+"""
+Share large job arguments with worker processes.
+
+Arguments sent to a process pool are pickled and written
+through a pipe, which costs about as much as tracing a
+small glyph when the argument is a multi-megabyte scan.
+Large bytes and numpy arrays are instead copied once into
+a shared memory block and the worker is given a small
+SharedBlock that names the block. The worker maps the
+block and reads the value from it.
+
+The blocks are owned by a SharedMemoryStore in the main
+process. A block is released when its job has finished
+or has been cancelled and every remaining block is
+released when the store is closed, garbage collected or
+the interpreter exits. If the main process crashes, the
+multiprocessing resource tracker removes the blocks.
+"""
+
+import sys
+import weakref
+import threading
+import numpy
+from multiprocessing import shared_memory
+
+defaultMinimumSize = 256 * 1024
+
+
+class SharedBlock:
+
+    """
+    A picklable description of a value in a
+    shared memory block.
+    """
+
+    def __init__(self, name, size, shape=None, dtype=None):
+        self.name = name
+        self.size = size
+        self.shape = shape
+        self.dtype = dtype
+
+    def __repr__(self):
+        return f"<SharedBlock {self.name} {self.size} bytes>"
+
+    def read(self):
+        """
+        Get a copy of the value in the block.
+        """
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name=self.name, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=self.name)
+        try:
+            if self.shape is None:
+                return bytes(block.buf[:self.size])
+            array = numpy.ndarray(self.shape, dtype=self.dtype, buffer=block.buf)
+            return array.copy()
+        finally:
+            block.close()
+
+
+def _releaseBlocks(blocks):
+    for block in blocks.values():
+        try:
+            block.close()
+            block.unlink()
+        except FileNotFoundError:
+            pass
+    blocks.clear()
+
+
+class SharedMemoryStore:
+
+    """
+    Copy values into shared memory blocks.
+
+    - minimumSize: int
+      Values smaller than this many bytes are not worth
+      sharing and are returned unchanged by share.
+
+    >>> with SharedMemoryStore(minimumSize=4) as store:
+    ...     shared = store.share(b"abcdefgh")
+    ...     small = store.share(b"ab")
+    ...     array = store.share(numpy.arange(6, dtype="uint8").reshape(2, 3))
+    ...     shared.read(), small
+    ...     array.read().tolist()
+    ...     len(store)
+    ...     store.release(shared)
+    ...     len(store)
+    (b'abcdefgh', b'ab')
+    [[0, 1, 2], [3, 4, 5]]
+    2
+    1
+    >>> len(store)
+    0
+    """
+
+    def __init__(self, minimumSize=defaultMinimumSize):
+        self.minimumSize = minimumSize
+        self._blocks = {}
+        self._lock = threading.Lock()
+        # release the blocks even if close is never called
+        self._finalizer = weakref.finalize(self, _releaseBlocks, self._blocks)
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def share(self, value):
+        """
+        Copy bytes or a numpy array into a shared memory
+        block and return a SharedBlock for it. Other values
+        and values smaller than minimumSize are returned
+        unchanged.
+        """
+        if isinstance(value, (bytes, bytearray)):
+            data = value
+            shape = dtype = None
+        elif isinstance(value, numpy.ndarray):
+            value = numpy.ascontiguousarray(value)
+            data = value.reshape(-1).view(numpy.uint8)
+            shape = value.shape
+            dtype = value.dtype.str
+        else:
+            return value
+        size = len(data)
+        if size < self.minimumSize:
+            return value
+        block = shared_memory.SharedMemory(create=True, size=size)
+        block.buf[:size] = data
+        with self._lock:
+            self._blocks[block.name] = block
+        return SharedBlock(block.name, size, shape, dtype)
+
+    def shareArguments(self, arguments):
+        """
+        Share the large values in a tuple of arguments.
+        Returns the new arguments and a list of the
+        SharedBlocks that were made.
+        """
+        shared = []
+        result = []
+        for argument in arguments:
+            argument = self.share(argument)
+            if isinstance(argument, SharedBlock):
+                shared.append(argument)
+            result.append(argument)
+        return tuple(result), shared
+
+    def release(self, sharedBlock):
+        """
+        Remove a block once no worker needs it.
+        """
+        with self._lock:
+            block = self._blocks.pop(sharedBlock.name, None)
+        if block is not None:
+            _releaseBlocks({block.name : block})
+
+    def close(self):
+        with self._lock:
+            _releaseBlocks(self._blocks)
+
+
+def readArguments(arguments):
+    """
+    Replace SharedBlocks in a tuple of arguments with
+    their values. This is called in the worker.
+    """
+    return tuple(
+        argument.read() if isinstance(argument, SharedBlock) else argument
+        for argument in arguments
+    )
+
+def runWithSharedArguments(function, *arguments):
+    return function(*readArguments(arguments))
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -1,5 +1,7 @@
 import pprint
 import math
+import time
+import collections
 from fontTools.misc.bezierTools import approximateCubicArcLength, calcCubicArcLength
 from fontTools.pens.basePen import AbstractPen
 from fontTools.pens.filterPen import ContourFilterPen
@@ -7,6 +9,7 @@ from fontTools.pens.recordingPen import RecordingPen, replayRecording
 from fontTools.pens.boundsPen import BoundsPen
 from fontTools.pens.areaPen import AreaPen
 from fontTools.pens.roundingPen import RoundingPen
+from fontTools.cu2qu import curve_to_quadratic, curves_to_quadratic
 from simplification.cutil import simplify_coords as applyDouglasPeucker
 from simplification.cutil import simplify_coords_vw as applyVisvalingamWhyatt
 from simplification.cutil import simplify_coords_vwp as applyVisvalingamWhyattPlus
@@ -18,6 +21,8 @@ defaultShallowCurveTolerance = 0.2
 defaultMinimumContourSegments = 4
 defaultMinimumContourArea = 500
 defaultSpikeTolerance = 10
+defaultMaximumIterations = 10
+defaultQuadraticTolerance = 1.0
 
 # ------------------
 # Public Convenience
@@ -34,7 +39,11 @@ def simplifyGlyphContours(
         douglasPeuckerTolerance=defaultDouglasPeuckerTolerance,
         visvalingamWhyattTolerance=defaultVisvalingamWhyattTolerance,
         shallowCurveTolerance=defaultShallowCurveTolerance,
-        spikeTolerance=defaultSpikeTolerance
+        spikeTolerance=defaultSpikeTolerance,
+        roundFirst=False,
+        iterateUntilStable=False,
+        maximumIterations=defaultMaximumIterations,
+        quadraticTolerance=None
     ):
     sourceGlyph = glyph
     if destinationGlyph is None:
@@ -51,7 +60,11 @@ def simplifyGlyphContours(
         douglasPeuckerTolerance=douglasPeuckerTolerance,
         visvalingamWhyattTolerance=visvalingamWhyattTolerance,
         shallowCurveTolerance=shallowCurveTolerance,
-        spikeTolerance=spikeTolerance
+        spikeTolerance=spikeTolerance,
+        roundFirst=roundFirst,
+        iterateUntilStable=iterateUntilStable,
+        maximumIterations=maximumIterations,
+        quadraticTolerance=quadraticTolerance
     )
     sourceGlyph.draw(simplifyPen)
 
@@ -74,7 +87,8 @@ def noArgs(**kwargs):
         removeOverlappingPoints=False,
         minimumContourArea=None,
         roundToIntegers=False,
-        spikeTolerance=0
+        spikeTolerance=0,
+        quadraticTolerance=None
     )
     d.update(kwargs)
     return d
@@ -89,6 +103,14 @@ class SimplifyContoursPen(ContourFilterPen):
       Remove overlapping points in sequence.
     - roundToInteger: bool
       Round values to integers.
+    - roundFirst: bool
+      Round to integers before the other filters
+      instead of after them. Points that rounding
+      merges are removed by the first overlapping
+      points pass and contour areas are calculated
+      exactly with integer arithmetic. The result
+      can differ slightly from rounding last. Only
+      used if roundToIntegers is True.
     - minimumContourSegments: value
       Remove contours with < N segments.
     - minimumContourArea: value
@@ -103,6 +125,23 @@ class SimplifyContoursPen(ContourFilterPen):
       Convert shallow curves to lines.
     - spikeTolerance: value
       Remove single point spikes.
+    - iterateUntilStable: bool
+      Repeat all of the filters until they no longer
+      change the contour. Filters can create spikes,
+      small curves and overlapping points for each
+      other, which a single pass leaves in place.
+    - maximumIterations: value
+      The maximum number of passes if iterateUntilStable
+      is True.
+    - quadraticTolerance: value
+      Convert cubic curves to quadratic curves that
+      are within this distance of them. This is done
+      after all of the other filters.
+    - statistics: SimplifyStatistics
+      Record the duration and the point counts of
+      each stage. If None, nothing is recorded. The
+      passes after the first are recorded together
+      as the "Iterations" stage.
 
 
     To Do:
@@ -127,6 +166,11 @@ class SimplifyContoursPen(ContourFilterPen):
             visvalingamWhyattTolerance=defaultVisvalingamWhyattTolerance,
             shallowCurveTolerance=defaultShallowCurveTolerance,
             spikeTolerance=defaultSpikeTolerance,
+            roundFirst=False,
+            iterateUntilStable=False,
+            maximumIterations=defaultMaximumIterations,
+            quadraticTolerance=None,
+            statistics=None
         ):
         super().__init__(outPen)
         self.minimumCurveLength = minimumCurveLength
@@ -138,46 +182,171 @@ class SimplifyContoursPen(ContourFilterPen):
         self.minimumContourArea = minimumContourArea
         self.roundToIntegers = roundToIntegers
         self.spikeTolerance = spikeTolerance
+        self.roundFirst = roundFirst
+        self.iterateUntilStable = iterateUntilStable
+        self.maximumIterations = maximumIterations
+        self.quadraticTolerance = quadraticTolerance
+        self.statistics = statistics
 
     def filterContour(self, contour):
-        filtered = list(contour)
+        filtered = self._filterPass(list(contour), self._applyFilter)
+        if self.iterateUntilStable and filtered:
+            filtered = self._applyFilter("Iterations", self._iterateFilterPasses, filtered)
+        if self.quadraticTolerance and filtered:
+            filtered = self._applyFilter("Quadratic Curves", filterQuadraticCurves, filtered, self.quadraticTolerance)
+            if self.roundToIntegers:
+                filtered = self._applyFilter("Round Quadratic Curves", filterRoundedPoints, filtered)
+        return filtered
+
+    def _iterateFilterPasses(self, contour):
+        # a pass has changed the contour if the point
+        # count has changed. only if it hasn't are the
+        # contours hashed, instead of comparing the lists.
+        # a hash collision only ends the passes early.
+        pointCount = countContourPoints(contour)
+        contourHash = None
+        for i in range(int(self.maximumIterations) - 1):
+            previous = contour
+            contour = self._filterPass(contour, _applyFilterWithoutStatistics)
+            if not contour:
+                break
+            previousPointCount = pointCount
+            pointCount = countContourPoints(contour)
+            if pointCount != previousPointCount:
+                contourHash = None
+                continue
+            if contourHash is None:
+                contourHash = getContourHash(previous)
+            previousHash = contourHash
+            contourHash = getContourHash(contour)
+            if contourHash == previousHash:
+                break
+        return contour
+
+    def _filterPass(self, contour, apply):
+        filtered = contour
+        roundFirst = self.roundToIntegers and self.roundFirst
+        areaFilter = filterIntegerContourAreas if roundFirst else filterContourAreas
         while filtered:
             # Note: some filters are applied more than once.
             # The first pass is done to simplify the data before
             # expensive processing to eliminate obvious data.
             # The second pass eliminates any of the conditions
             # created through other filtering.
+            if roundFirst:
+                filtered = apply("Round", filterRoundedPoints, filtered)
             if self.removeOverlappingPoints:
-                filtered = filterOverlappingPoints(filtered)
+                filtered = apply("Overlapping Points", filterOverlappingPoints, filtered)
             if self.spikeTolerance:
-                filtered = filterSpikes(filtered, self.spikeTolerance)
+                filtered = apply("Spikes", filterSpikes, filtered, self.spikeTolerance)
             if self.minimumContourSegments:
-                filtered = filterContourSegmentCounts(filtered, self.minimumContourSegments)
+                filtered = apply("Segment Count", filterContourSegmentCounts, filtered, self.minimumContourSegments)
             if self.minimumContourArea:
-                filtered = filterContourAreas(filtered, self.minimumContourArea)
+                filtered = apply("Small Contours", areaFilter, filtered, self.minimumContourArea)
 
             if self.minimumCurveLength:
-                filtered = filterCurveLengths(filtered, self.minimumCurveLength)
+                filtered = apply("Small Curves", filterCurveLengths, filtered, self.minimumCurveLength)
             if self.shallowCurveTolerance:
-                filtered = filterShallowCurves(filtered, self.shallowCurveTolerance)
+                filtered = apply("Shallow Curves", filterShallowCurves, filtered, self.shallowCurveTolerance)
             if self.douglasPeuckerTolerance:
-                filtered = filterDouglasPeucker(filtered, self.douglasPeuckerTolerance)
+                filtered = apply("Douglas Peucker", filterDouglasPeucker, filtered, self.douglasPeuckerTolerance)
             if self.visvalingamWhyattTolerance:
-                filtered = filterVisvalingamWhyatt(filtered, self.visvalingamWhyattTolerance)
+                filtered = apply("Visvalingam Whyatt", filterVisvalingamWhyatt, filtered, self.visvalingamWhyattTolerance)
 
+            # the line filters give points as floats,
+            # so they are rounded even if rounding
+            # was done first.
             if self.roundToIntegers:
-                filtered = filterRoundedPoints(filtered)
+                filtered = apply("Round 2" if roundFirst else "Round", filterRoundedPoints, filtered)
             if self.removeOverlappingPoints:
-                filtered = filterOverlappingPoints(filtered)
+                filtered = apply("Overlapping Points 2", filterOverlappingPoints, filtered)
             if self.spikeTolerance:
-                filtered = filterSpikes(filtered, self.spikeTolerance)
+                filtered = apply("Spikes 2", filterSpikes, filtered, self.spikeTolerance)
             if self.minimumContourSegments:
-                filtered = filterContourSegmentCounts(filtered, self.minimumContourSegments)
+                filtered = apply("Segment Count 2", filterContourSegmentCounts, filtered, self.minimumContourSegments)
             if self.minimumContourArea:
-                filtered = filterContourAreas(filtered, self.minimumContourArea)
+                filtered = apply("Small Contours 2", areaFilter, filtered, self.minimumContourArea)
             break
         return filtered
 
+    def _applyFilter(self, stageName, filter, contour, *args):
+        if self.statistics is None:
+            return filter(contour, *args)
+        start = time.perf_counter()
+        filtered = filter(contour, *args)
+        duration = time.perf_counter() - start
+        self.statistics.addStage(
+            stageName,
+            duration,
+            countContourPoints(contour),
+            countContourPoints(filtered)
+        )
+        return filtered
+
+
+def _applyFilterWithoutStatistics(stageName, filter, contour, *args):
+    return filter(contour, *args)
+
+
+class SimplifyStatistics:
+
+    """
+    Durations and point counts for the stages of
+    SimplifyContoursPen, summed over all contours.
+    The stages are listed in the order they first ran.
+    Stages that are run a second time for cleanup have
+    " 2" at the end of their name.
+
+    >>> from fontTools.pens.recordingPen import RecordingPen
+    >>> statistics = SimplifyStatistics()
+    >>> pen = SimplifyContoursPen(RecordingPen(), statistics=statistics)
+    >>> pen.moveTo((0, 0))
+    >>> pen.lineTo((0, 0))
+    >>> pen.lineTo((0, 100))
+    >>> pen.lineTo((100, 100))
+    >>> pen.lineTo((100, 0))
+    >>> pen.closePath()
+    >>> stage = statistics.stages["Overlapping Points"]
+    >>> stage["pointsIn"], stage["pointsOut"], stage["contours"]
+    (5, 4, 1)
+    >>> statistics.getPointsIn(), statistics.getPointsOut()
+    (5, 4)
+    """
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+
+    def addStage(self, stageName, duration, pointsIn, pointsOut):
+        stage = self.stages.get(stageName)
+        if stage is None:
+            stage = self.stages[stageName] = dict(
+                duration=0,
+                pointsIn=0,
+                pointsOut=0,
+                contours=0
+            )
+        stage["duration"] += duration
+        stage["pointsIn"] += pointsIn
+        stage["pointsOut"] += pointsOut
+        stage["contours"] += 1
+
+    def getDuration(self):
+        return sum(stage["duration"] for stage in self.stages.values())
+
+    def getPointsIn(self):
+        # the first stage sees every contour
+        for stage in self.stages.values():
+            return stage["pointsIn"]
+        return 0
+
+    def getPointsOut(self):
+        # contours removed by a stage
+        # don't reach the later stages.
+        pointsOut = 0
+        for stage in self.stages.values():
+            pointsOut = stage["pointsOut"]
+        return pointsOut
+
 # -------
 # Filters
 # -------
@@ -368,6 +537,53 @@ def filterContourAreas(contour, minArea=defaultMinimumContourArea):
         return []
     return contour
 
+def filterIntegerContourAreas(contour, minArea=defaultMinimumContourArea):
+    """
+    Remove a contour with integer coordinates if its area
+    is below a minimum. For lines and cubic curves with
+    integer coordinates twenty times the area is an integer,
+    so it is calculated exactly without replaying the contour
+    into pens. The result is the same as filterContourAreas.
+
+    >>> input = [
+    ...     ("moveTo", pointsToOperands((0, 0)) ),
+    ...     ("curveTo", pointsToOperands((0, 30), (30, 30), (30, 0)) ),
+    ...     ("closePath", pointsToOperands(()) )
+    ... ]
+    >>> filterIntegerContourAreas(input, 500) == filterContourAreas(input, 500) == input
+    True
+    >>> filterIntegerContourAreas(input, 700) == filterContourAreas(input, 700) == []
+    True
+    """
+    # these are AreaPen's formulas multiplied by 20
+    area = 0
+    for operator, operands in contour:
+        if operator == "moveTo":
+            start = (x0, y0) = operands[0]
+        elif operator == "lineTo":
+            x3, y3 = operands[0]
+            area -= 10 * (x3 - x0) * (y3 + y0)
+            x0, y0 = x3, y3
+        elif operator == "curveTo":
+            (x1, y1), (x2, y2), (x3, y3) = operands
+            x1 -= x0
+            y1 -= y0
+            x2 -= x0
+            y2 -= y0
+            dx = x3 - x0
+            dy = y3 - y0
+            area -= 3 * (x1 * (-y2 - dy) + x2 * (y1 - 2 * dy) + dx * (y1 + 2 * y2))
+            area -= 10 * dx * (y3 + y0)
+            x0, y0 = x3, y3
+        elif operator == "closePath":
+            x3, y3 = start
+            area -= 10 * (x3 - x0) * (y3 + y0)
+        else:
+            return filterContourAreas(contour, minArea)
+    if abs(area) < minArea * 20:
+        return []
+    return contour
+
 def filterCurveLengths(contour, minimumCurveLength=defaultMinimumCurveLength):
     """
     >>> input = [
@@ -579,6 +795,94 @@ def filterShallowCurves(contour, tolerance=defaultShallowCurveTolerance):
             filtered.append((operator, operands))
     return filtered
 
+def filterQuadraticCurves(contour, tolerance=defaultQuadraticTolerance):
+    """
+    Convert cubic curves to quadratic curves
+    that are within tolerance of them.
+
+    >>> input = [
+    ...     ("moveTo", pointsToOperands((0, 0)) ),
+    ...     ("curveTo", pointsToOperands((0, 30), (30, 30), (30, 0)) ),
+    ...     ("closePath", pointsToOperands(()) )
+    ... ]
+    >>> expected = [
+    ...     ("moveTo", pointsToOperands((0, 0)) ),
+    ...     ("qCurveTo", pointsToOperands((0, 15), (15, 25), (30, 15), (30, 0)) ),
+    ...     ("closePath", pointsToOperands(()) )
+    ... ]
+    >>> output = filterQuadraticCurves(input)
+    >>> output == expected
+    True
+
+    >>> recordingPen = RecordingPen()
+    >>> simplifyPen = SimplifyContoursPen(
+    ...     recordingPen,
+    ...     **noArgs(quadraticTolerance=defaultQuadraticTolerance)
+    ... )
+    >>> replayRecording(input, simplifyPen)
+    >>> recordingPen.value == expected
+    True
+    """
+    return convertCompatibleContoursToQuadratic([contour], tolerance)[0]
+
+def convertCompatibleContoursToQuadratic(contours, tolerance=defaultQuadraticTolerance):
+    """
+    Convert the cubic curves in a list of compatible
+    contours to quadratic curves. The curves at the
+    same position in each contour are converted
+    together, so the results are compatible too.
+    A ValueError is raised if the contours don't
+    have the same structure.
+
+    >>> contour1 = [
+    ...     ("moveTo", pointsToOperands((0, 0)) ),
+    ...     ("curveTo", pointsToOperands((0, 30), (30, 30), (30, 0)) ),
+    ...     ("closePath", pointsToOperands(()) )
+    ... ]
+    >>> contour2 = [
+    ...     ("moveTo", pointsToOperands((0, 0)) ),
+    ...     ("curveTo", pointsToOperands((0, 300), (300, 300), (300, 0)) ),
+    ...     ("closePath", pointsToOperands(()) )
+    ... ]
+    >>> output1, output2 = convertCompatibleContoursToQuadratic([contour1, contour2])
+    >>> countContourPoints(output1) == countContourPoints(output2)
+    True
+    >>> countContourPoints(output1) > countContourPoints(filterQuadraticCurves(contour1))
+    True
+    >>> convertCompatibleContoursToQuadratic([contour1, contour1[:1] + contour1[2:]])
+    Traceback (most recent call last):
+        ...
+    ValueError: The contours are not compatible.
+    """
+    structures = [
+        [(operator, len(operands)) for operator, operands in contour]
+        for contour in contours
+    ]
+    for structure in structures[1:]:
+        if structure != structures[0]:
+            raise ValueError("The contours are not compatible.")
+    converted = [[] for contour in contours]
+    previousPoints = [None for contour in contours]
+    for segmentIndex, (operator, pointCount) in enumerate(structures[0]):
+        segments = [contour[segmentIndex][1] for contour in contours]
+        if operator == "curveTo" and pointCount == 3 and None not in previousPoints:
+            curves = [
+                (previousPoint,) + tuple(operands)
+                for previousPoint, operands in zip(previousPoints, segments)
+            ]
+            if len(curves) == 1:
+                splines = [curve_to_quadratic(curves[0], tolerance)]
+            else:
+                splines = curves_to_quadratic(curves, [tolerance] * len(curves))
+            for output, spline in zip(converted, splines):
+                output.append(("qCurveTo", tuple(tuple(point) for point in spline[1:])))
+        else:
+            for output, operands in zip(converted, segments):
+                output.append((operator, operands))
+        if pointCount:
+            previousPoints = [operands[-1] for operands in segments]
+    return converted
+
 # ----------
 # Algorithms
 # ----------
@@ -635,6 +939,20 @@ def removeSpikes(points, tolerance=10):
 
 class CountPen(AbstractPen):
 
+    """
+    Count the points drawn into the pen. Implied
+    on curve points in quadratic curves aren't counted.
+
+    >>> pen = CountPen()
+    >>> pen.moveTo((0, 0))
+    >>> pen.curveTo((0, 10), (10, 10), (10, 0))
+    >>> pen.qCurveTo((10, -10), (0, -10), (0, 0))
+    >>> pen.qCurveTo((5, 5), (10, 0), None)
+    >>> pen.closePath()
+    >>> pen.pointCount
+    9
+    """
+
     pointCount = 0
 
     def moveTo(self, pt):
@@ -644,7 +962,10 @@ class CountPen(AbstractPen):
         self.pointCount += 1
 
     def curveTo(self, *points):
-        self.pointCount += 3
+        self.pointCount += len(points)
+
+    def qCurveTo(self, *points):
+        self.pointCount += sum(1 for point in points if point is not None)
 
     def closePath(self):
         pass
@@ -653,6 +974,32 @@ class CountPen(AbstractPen):
         pass
 
 
+def countContourPoints(contour):
+    """
+    Count the points in a contour given
+    as a list of (operator, operands).
+
+    >>> countContourPoints([("moveTo", ((0, 0),)), ("curveTo", ((1, 1), (2, 2), (3, 3))), ("closePath", ())])
+    4
+    """
+    return sum(len(operands) for operator, operands in contour)
+
+def getContourHash(contour):
+    """
+    Get a hash for a contour given as a list of
+    (operator, operands). Contours with different
+    hashes are different. Compare the point counts
+    first, they are cheaper to get.
+
+    >>> contour = [("moveTo", ((0, 0),)), ("lineTo", ((1, 1),)), ("closePath", ())]
+    >>> getContourHash(contour) == getContourHash(list(contour))
+    True
+    >>> getContourHash(contour) == getContourHash([("moveTo", ((0, 0),)), ("lineTo", ((1, 2),)), ("closePath", ())])
+    False
+    """
+    return hash(tuple(contour))
+
+
 # ------------
 # Test Support
 # ------------
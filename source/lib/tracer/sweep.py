@@ -0,0 +1,469 @@
+"""
+Compare settings presets on a sample of glyphs.
+
+A preset is a name, trace settings and simplify settings.
+Presets can be read from .rftracer files or made from a
+grid of values for a few parameters. Every preset is
+traced, simplified and measured on the same sample of
+glyphs and the results are compared by point count and
+by deviation from the trace.
+
+The work is done in a pool of worker processes with one
+job per glyph. Each job decodes the image once, traces
+it once for every distinct set of trace settings and
+simplifies that trace with every preset that uses those
+trace settings.
+
+    python -m tracer.sweep MyFont.ufo --presets A.rftracer B.rftracer --grid "spikeTolerance: 5, 10, 20"
+"""
+
+import os
+import sys
+import time
+import itertools
+from fontTools.ufoLib import UFOReader
+from fontTools.pens.recordingPen import RecordingPen
+from fontTools.pens.pointPen import PointToSegmentPen
+from . import bitmap as tracerBitmap
+from . import largeImage
+from . import portable
+from . import measure
+from . import batch
+from . import imageIndex
+from . import settings as tracerSettings
+from .cache import hashSettings
+
+defaultSampleSize = 20
+
+# -------
+# Presets
+# -------
+
+def makePreset(name, traceSettings, simplifySettings):
+    return dict(
+        name=name,
+        traceSettings=dict(traceSettings),
+        simplifySettings=dict(simplifySettings)
+    )
+
+def readPresetFile(path):
+    """
+    Read a preset from a .rftracer file.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    traceSettings, simplifySettings, destinationSettings = tracerSettings.readSettingsFile(path)
+    return makePreset(name, traceSettings, simplifySettings)
+
+def parseParameterGrid(text):
+    """
+    Read a parameter grid from text with one
+    "parameter: value, value" line per parameter.
+
+    >>> parseParameterGrid('''
+    ... spikeTolerance: 5, 10, 20
+    ... blur: 0, 1.5
+    ... ''')
+    {'spikeTolerance': [5.0, 10.0, 20.0], 'blur': [0.0, 1.5]}
+    """
+    grid = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        key, values = line.split(":", 1)
+        grid[key.strip()] = [
+            tracerSettings._parseValue(value.strip())
+            for value in values.split(",")
+            if value.strip()
+        ]
+    return grid
+
+def makeParameterGrid(traceSettings, simplifySettings, grid):
+    """
+    Make a preset for every combination of the values
+    in grid. Parameters that are not in the grid are
+    taken from traceSettings and simplifySettings.
+
+    >>> presets = makeParameterGrid(
+    ...     dict(blur=1.0),
+    ...     dict(spikeTolerance=10),
+    ...     dict(blur=[0, 2], spikeTolerance=[5, 20])
+    ... )
+    >>> [preset["name"] for preset in presets]
+    ['blur=0 spikeTolerance=5', 'blur=0 spikeTolerance=20', 'blur=2 spikeTolerance=5', 'blur=2 spikeTolerance=20']
+    >>> presets[1]["traceSettings"], presets[1]["simplifySettings"]
+    ({'blur': 0}, {'spikeTolerance': 20})
+    """
+    for key in grid:
+        if key not in tracerSettings.defaultTraceSettings and key not in tracerSettings.defaultSimplifySettings:
+            raise ValueError(f"Unknown setting: {key}")
+    keys = list(grid.keys())
+    presets = []
+    for values in itertools.product(*[grid[key] for key in keys]):
+        presetTraceSettings = dict(traceSettings)
+        presetSimplifySettings = dict(simplifySettings)
+        nameParts = []
+        for key, value in zip(keys, values):
+            if key in tracerSettings.defaultTraceSettings:
+                presetTraceSettings[key] = value
+            else:
+                presetSimplifySettings[key] = value
+            nameParts.append(f"{key}={value:g}")
+        presets.append(makePreset(" ".join(nameParts), presetTraceSettings, presetSimplifySettings))
+    return presets
+
+def sampleGlyphNames(glyphNames, sampleSize=defaultSampleSize):
+    """
+    Pick evenly spaced glyph names so that the
+    sample covers the whole glyph order.
+
+    >>> sampleGlyphNames(list("abcdefghij"), 4)
+    ['a', 'c', 'f', 'h']
+    >>> sampleGlyphNames(list("abc"), 4)
+    ['a', 'b', 'c']
+    """
+    glyphNames = list(glyphNames)
+    if len(glyphNames) <= sampleSize:
+        return glyphNames
+    step = len(glyphNames) / sampleSize
+    return [glyphNames[int(i * step)] for i in range(sampleSize)]
+
+# ----
+# Jobs
+# ----
+
+def groupPresets(presets):
+    """
+    Group the presets by their trace settings. Returns a
+    list of (trace settings, [(preset index, simplify
+    settings)]) so that each trace is only made once.
+    """
+    groups = {}
+    for index, preset in enumerate(presets):
+        key = hashSettings(preset["traceSettings"])
+        if key not in groups:
+            groups[key] = (preset["traceSettings"], [])
+        groups[key][1].append((index, preset["simplifySettings"]))
+    return list(groups.values())
+
+def _sweepJob(glyphName, imageData, transformation, traceGroups, spacing=measure.defaultSampleSpacing, keepRecordings=False):
+    measurements = {}
+    start = time.perf_counter()
+    if largeImage.isLargeImage(imageData):
+        # large images are decoded in strips
+        # every time they are traced.
+        image = None
+    else:
+        image = tracerBitmap.decodeImageData(imageData)
+    decodeDuration = time.perf_counter() - start
+    for traceSettings, simplifyGroup in traceGroups:
+        start = time.perf_counter()
+        recordingPen = RecordingPen()
+        if image is None:
+            portable.traceLargeImageData(
+                imageData,
+                PointToSegmentPen(recordingPen),
+                transformation=transformation,
+                **traceSettings
+            )
+        else:
+            portable.traceImage(
+                image,
+                PointToSegmentPen(recordingPen),
+                transformation=transformation,
+                **traceSettings
+            )
+        traced = recordingPen.value
+        traceDuration = time.perf_counter() - start
+        for index, simplifySettings in simplifyGroup:
+            start = time.perf_counter()
+            simplified = measure.simplifyRecording(traced, simplifySettings)
+            simplifyDuration = time.perf_counter() - start
+            measurement = measure.measureRecording(traced, simplified, spacing)
+            measurement["decodeDuration"] = decodeDuration
+            measurement["traceDuration"] = traceDuration
+            measurement["simplifyDuration"] = simplifyDuration
+            if keepRecordings:
+                measurement["recording"] = simplified
+            measurements[index] = measurement
+    return glyphName, measurements
+
+def iterateSweepJobs(glyphs, presets, spacing=measure.defaultSampleSpacing, previewGlyphName=None):
+    """
+    Yield BatchRunner jobs for glyphs, a list of
+    (glyph name, image data, transformation). The
+    simplified outlines of previewGlyphName are kept
+    so that the presets can be shown side by side.
+    """
+    traceGroups = groupPresets(presets)
+    for glyphName, imageData, transformation in glyphs:
+        keepRecordings = glyphName == previewGlyphName
+        yield (glyphName, imageData, transformation, traceGroups, spacing, keepRecordings), glyphName
+
+def makeSweepRunner(glyphs, presets, workers=None, executor=None, spacing=measure.defaultSampleSpacing, previewGlyphName=None):
+    """
+    Make a BatchRunner that runs the sweep jobs. The
+    results returned by its poll method are given to
+    SweepResults.add.
+    """
+    return batch.BatchRunner(
+        iterateSweepJobs(glyphs, presets, spacing, previewGlyphName),
+        len(glyphs),
+        workers=workers,
+        executor=executor,
+        function=_sweepJob
+    )
+
+# -------
+# Results
+# -------
+
+class SweepResults:
+
+    """
+    Collect the measurements for each preset.
+
+    >>> presets = [
+    ...     makePreset("a", {}, {}),
+    ...     makePreset("b", {}, {})
+    ... ]
+    >>> results = SweepResults(presets)
+    >>> def measurement(pointsOut, deviation):
+    ...     return dict(
+    ...         pointsIn=100, pointsOut=pointsOut, reduction=0,
+    ...         maximumDeviation=deviation, meanDeviation=deviation / 2,
+    ...         decodeDuration=0.1, traceDuration=0.2, simplifyDuration=0.01
+    ...     )
+    >>> results.add(("A", {0 : measurement(50, 1.0), 1 : measurement(30, 3.0)}))
+    >>> [(row["name"], row["pointsOut"]) for row in results.getRows()]
+    [('a', 50), ('b', 30)]
+    >>> results.findWinner(maximumDeviation=2)
+    'a'
+    >>> results.findWinner(maximumDeviation=5)
+    'b'
+
+    If no preset is within the maximum deviation, the
+    winner is the preset with the smallest deviation.
+
+    >>> results.findWinner(maximumDeviation=0.5)
+    'a'
+    >>> results.isWithinDeviation("a", maximumDeviation=0.5)
+    False
+    >>> results.isWithinDeviation("a", maximumDeviation=2)
+    True
+    """
+
+    def __init__(self, presets):
+        self.presets = presets
+        self.glyphs = {}
+
+    def add(self, result):
+        glyphName, measurements = result
+        self.glyphs[glyphName] = measurements
+
+    def getRows(self):
+        """
+        Get a dict for each preset with the combined
+        point counts, deviations and durations.
+        """
+        rows = []
+        for index, preset in enumerate(self.presets):
+            measurements = [
+                glyphMeasurements[index]
+                for glyphMeasurements in self.glyphs.values()
+                if index in glyphMeasurements
+            ]
+            row = measure.aggregateMeasurements(measurements)
+            row["name"] = preset["name"]
+            row["decodeDuration"] = sum(m["decodeDuration"] for m in measurements)
+            row["traceDuration"] = sum(m["traceDuration"] for m in measurements)
+            row["simplifyDuration"] = sum(m["simplifyDuration"] for m in measurements)
+            rows.append(row)
+        return rows
+
+    def findWinner(self, maximumDeviation=None):
+        """
+        Get the name of the preset with the fewest points
+        among those with a maximum deviation no larger than
+        maximumDeviation. If no preset is close enough, the
+        preset with the smallest deviation wins.
+        """
+        rows = self.getRows()
+        if not rows:
+            return None
+        candidates = rows
+        if maximumDeviation is not None:
+            candidates = [row for row in rows if row["maximumDeviation"] <= maximumDeviation]
+        if not candidates:
+            return min(rows, key=lambda row: (row["maximumDeviation"], row["pointsOut"]))["name"]
+        return min(candidates, key=lambda row: (row["pointsOut"], row["maximumDeviation"]))["name"]
+
+    def isWithinDeviation(self, name, maximumDeviation=None):
+        """
+        Find out if the preset with name has a maximum
+        deviation no larger than maximumDeviation.
+        """
+        if maximumDeviation is None:
+            return True
+        for row in self.getRows():
+            if row["name"] == name:
+                return row["maximumDeviation"] <= maximumDeviation
+        return False
+
+    def getRecording(self, presetIndex, glyphName):
+        """
+        Get the simplified outline of a glyph for a preset
+        if it was kept.
+        """
+        measurement = self.glyphs.get(glyphName, {}).get(presetIndex)
+        if measurement is None:
+            return None
+        return measurement.get("recording")
+
+    def getPreset(self, name):
+        for preset in self.presets:
+            if preset["name"] == name:
+                return preset
+        return None
+
+# --------------------
+# Command Line Support
+# --------------------
+
+def readSampleGlyphs(path, glyphNames=None, sampleSize=defaultSampleSize):
+    """
+    Read (glyph name, image data, transformation) for a
+    sample of the glyphs with images in the UFO at path.
+    """
+    reader = UFOReader(path, validate=False)
+    glyphSet = reader.getGlyphSet(validateRead=False)
+    imageGlyphNames = imageIndex.findImageGlyphNames(path)
+    if glyphNames is None:
+        glyphNames = batch._getGlyphOrder(reader, glyphSet)
+    glyphNames = [glyphName for glyphName in glyphNames if glyphName in imageGlyphNames]
+    glyphs = []
+    for glyphName in sampleGlyphNames(glyphNames, sampleSize):
+        glyph = batch.BatchGlyph()
+        glyphSet.readGlyph(glyphName, glyph)
+        if not glyph.image:
+            continue
+        imageData = reader.readImage(glyph.image["fileName"], validate=False)
+        glyphs.append((glyphName, imageData, batch.getImageTransformation(glyph.image)))
+    return glyphs
+
+def formatRows(rows, winner=None, withinDeviation=True):
+    """
+    Format the rows as a table. If the winner isn't
+    within the maximum deviation, withinDeviation should
+    be False so that it is described as a fallback.
+
+    >>> row = dict(
+    ...     name="a", pointsIn=100, pointsOut=50, maximumDeviation=3.0, meanDeviation=1.5,
+    ...     traceDuration=0.2, simplifyDuration=0.01
+    ... )
+    >>> print(formatRows([row], "a", withinDeviation=False).splitlines()[-1])
+    * no preset is within the maximum deviation, this one has the smallest deviation
+    """
+    lines = []
+    header = f"{'Preset':40}  {'Points':>15}  {'Max Dev':>8}  {'Mean Dev':>8}  {'Trace':>9}  {'Simplify':>9}"
+    lines.append(header)
+    for row in rows:
+        marker = "*" if row["name"] == winner else " "
+        points = f"{row['pointsIn']} -> {row['pointsOut']}"
+        lines.append(
+            f"{marker}{row['name'][:39]:39}  {points:>15}  {row['maximumDeviation']:8.2f}"
+            f"  {row['meanDeviation']:8.3f}  {row['traceDuration'] * 1000:7.0f}ms"
+            f"  {row['simplifyDuration'] * 1000:7.0f}ms"
+        )
+    if winner is not None:
+        if withinDeviation:
+            lines.append("* the preset with the fewest points within the maximum deviation")
+        else:
+            lines.append("* no preset is within the maximum deviation, this one has the smallest deviation")
+    return "\n".join(lines)
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="python -m tracer.sweep",
+        description="Compare settings presets on a sample of the glyphs in a UFO."
+    )
+    parser.add_argument(
+        "ufo",
+        help="The UFO to take the sample from."
+    )
+    parser.add_argument(
+        "-p", "--presets",
+        nargs="+",
+        default=[],
+        help=".rftracer files to compare."
+    )
+    parser.add_argument(
+        "--grid",
+        help="Parameter values to combine, for example \"spikeTolerance: 5, 10; blur: 0, 1\"."
+    )
+    parser.add_argument(
+        "-s", "--settings",
+        help="The .rftracer file that grid values are applied to. The default settings are used if not given."
+    )
+    parser.add_argument(
+        "-n", "--sample",
+        type=int,
+        default=defaultSampleSize,
+        help="The number of glyphs to compare the presets on."
+    )
+    parser.add_argument(
+        "-d", "--max-deviation",
+        type=float,
+        default=2.0,
+        help="The largest maximum deviation the winning preset may have."
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes. The default is the number of processors."
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="Write the winning preset to this .rftracer file."
+    )
+    args = parser.parse_args(args)
+
+    traceSettings = dict(tracerSettings.defaultTraceSettings)
+    simplifySettings = dict(tracerSettings.defaultSimplifySettings)
+    if args.settings:
+        traceSettings, simplifySettings = tracerSettings.readSettingsFile(args.settings)[:2]
+    presets = [readPresetFile(path) for path in args.presets]
+    if args.grid:
+        grid = parseParameterGrid(args.grid.replace(";", "\n"))
+        presets += makeParameterGrid(traceSettings, simplifySettings, grid)
+    if not presets:
+        presets.append(makePreset("default", traceSettings, simplifySettings))
+    glyphs = readSampleGlyphs(args.ufo, sampleSize=args.sample)
+    results = SweepResults(presets)
+    runner = makeSweepRunner(glyphs, presets, workers=args.workers)
+    try:
+        while not runner.isFinished():
+            for context, result in runner.poll(timeout=None):
+                results.add(result)
+    finally:
+        runner.close()
+    winner = results.findWinner(args.max_deviation)
+    print(f"Compared {len(presets)} presets on {len(glyphs)} glyphs.")
+    withinDeviation = results.isWithinDeviation(winner, args.max_deviation)
+    print(formatRows(results.getRows(), winner, withinDeviation))
+    if args.output and winner is not None:
+        preset = results.getPreset(winner)
+        text = tracerSettings.settingsToText(
+            preset["traceSettings"],
+            preset["simplifySettings"],
+            tracerSettings.defaultDestinationSettings
+        )
+        with open(args.output, "w") as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Generate glyph table thumbnails in the background.
+
+Thumbnails are made by a small pool of threads. Requests
+have a priority so that the rows that are visible can be
+made before the rest. Results are kept in a least recently
+used cache keyed by the image hash and the settings, so
+changing the settings doesn't throw anything away: requests
+made with old settings are simply skipped when their turn
+comes and the old results are there if the settings are
+changed back.
+"""
+
+import collections
+import heapq
+import itertools
+import threading
+import traceback
+
+defaultWorkers = 2
+defaultMaximumSize = 2000
+
+priorityVisible = 0
+priorityHidden = 1
+
+
+class ThumbnailCache:
+
+    """
+    A least recently used cache.
+
+    >>> cache = ThumbnailCache(maximumSize=2)
+    >>> cache.set("a", 1)
+    >>> cache.set("b", 2)
+    >>> cache.get("a")
+    1
+    >>> cache.set("c", 3)
+    >>> cache.get("b") is None
+    True
+    >>> len(cache)
+    2
+    """
+
+    def __init__(self, maximumSize=defaultMaximumSize):
+        self.maximumSize = maximumSize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maximumSize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class ThumbnailGenerator:
+
+    """
+    Run thumbnail work functions in a pool of threads.
+
+    - callAfter: function
+      Called with a function and its arguments to run the
+      function on the main thread. If None, callbacks are
+      called on the worker threads.
+    - workers: int
+      The number of threads.
+    - maximumSize: int
+      The maximum number of results to cache.
+
+    >>> generator = ThumbnailGenerator(workers=1)
+    >>> results = []
+    >>> generator.request("a", lambda: "A", results.append)
+    >>> generator.wait()
+    True
+    >>> results
+    ['A']
+    >>> generator.request("a", lambda: "not called", results.append)
+    >>> results
+    ['A', 'A']
+    >>> generator.close()
+    """
+
+    def __init__(self, callAfter=None, workers=defaultWorkers, maximumSize=defaultMaximumSize):
+        self.callAfter = callAfter
+        self.cache = ThumbnailCache(maximumSize)
+        self.generation = 0
+        self.closed = False
+        self._condition = threading.Condition()
+        self._queue = []
+        self._queued = {}
+        self._running = 0
+        self._counter = itertools.count()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self._run,
+                name=f"TracerThumbnailWorker{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def request(self, key, work, callback, priority=priorityHidden):
+        """
+        Request the result for key. If it is cached, callback
+        is called with it right away. Otherwise work is called
+        on a worker thread and callback is called with the value
+        it returns. Lower priority values are run first. If the
+        key is already queued, its priority is raised if the
+        new priority is lower.
+        """
+        cached = self.cache.get(key)
+        if cached is not None:
+            callback(cached)
+            return
+        with self._condition:
+            queued = self._queued.get(key)
+            if queued is not None:
+                queuedPriority, queuedGeneration, queuedCounter = queued
+                if queuedPriority <= priority and queuedGeneration == self.generation:
+                    return
+            counter = next(self._counter)
+            self._queued[key] = (priority, self.generation, counter)
+            heapq.heappush(
+                self._queue,
+                (priority, counter, self.generation, key, work, callback)
+            )
+            self._condition.notify()
+
+    def invalidate(self):
+        """
+        Skip everything that has been requested. Cached
+        results are kept.
+        """
+        with self._condition:
+            self.generation += 1
+            self._queue = []
+            self._queued = {}
+
+    def wait(self, timeout=None):
+        """
+        Wait until there is no queued or running work.
+        Returns False if the timeout expired.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queue and not self._running,
+                timeout
+            )
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._queue = []
+            self._queued = {}
+            self._condition.notify_all()
+
+    def _next(self):
+        # this must be called with the condition held.
+        while self._queue:
+            priority, counter, generation, key, work, callback = heapq.heappop(self._queue)
+            queued = self._queued.get(key)
+            # skip entries replaced by a better priority
+            if queued is None or queued[-1] != counter:
+                continue
+            del self._queued[key]
+            return generation, key, work, callback
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self.closed:
+                        return
+                    task = self._next()
+                    if task is not None:
+                        break
+                    self._condition.notify_all()
+                    self._condition.wait()
+                self._running += 1
+            generation, key, work, callback = task
+            try:
+                result = work()
+            except Exception:
+                traceback.print_exc()
+            else:
+                if result is not None:
+                    self.cache.set(key, result)
+                    if generation == self.generation and not self.closed:
+                        if self.callAfter is None:
+                            callback(result)
+                        else:
+                            self.callAfter(callback, result)
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._condition.notify_all()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
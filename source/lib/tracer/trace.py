@@ -1,9 +1,16 @@
+import io
 import pathlib
 import tempfile
-from fontTools.misc import transform
+import threading
 from fontTools.pens.transformPen import TransformPointPen
+from fontTools.pens.pointPen import PointToSegmentPen
+from fontTools.pens.recordingPen import RecordingPointPen
 import AppKit
 import drawBot as bot
+from PIL import Image as PILImage
+from . import bitmap as tracerBitmap
+from . import largeImage
+from . import simplify
 
 def traceGlyphImage(
         glyphWithImage,
@@ -12,13 +19,130 @@ def traceGlyphImage(
         blur=0,
         invert=False,
         turdSize=0,
-        tolerance=0
+        tolerance=0,
+        autoThreshold=False,
+        maximumImageSize=None,
+        transformation=None,
+        pointPen=None
     ):
-    if destinationGlyph is None:
+    """
+    Trace the image in glyphWithImage into destinationGlyph.
+    If pointPen is given, the outline is drawn into it
+    instead.
+    If maximumImageSize is given, larger images are reduced
+    to that many pixels on their longest side before they
+    are traced. This is much faster and is good enough for
+    a quick preview. Images with more pixels than
+    largeImage.largeImagePixels are never decoded whole,
+    see largeImage.
+
+    The outline is in image units. If transformation is
+    given, usually the image's transformation, it is
+    applied too. Everything is composed into a single
+    transformation that is applied as the outline is drawn.
+    """
+    if destinationGlyph is None and pointPen is None:
         destinationGlyph = glyphWithImage
     imageData = glyphWithImage.image.data
     if not imageData:
         return
+    if pointPen is None:
+        pointPen = destinationGlyph.getPointPen()
+    traceImageData(
+        imageData,
+        pointPen,
+        threshold=threshold,
+        blur=blur,
+        invert=invert,
+        turdSize=turdSize,
+        tolerance=tolerance,
+        autoThreshold=autoThreshold,
+        maximumImageSize=maximumImageSize,
+        transformation=transformation
+    )
+
+def traceImageData(
+        imageData,
+        pointPen,
+        threshold=0,
+        blur=0,
+        invert=False,
+        turdSize=0,
+        tolerance=0,
+        autoThreshold=False,
+        maximumImageSize=None,
+        transformation=None
+    ):
+    """
+    Trace image data into pointPen. The settings are
+    the same as for traceGlyphImage. Only the image data
+    is used, not the glyph, so this can be called off the
+    main thread.
+    """
+    if not imageData:
+        return
+    downsampleFactor = 1
+    if largeImage.isLargeImage(imageData):
+        # NSImage decodes the whole image, so a large
+        # image is converted once into a LargeImage that
+        # is used for the threshold and the trace.
+        with largeImage.LargeImage(imageData) as image:
+            if autoThreshold:
+                threshold = largeImage.getAutomaticThreshold(imageData, image=image)
+            if maximumImageSize is None:
+                _traceLargeImage(
+                    image,
+                    pointPen,
+                    threshold=threshold,
+                    blur=blur,
+                    invert=invert,
+                    turdSize=turdSize,
+                    tolerance=tolerance,
+                    transformation=transformation
+                )
+                return
+            reduced, downsampleFactor = image.downsample(maximumImageSize)
+        stream = io.BytesIO()
+        reduced.save(stream, "PNG")
+        imageData = stream.getvalue()
+    else:
+        if autoThreshold:
+            threshold = tracerBitmap.getDecodedImage(imageData).getAutomaticThreshold()
+        if maximumImageSize is not None:
+            imageData, downsampleFactor = tracerBitmap.downsampleImageData(imageData, maximumImageSize)
+    # blur is a radius and turd size is an
+    # area, both measured in pixels. potrace
+    # only takes an integer turd size.
+    if downsampleFactor != 1:
+        blur /= downsampleFactor
+        turdSize = max(0, int(round(turdSize / downsampleFactor ** 2)))
+    tracer, imageScale = _traceImageData(
+        imageData,
+        threshold=threshold,
+        blur=blur,
+        invert=invert,
+        turdSize=turdSize,
+        tolerance=tolerance
+    )
+    imageTransform = tracerBitmap.makeTraceTransformation(
+        transformation,
+        pixelScale=imageScale * downsampleFactor
+    )
+    transformPointPen = TransformPointPen(pointPen, imageTransform)
+    tracer.drawToPointPen(transformPointPen)
+
+# the preview and thumbnail threads both trace, but
+# NSImage and DrawBot aren't safe to use from several
+# threads at once, so only one trace is run at a time.
+_traceLock = threading.Lock()
+
+def _traceImageData(imageData, threshold, blur, invert, turdSize, tolerance):
+    # returns the traced path and the number of
+    # pixels per unit in the path.
+    with _traceLock:
+        return _traceImageDataLocked(imageData, threshold, blur, invert, turdSize, tolerance)
+
+def _traceImageDataLocked(imageData, threshold, blur, invert, turdSize, tolerance):
     data = AppKit.NSData.dataWithBytes_length_(imageData, len(imageData))
     image = AppKit.NSImage.alloc().initWithData_(data)
     rep = AppKit.NSBitmapImageRep.imageRepWithData_(data)
@@ -35,7 +159,113 @@ def traceGlyphImage(
         turd=turdSize,
         tolerance=tolerance
     )
-    imageTransform = transform.Scale(imageScale)
-    outPointPen = destinationGlyph.getPointPen()
-    transformPointPen = TransformPointPen(outPointPen, imageTransform)
-    tracer.drawToPointPen(transformPointPen)
\ No newline at end of file
+    return tracer, imageScale
+
+def _traceLargeImage(
+        image,
+        pointPen,
+        threshold,
+        blur,
+        invert,
+        turdSize,
+        tolerance,
+        transformation
+    ):
+    # the bitmap is made in strips and the bitmaps of
+    # the shapes are packed into batches, so that
+    # DrawBot traces many shapes at once. each traced
+    # contour is moved back to where its shape is.
+    components = largeImage.iterateComponentBitmaps(
+        image,
+        threshold=threshold,
+        blur=blur,
+        invert=invert,
+        minimumArea=turdSize
+    )
+    for batch in largeImage.iterateComponentBatches(components):
+        stream = io.BytesIO()
+        PILImage.fromarray(~batch.makeBitmap()).save(stream, "PNG")
+        # the shapes are already blurred and inverted
+        tracer, imageScale = _traceImageData(
+            stream.getvalue(),
+            threshold=0.5,
+            blur=0,
+            invert=False,
+            turdSize=turdSize,
+            tolerance=tolerance
+        )
+        recordingPen = RecordingPointPen()
+        tracer.drawToPointPen(recordingPen)
+        transforms = {}
+        for contour in _iterateRecordedContours(recordingPen.value):
+            points = [args[0] for method, args, kwargs in contour if method == "addPoint"]
+            if not points:
+                continue
+            xs = [x for x, y in points]
+            ys = [y for x, y in points]
+            center = (
+                (min(xs) + max(xs)) / 2 * imageScale,
+                (min(ys) + max(ys)) / 2 * imageScale
+            )
+            pixelOffset = batch.findPixelOffset(*center)
+            if pixelOffset is None:
+                continue
+            transformPointPen = transforms.get(pixelOffset)
+            if transformPointPen is None:
+                imageTransform = tracerBitmap.makeTraceTransformation(
+                    transformation,
+                    pixelOffset=pixelOffset
+                ).scale(imageScale)
+                transformPointPen = transforms[pixelOffset] = TransformPointPen(pointPen, imageTransform)
+            for method, args, kwargs in contour:
+                getattr(transformPointPen, method)(*args, **kwargs)
+
+def _iterateRecordedContours(recording):
+    # split a RecordingPointPen value into contours
+    contour = []
+    for item in recording:
+        contour.append(item)
+        if item[0] == "endPath":
+            yield contour
+            contour = []
+
+def traceAndSimplifyGlyphImage(
+        glyphWithImage,
+        pen,
+        simplifySettings=None,
+        **traceSettings
+    ):
+    """
+    Trace the image in glyphWithImage and simplify the
+    outline on its way into pen, a segment pen such as
+    a glyph's pen or a RecordingPen. The trace is drawn
+    through SimplifyContoursPen into pen, so no glyph
+    is made in between. If simplifySettings is None, the
+    trace is not simplified. traceSettings are passed to
+    traceGlyphImage.
+    """
+    if simplifySettings is not None:
+        pen = simplify.SimplifyContoursPen(pen, **simplifySettings)
+    traceGlyphImage(
+        glyphWithImage,
+        pointPen=PointToSegmentPen(pen),
+        **traceSettings
+    )
+
+def traceAndSimplifyImageData(
+        imageData,
+        pen,
+        simplifySettings=None,
+        **traceSettings
+    ):
+    """
+    The same as traceAndSimplifyGlyphImage but for image
+    data, so it can be called off the main thread.
+    """
+    if simplifySettings is not None:
+        pen = simplify.SimplifyContoursPen(pen, **simplifySettings)
+    traceImageData(
+        imageData,
+        PointToSegmentPen(pen),
+        **traceSettings
+    )
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Automatic tuning of simplify settings.
+
+The tuner searches for the simplify settings that give
+the fewest points while keeping the simplified outline
+within a maximum deviation of the trace. The search is
+a coordinate descent over the values the sliders in the
+Tracer window allow. It stops when no parameter change
+improves the result or when the time budget runs out.
+
+Intermediate results are reused: the trace is sampled
+once and every simplify result is cached by its settings.
+
+Contours removed on purpose (those with too few segments
+or too small an area) are removed from the reference
+before measuring, so removing speckles doesn't count
+as deviation.
+"""
+
+import time
+import numpy
+from . import measure
+
+defaultMaximumDeviation = 2.0
+defaultTimeBudget = 2.0
+
+tunedSettingsLibKey = "com.typesupply.tracer.tunedSimplifySettings"
+
+# the values each parameter may take, ordered
+# from least to most aggressive.
+defaultParameterValues = dict(
+    spikeTolerance=[0, 5, 10, 15, 20, 30, 45],
+    minimumCurveLength=[0, 2.5, 5, 10, 15, 20, 30],
+    shallowCurveTolerance=[0, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0],
+    douglasPeuckerTolerance=[0, 0.25, 0.5, 1.0, 1.5, 2.0],
+    visvalingamWhyattTolerance=[0, 0.25, 0.5, 1.0, 1.5, 2.0]
+)
+
+contourRemovalParameters = (
+    "minimumContourSegments",
+    "minimumContourArea"
+)
+
+
+def combineSettings(simplifySettings, tuneSettings):
+    """
+    Combine simplify settings and tune settings into
+    one dict for fingerprints and cache keys. If
+    tuneSettings is None, simplifySettings is returned.
+
+    >>> combineSettings(dict(spikeTolerance=10), dict(maximumDeviation=2))
+    {'spikeTolerance': 10, 'tuneMaximumDeviation': 2}
+    """
+    if tuneSettings is None:
+        return simplifySettings
+    combined = dict(simplifySettings)
+    for key, value in tuneSettings.items():
+        combined["tune" + key[0].upper() + key[1:]] = value
+    return combined
+
+
+class SimplifyTuner:
+
+    """
+    Tune the simplify settings for one traced outline.
+
+    - recording: RecordingPen value
+      The traced outline.
+    - maximumDeviation: value
+      The maximum allowed deviation from the trace.
+    - initialSettings: dict
+      The settings to start from. Settings that are not
+      tuned are taken from here.
+    - parameterValues: dict
+      parameter name : list of values to search.
+    - spacing: value
+      The outline sampling distance.
+    """
+
+    def __init__(self,
+            recording,
+            maximumDeviation=defaultMaximumDeviation,
+            initialSettings=None,
+            parameterValues=None,
+            spacing=measure.defaultSampleSpacing
+        ):
+        if initialSettings is None:
+            initialSettings = {}
+        if parameterValues is None:
+            parameterValues = defaultParameterValues
+        self.recording = recording
+        self.maximumDeviation = maximumDeviation
+        self.initialSettings = dict(initialSettings)
+        self.parameterValues = parameterValues
+        self.spacing = spacing
+        self.evaluations = 0
+        self.cacheHits = 0
+        self._results = {}
+        # the reference only has the contours removed
+        referenceSettings = {key : 0 for key in defaultParameterValues}
+        referenceSettings.update(
+            removeOverlappingPoints=False,
+            roundToIntegers=False,
+            minimumCurveLength=None,
+            douglasPeuckerTolerance=None,
+            visvalingamWhyattTolerance=None,
+            shallowCurveTolerance=None
+        )
+        for key in contourRemovalParameters:
+            referenceSettings[key] = self.initialSettings.get(key)
+        reference = measure.simplifyRecording(recording, referenceSettings)
+        self.referencePointCount = measure.countRecordingPoints(reference)
+        self._referenceSamples = measure.sampleRecording(reference, spacing)
+
+    def _settingsKey(self, settings):
+        return tuple(sorted((key, float(value)) for key, value in settings.items()))
+
+    def evaluate(self, settings):
+        """
+        Get (point count, maximum deviation, mean deviation)
+        for settings.
+        """
+        key = self._settingsKey(settings)
+        result = self._results.get(key)
+        if result is not None:
+            self.cacheHits += 1
+            return result
+        self.evaluations += 1
+        simplified = measure.simplifyRecording(self.recording, settings)
+        pointCount = measure.countRecordingPoints(simplified)
+        samples = measure.sampleRecording(simplified, self.spacing)
+        if not len(samples) or not len(self._referenceSamples):
+            if len(samples) == len(self._referenceSamples):
+                result = (pointCount, 0.0, 0.0)
+            else:
+                result = (pointCount, numpy.inf, numpy.inf)
+        else:
+            cellSize = self.spacing * 4
+            distances = numpy.concatenate((
+                measure.nearestDistances(samples, self._referenceSamples, cellSize),
+                measure.nearestDistances(self._referenceSamples, samples, cellSize)
+            ))
+            result = (pointCount, float(distances.max()), float(distances.mean()))
+        self._results[key] = result
+        return result
+
+    def _score(self, result):
+        pointCount, maximumDeviation, meanDeviation = result
+        feasible = maximumDeviation <= self.maximumDeviation
+        # feasible results always beat infeasible ones
+        if feasible:
+            return (0, pointCount, maximumDeviation)
+        return (1, maximumDeviation, pointCount)
+
+    def tune(self, timeBudget=defaultTimeBudget):
+        """
+        Run the search. Returns the best settings and
+        a dict describing the result.
+        """
+        start = time.perf_counter()
+        deadline = start + timeBudget
+        best = dict(self.initialSettings)
+        for key in self.parameterValues:
+            best.setdefault(key, 0)
+        bestResult = self.evaluate(best)
+        bestScore = self._score(bestResult)
+        improved = True
+        rounds = 0
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            rounds += 1
+            for key, values in self.parameterValues.items():
+                for value in values:
+                    if time.perf_counter() >= deadline:
+                        break
+                    if value == best.get(key):
+                        continue
+                    candidate = dict(best)
+                    candidate[key] = value
+                    result = self.evaluate(candidate)
+                    score = self._score(result)
+                    if score < bestScore:
+                        best = candidate
+                        bestResult = result
+                        bestScore = score
+                        improved = True
+        pointCount, maximumDeviation, meanDeviation = bestResult
+        info = dict(
+            pointsIn=measure.countRecordingPoints(self.recording),
+            pointsOut=pointCount,
+            maximumDeviation=maximumDeviation,
+            meanDeviation=meanDeviation,
+            feasible=maximumDeviation <= self.maximumDeviation,
+            rounds=rounds,
+            evaluations=self.evaluations,
+            cacheHits=self.cacheHits,
+            duration=time.perf_counter() - start
+        )
+        return best, info
+
+
+def tuneSimplifySettings(
+        recording,
+        maximumDeviation=defaultMaximumDeviation,
+        timeBudget=defaultTimeBudget,
+        initialSettings=None,
+        parameterValues=None,
+        spacing=measure.defaultSampleSpacing
+    ):
+    """
+    Find simplify settings for a traced outline that
+    minimize the point count while keeping the maximum
+    deviation from the trace below maximumDeviation.
+    The search stops after timeBudget seconds.
+
+    >>> from tracer.corpus import makeOutlineCorpus
+    >>> from tracer.settings import defaultSimplifySettings
+    >>> recording = makeOutlineCorpus()["O"]
+    >>> settings, info = tuneSimplifySettings(
+    ...     recording,
+    ...     maximumDeviation=3,
+    ...     timeBudget=5,
+    ...     initialSettings=defaultSimplifySettings
+    ... )
+    >>> info["feasible"]
+    True
+    >>> info["pointsOut"] < info["pointsIn"]
+    True
+    """
+    tuner = SimplifyTuner(
+        recording,
+        maximumDeviation=maximumDeviation,
+        initialSettings=initialSettings,
+        parameterValues=parameterValues,
+        spacing=spacing
+    )
+    return tuner.tune(timeBudget=timeBudget)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -1,11 +1,84 @@
+import os
+import time
 import pathlib
 import tempfile
 from fontParts.world import RGlyph
+from fontTools.pens.recordingPen import RecordingPen, replayRecording
+from fontTools.pens.cocoaPen import CocoaPen
+from fontTools.misc.transform import Transform
 import AppKit
+from PyObjCTools.AppHelper import callAfter, callLater
 from PIL import Image as PILImage
 import ezui
 from . import trace
 from . import simplify
+from . import cache
+from . import contours as tracerContours
+from . import fingerprint
+from . import tune
+from . import bitmap as tracerBitmap
+from . import largeImage
+from . import preview
+from . import thumbnails
+from . import imageIndex
+from . import checkpoint
+from .settings import settingsFromText, settingsToText
+try:
+    from . import batch
+    from . import sweep
+except ImportError:
+    # the portable trace implementation
+    # needs potracer to be installed.
+    batch = None
+    sweep = None
+
+class SerialBatchRunner:
+
+    """
+    Run a function for each glyph name on the main thread
+    in short slices of time, so that the window stays
+    responsive and the run can be cancelled between
+    glyphs. It has the parts of batch.BatchRunner that
+    the window uses.
+    """
+
+    def __init__(self, glyphNames, function, timeSlice=0.1):
+        self.glyphNames = glyphNames
+        self.function = function
+        self.timeSlice = timeSlice
+        self.total = len(glyphNames)
+        self.done = 0
+        self.cancelled = False
+
+    def step(self):
+        """
+        Run the function for the next glyphs until the
+        time slice is used up. Returns the number of
+        glyphs the function returned True for.
+        """
+        start = time.perf_counter()
+        count = 0
+        while not self.isFinished():
+            glyphName = self.glyphNames[self.done]
+            self.done += 1
+            if self.function(glyphName):
+                count += 1
+            if time.perf_counter() - start >= self.timeSlice:
+                break
+        return count
+
+    def isFinished(self):
+        return self.cancelled or self.done >= self.total
+
+    def cancel(self):
+        self.cancelled = True
+
+    def close(self):
+        self.cancel()
+
+    def getProgressText(self):
+        return f"Traced {self.done} of {self.total} glyphs"
+
 
 class TracerWindowController(ezui.WindowController):
 
@@ -13,6 +86,7 @@ class TracerWindowController(ezui.WindowController):
             font
         ):
         self.font = font
+        self._imageHashes = {}
         content = """
         = HorizontalStack
 
@@ -36,6 +110,9 @@ class TracerWindowController(ezui.WindowController):
         > : Blur:
         > --X-- [__] @traceBlur
 
+        > :
+        > [ ] Automatic Threshold @traceAutoThreshold
+
         > :
         > [ ] Invert @traceInvert
 
@@ -62,17 +139,39 @@ class TracerWindowController(ezui.WindowController):
         > : Spikes:
         > --X-- [__] @simplifySpikeTolerance
 
+        > : Quadratic:
+        > --X-- [__] @simplifyQuadraticTolerance
+
         > :
         > [X] Round @simplifyRoundToIntegers
+        > [ ] Round First @simplifyRoundFirst
 
         > :
         > [X] Overlapping Points @simplifyRemoveOverlappingPoints
 
+        > :
+        > [ ] Repeat Until Stable @simplifyIterateUntilStable
+
+        > : Max Deviation:
+        > [__] @autoTuneMaximumDeviation
+
+        > :
+        > (Auto Tune Selected Glyph) @autoTuneButton
+
         > !§ Destination
 
         > : Layer:
         > [_ ...] @destinationLayer
 
+        > :
+        > [X] Use Cache @destinationUseCache
+
+        > :
+        > [ ] Skip Unchanged Glyphs @destinationIncremental
+
+        > :
+        > [ ] Auto Tune Each Glyph @destinationAutoTune
+
         > :
         > (Trace Selected Glyphs) @destinationTraceSelectedGlyphs
 
@@ -108,21 +207,49 @@ class TracerWindowController(ezui.WindowController):
             layerNames.remove("traced")
         layerNames.append("traced")
 
-        glyphNames = []
-        for glyphName in self.font.glyphOrder:
-            if glyphName not in font:
-                continue
-            glyph = font[glyphName]
-            if glyph.image:
-                glyphNames.append(glyphName)
+        glyphItems = []
+        for glyphName in self._findImageGlyphNames():
+            glyphItems.append(
+                dict(
+                    thumbnail=None,
+                    glyphName=glyphName,
+                    points="",
+                    status=""
+                )
+            )
 
         descriptionData = dict(
             settingsForm=dict(
                 titleColumnWidth=130
             ),
             glyphsTable=dict(
-                items=glyphNames,
-                width=150
+                items=glyphItems,
+                columnDescriptions=[
+                    dict(
+                        identifier="thumbnail",
+                        title="",
+                        width=self.thumbnailSize,
+                        editable=False,
+                        cellDescription=dict(
+                            cellType="Image"
+                        )
+                    ),
+                    dict(
+                        identifier="glyphName",
+                        title="Glyph"
+                    ),
+                    dict(
+                        identifier="points",
+                        title="Points",
+                        width=50
+                    ),
+                    dict(
+                        identifier="status",
+                        title="Status",
+                        width=60
+                    )
+                ],
+                width=300
             ),
 
             # Footer
@@ -140,6 +267,11 @@ class TracerWindowController(ezui.WindowController):
                     dict(
                         identifier="exportSettingsFooterItem",
                         text="Export Settings"
+                    ),
+                    "----",
+                    dict(
+                        identifier="comparePresetsFooterItem",
+                        text="Compare Presets..."
                     )
                 ],
                 gravity="leading"
@@ -190,6 +322,12 @@ class TracerWindowController(ezui.WindowController):
                         text="Simplified Stroke",
                         state=1
                     ),
+                    "----",
+                    dict(
+                        identifier="previewPerformanceItem",
+                        text="Performance",
+                        state=0
+                    ),
                 ]
             ),
 
@@ -203,7 +341,7 @@ class TracerWindowController(ezui.WindowController):
                 value=0.5,
                 tickMarks=2,
                 stopOnTickMarks=False,
-                continuous=False
+                continuous=True
             ),
 
             traceTolerance=dict(
@@ -214,7 +352,7 @@ class TracerWindowController(ezui.WindowController):
                 value=1,
                 tickMarks=2,
                 stopOnTickMarks=False,
-                continuous=False
+                continuous=True
             ),
 
             traceTurdSize=dict(
@@ -225,7 +363,7 @@ class TracerWindowController(ezui.WindowController):
                 valueType="integer",
                 tickMarks=2,
                 stopOnTickMarks=False,
-                continuous=False
+                continuous=True
             ),
 
             traceBlur=dict(
@@ -236,7 +374,7 @@ class TracerWindowController(ezui.WindowController):
                 value=1,
                 tickMarks=2,
                 stopOnTickMarks=False,
-                continuous=False
+                continuous=True
             ),
 
             # Simplify Controls
@@ -249,7 +387,7 @@ class TracerWindowController(ezui.WindowController):
                 tickMarks=11,
                 stopOnTickMarks=True,
                 sliderWidth=sliderWidth,
-                continuous=False
+                continuous=True
             ),
 
             simplifyMinimumCurveLength=dict(
@@ -260,7 +398,7 @@ class TracerWindowController(ezui.WindowController):
                 tickMarks=2,
                 stopOnTickMarks=False,
                 sliderWidth=sliderWidth,
-                continuous=False
+                continuous=True
             ),
 
             simplifyMinimumContourArea=dict(
@@ -271,7 +409,7 @@ class TracerWindowController(ezui.WindowController):
                 tickMarks=2,
                 stopOnTickMarks=False,
                 sliderWidth=sliderWidth,
-                continuous=False
+                continuous=True
             ),
 
             simplifyDouglasPeuckerTolerance=dict(
@@ -282,7 +420,7 @@ class TracerWindowController(ezui.WindowController):
                 tickMarks=2,
                 stopOnTickMarks=False,
                 sliderWidth=sliderWidth,
-                continuous=False
+                continuous=True
             ),
 
             simplifyVisvalingamWhyattTolerance=dict(
@@ -293,7 +431,7 @@ class TracerWindowController(ezui.WindowController):
                 tickMarks=2,
                 stopOnTickMarks=False,
                 sliderWidth=sliderWidth,
-                continuous=False
+                continuous=True
             ),
 
             simplifyShallowCurveTolerance=dict(
@@ -304,7 +442,7 @@ class TracerWindowController(ezui.WindowController):
                 tickMarks=2,
                 stopOnTickMarks=False,
                 sliderWidth=sliderWidth,
-                continuous=False
+                continuous=True
             ),
 
             simplifySpikeTolerance=dict(
@@ -315,7 +453,24 @@ class TracerWindowController(ezui.WindowController):
                 tickMarks=2,
                 stopOnTickMarks=False,
                 sliderWidth=sliderWidth,
-                continuous=False
+                continuous=True
+            ),
+
+            simplifyQuadraticTolerance=dict(
+                valueType="float:2",
+                minValue=0,
+                maxValue=5,
+                value=0,
+                tickMarks=2,
+                stopOnTickMarks=False,
+                sliderWidth=sliderWidth,
+                continuous=True
+            ),
+
+            autoTuneMaximumDeviation=dict(
+                valueType="float",
+                value=tune.defaultMaximumDeviation,
+                width=50
             ),
 
             # Destination Controls
@@ -347,7 +502,8 @@ class TracerWindowController(ezui.WindowController):
             traceFill=True,
             traceStroke=True,
             simplifiedFill=True,
-            simplifiedStroke=True
+            simplifiedStroke=True,
+            performance=False
         )
 
         self.previewView = self.w.getItem("preview")
@@ -366,74 +522,125 @@ class TracerWindowController(ezui.WindowController):
             position=(0, -self.font.info.descender),
             strokeWidth=2
         )
+        self.previewPerformanceLayer = self.previewContainer.appendTextLineSublayer(
+            position=(0, 0),
+            offset=(10, 10),
+            font="Menlo",
+            pointSize=10,
+            fillColor=(0, 0, 0, 1),
+            backgroundColor=(1, 1, 1, 0.85),
+            padding=(6, 4),
+            cornerRadius=4,
+            horizontalAlignment="left",
+            verticalAlignment="bottom",
+            visible=False
+        )
         self.updatePreviewSettings()
+        self.previewWorker = preview.PreviewWorker(
+            callAfter=callAfter,
+            maximumDelay=self.previewMaximumDelay
+        )
+        self._previewTrace = None
+
+        self._glyphRows = {
+            item["glyphName"] : row
+            for row, item in enumerate(glyphItems)
+        }
+        self._thumbnailUpdateGeneration = 0
+        # the DrawBot trace isn't thread safe, so
+        # only the portable trace is run in a pool.
+        thumbnailWorkers = 1
+        if self._getTraceBackend() == cache.traceBackendPortable:
+            thumbnailWorkers = thumbnails.defaultWorkers
+        self.thumbnailGenerator = thumbnails.ThumbnailGenerator(
+            callAfter=callAfter,
+            workers=thumbnailWorkers
+        )
+        tableView = self.w.getItem("glyphsTable").getNSTableView()
+        tableView.setRowHeight_(self.thumbnailSize)
+        clipView = tableView.enclosingScrollView().contentView()
+        clipView.setPostsBoundsChangedNotifications_(True)
+        self._glyphsTableScrollObserver = AppKit.NSNotificationCenter.defaultCenter().addObserverForName_object_queue_usingBlock_(
+            AppKit.NSViewBoundsDidChangeNotification,
+            clipView,
+            None,
+            self._glyphsTableScrolled
+        )
+
+    def _findImageGlyphNames(self):
+        """
+        Get the names of the glyphs that have an image,
+        in glyph order. Glyphs that haven't been loaded
+        are looked up in an index of the font's files
+        instead of being loaded.
+        """
+        font = self.font
+        layer = font.defaultLayer
+        indexedGlyphNames = None
+        if font.path is not None and os.path.isdir(font.path):
+            try:
+                indexedGlyphNames = imageIndex.findImageGlyphNames(font.path, layer.name)
+            except Exception:
+                # the layer may not have been saved yet.
+                indexedGlyphNames = None
+        # defcon doesn't have public API for the
+        # glyphs that have been loaded.
+        loadedGlyphNames = getattr(layer.naked(), "_glyphs", {})
+        glyphNames = []
+        for glyphName in font.glyphOrder:
+            if glyphName not in layer:
+                continue
+            if indexedGlyphNames is not None and glyphName not in loadedGlyphNames:
+                if glyphName in indexedGlyphNames:
+                    glyphNames.append(glyphName)
+            elif layer[glyphName].image:
+                glyphNames.append(glyphName)
+        return glyphNames
 
     def started(self):
         self.settingsFormCallback(self.w.getItem("settingsForm"))
         glyphsTable = self.w.getItem("glyphsTable")
         self.w.open()
 
+    def destroy(self):
+        if self._batchRun is not None:
+            self._batchRun["runner"].close()
+            self._batchRun = None
+        if self._sweepRun is not None:
+            self._sweepRun["runner"].close()
+            self._sweepRun = None
+        self.previewWorker.close()
+        self.thumbnailGenerator.close()
+        AppKit.NSNotificationCenter.defaultCenter().removeObserver_(self._glyphsTableScrollObserver)
+
     # Footer
 
     def _settingsFromText(self, text):
-        traceSettings = {}
-        simplifySettings = {}
-        destinationSettings = {}
-        d = None
-        inDestination = False
-        for line in text.splitlines():
-            if not line:
-                continue
-            if line.startswith("Trace:"):
-                inDestination = False
-                d = traceSettings
-            elif line.startswith("Simplify:"):
-                inDestination = False
-                d = simplifySettings
-            elif line.startswith("Destination:"):
-                inDestination = True
-                d = destinationSettings
-            elif line.startswith("- "):
-                line = line[2:].strip()
-                key, value = line.split(": ", 1)
-                if not inDestination:
-                    value = float(value)
-                d[key] = value
+        traceSettings, simplifySettings, destinationSettings = settingsFromText(text)
         groups = [
             (traceSettings, "trace"),
             (simplifySettings, "simplify")
         ]
-        for settings, tag in groups:
-            for key, value in settings.items():
+        for settingsGroup, tag in groups:
+            for key, value in settingsGroup.items():
                 identifier = tag + key[0].upper() + key[1:]
                 self.w.getItem(identifier).set(value)
         self.w.getItem("destinationLayer").set(destinationSettings["layer"])
         self.traceSettings.update(traceSettings)
         self.simplifySettings.update(simplifySettings)
-        self.updateTracePreview()
-        self.updateSimplifiedPreview()
-        self.updatePreviewLabel()
+        self.updateThresholdControl()
+        self.schedulePreview()
+        self.scheduleThumbnailUpdate()
 
     def _settingsToText(self):
-        def dictToLines(d):
-            l = []
-            for key, value in sorted(d.items()):
-                l.append(f"- {key}: {value}")
-            return l
-
         destinationSettings = dict(
             layer=self.w.getItem("destinationLayer").get()
         )
-        text = []
-        text.append("Trace:")
-        text += dictToLines(self.traceSettings)
-        text.append("")
-        text.append("Simplify:")
-        text += dictToLines(self.simplifySettings)
-        text.append("")
-        text.append("Destination:")
-        text += dictToLines(destinationSettings)
-        return "\n".join(text)
+        return settingsToText(
+            self.traceSettings,
+            self.simplifySettings,
+            destinationSettings
+        )
 
     def printSettingsFooterItemCallback(self, sender):
         divider = "-" * 10
@@ -476,6 +683,293 @@ class TracerWindowController(ezui.WindowController):
     def finishedButtonCallback(self, sender):
         self.w.close()
 
+    # Preset Comparison
+
+    _sweepRun = None
+    sweepPollInterval = 0.1
+
+    def comparePresetsFooterItemCallback(self, sender):
+        if sweep is None:
+            self.showMessage(
+                "Comparing presets requires potracer.",
+                "Install potracer to compare presets in parallel."
+            )
+            return
+        self._sweepPresetPaths = []
+        content = """
+        * TwoColumnForm @sweepForm
+
+        > : Presets:
+        > (Add Preset Files...) @sweepAddPresetsButton
+
+        > :
+        > . @sweepPresetFiles
+
+        > : Grid:
+        > [[_ _]] @sweepGrid
+
+        > : Sample Glyphs:
+        > [__] @sweepSampleSize
+
+        > : Max Deviation:
+        > [__] @sweepMaximumDeviation
+
+        |----| @sweepTable
+
+        . @sweepStatus
+
+        =---------------------------=
+
+        (Close) @sweepCloseButton
+        (Use Selected Preset) @sweepUseButton
+        (Compare) @sweepRunButton
+        """
+        descriptionData = dict(
+            sweepForm=dict(
+                titleColumnWidth=110
+            ),
+            sweepPresetFiles=dict(
+                width="fill"
+            ),
+            sweepGrid=dict(
+                height=60,
+                placeholder="spikeTolerance: 5, 10, 20"
+            ),
+            sweepSampleSize=dict(
+                valueType="integer",
+                value=sweep.defaultSampleSize,
+                width=50
+            ),
+            sweepMaximumDeviation=dict(
+                valueType="float",
+                value=tune.defaultMaximumDeviation,
+                width=50
+            ),
+            sweepTable=dict(
+                columnDescriptions=[
+                    dict(
+                        identifier="preview",
+                        title="",
+                        width=self.thumbnailSize,
+                        editable=False,
+                        cellDescription=dict(
+                            cellType="Image"
+                        )
+                    ),
+                    dict(
+                        identifier="winner",
+                        title="",
+                        width=15
+                    ),
+                    dict(
+                        identifier="name",
+                        title="Preset"
+                    ),
+                    dict(
+                        identifier="points",
+                        title="Points",
+                        width=100
+                    ),
+                    dict(
+                        identifier="maximumDeviation",
+                        title="Max Dev",
+                        width=60
+                    ),
+                    dict(
+                        identifier="meanDeviation",
+                        title="Mean Dev",
+                        width=60
+                    ),
+                    dict(
+                        identifier="traceDuration",
+                        title="Trace",
+                        width=70
+                    ),
+                    dict(
+                        identifier="simplifyDuration",
+                        title="Simplify",
+                        width=70
+                    )
+                ],
+                width=750,
+                height=300
+            ),
+            sweepStatus=dict(
+                width="fill"
+            ),
+            sweepUseButton=dict(
+                gravity="trailing"
+            ),
+            sweepRunButton=dict(
+                gravity="trailing"
+            )
+        )
+        self.sweepSheet = ezui.EZSheet(
+            content=content,
+            descriptionData=descriptionData,
+            parent=self.w,
+            controller=self
+        )
+        self.sweepSheet.getItem("sweepTable").getNSTableView().setRowHeight_(self.thumbnailSize)
+        self.sweepSheet.getItem("sweepStatus").set("The current settings are always compared.")
+        self.sweepSheet.open()
+
+    def sweepAddPresetsButtonCallback(self, sender):
+        self.showGetFile(
+            callback=self._addSweepPresets,
+            allowsMultipleSelection=True,
+            fileTypes=["rftracer"]
+        )
+
+    def _addSweepPresets(self, paths):
+        if not paths:
+            return
+        for path in paths:
+            if path not in self._sweepPresetPaths:
+                self._sweepPresetPaths.append(path)
+        names = [os.path.splitext(os.path.basename(path))[0] for path in self._sweepPresetPaths]
+        self.sweepSheet.getItem("sweepPresetFiles").set(", ".join(names))
+
+    def _getSweepPresets(self):
+        presets = [
+            sweep.makePreset("Current", self.traceSettings, self.simplifySettings)
+        ]
+        for path in self._sweepPresetPaths:
+            presets.append(sweep.readPresetFile(path))
+        gridText = self.sweepSheet.getItem("sweepGrid").get()
+        grid = sweep.parseParameterGrid(gridText)
+        presets += sweep.makeParameterGrid(self.traceSettings, self.simplifySettings, grid)
+        return presets
+
+    def _getSweepGlyphNames(self):
+        """
+        Use the selected glyphs if more than one is
+        selected. Otherwise take a sample of all of
+        the glyphs with images.
+        """
+        glyphsTable = self.w.getItem("glyphsTable")
+        selectedItems = glyphsTable.getSelectedItems()
+        if len(selectedItems) > 1:
+            return [item["glyphName"] for item in selectedItems]
+        glyphNames = [item["glyphName"] for item in glyphsTable.get()]
+        sampleSize = self.sweepSheet.getItem("sweepSampleSize").get()
+        return sweep.sampleGlyphNames(glyphNames, max(1, sampleSize or 1))
+
+    def sweepRunButtonCallback(self, sender):
+        if self._sweepRun is not None:
+            return
+        try:
+            presets = self._getSweepPresets()
+        except ValueError as error:
+            self.sweepSheet.getItem("sweepStatus").set(f"The grid can't be read: {error}")
+            return
+        glyphs = []
+        for glyphName in self._getSweepGlyphNames():
+            image = self.font[glyphName].image
+            glyphs.append((glyphName, image.data, Transform(*image.transformation)))
+        if not glyphs:
+            return
+        previewGlyphName = glyphs[0][0]
+        if self.selectedImageGlyph is not None:
+            previewGlyphName = self.selectedImageGlyph.name
+            if previewGlyphName not in [glyph[0] for glyph in glyphs]:
+                image = self.selectedImageGlyph.image
+                glyphs.insert(0, (previewGlyphName, image.data, Transform(*image.transformation)))
+        runner = sweep.makeSweepRunner(glyphs, presets, previewGlyphName=previewGlyphName)
+        self._sweepRun = dict(
+            runner=runner,
+            results=sweep.SweepResults(presets),
+            previewGlyphName=previewGlyphName
+        )
+        self.sweepSheet.getItem("sweepRunButton").enable(False)
+        self.sweepSheet.getItem("sweepStatus").set(f"Comparing {len(presets)} presets on {len(glyphs)} glyphs...")
+        callLater(self.sweepPollInterval, self._pollSweep)
+
+    def _pollSweep(self):
+        if self._sweepRun is None:
+            # the sheet was closed
+            return
+        runner = self._sweepRun["runner"]
+        results = self._sweepRun["results"]
+        try:
+            for glyphName, result in runner.poll(timeout=0):
+                results.add(result)
+        except Exception:
+            self._finishSweep()
+            raise
+        if runner.isFinished():
+            previewGlyphName = self._sweepRun["previewGlyphName"]
+            self._finishSweep()
+            self._showSweepResults(results, previewGlyphName)
+        else:
+            self.sweepSheet.getItem("sweepStatus").set(runner.getProgressText())
+            callLater(self.sweepPollInterval, self._pollSweep)
+
+    def _finishSweep(self):
+        self._sweepRun["runner"].close()
+        self._sweepRun = None
+        self.sweepSheet.getItem("sweepRunButton").enable(True)
+
+    def _showSweepResults(self, results, previewGlyphName):
+        maximumDeviation = self.sweepSheet.getItem("sweepMaximumDeviation").get()
+        winner = results.findWinner(maximumDeviation)
+        width = self.font[previewGlyphName].width
+        items = []
+        winnerIndex = None
+        for index, row in enumerate(results.getRows()):
+            recording = results.getRecording(index, previewGlyphName)
+            preview = None
+            if recording is not None:
+                preview = self._makeThumbnailImage(recording, width)
+            if row["name"] == winner:
+                winnerIndex = index
+            items.append(
+                dict(
+                    preview=preview,
+                    winner="*" if row["name"] == winner else "",
+                    name=row["name"],
+                    points=f"{row['pointsIn']} > {row['pointsOut']}",
+                    maximumDeviation=f"{row['maximumDeviation']:.2f}",
+                    meanDeviation=f"{row['meanDeviation']:.3f}",
+                    traceDuration=f"{row['traceDuration'] * 1000:.0f} ms",
+                    simplifyDuration=f"{row['simplifyDuration'] * 1000:.0f} ms",
+                    preset=results.presets[index]
+                )
+            )
+        sweepTable = self.sweepSheet.getItem("sweepTable")
+        sweepTable.set(items)
+        if winnerIndex is not None:
+            sweepTable.setSelectedIndexes([winnerIndex])
+        if results.isWithinDeviation(winner, maximumDeviation):
+            winnerText = "* fewest points within the maximum deviation"
+        else:
+            winnerText = "* none within the maximum deviation, smallest deviation"
+        self.sweepSheet.getItem("sweepStatus").set(
+            f"{len(results.glyphs)} glyphs | {winnerText} | previews show {previewGlyphName}"
+        )
+
+    def sweepUseButtonCallback(self, sender):
+        selectedItems = self.sweepSheet.getItem("sweepTable").getSelectedItems()
+        if len(selectedItems) != 1:
+            return
+        preset = selectedItems[0]["preset"]
+        destinationSettings = dict(
+            layer=self.w.getItem("destinationLayer").get()
+        )
+        text = settingsToText(
+            preset["traceSettings"],
+            preset["simplifySettings"],
+            destinationSettings
+        )
+        self._settingsFromText(text)
+
+    def sweepCloseButtonCallback(self, sender):
+        if self._sweepRun is not None:
+            self._sweepRun["runner"].close()
+            self._sweepRun = None
+        self.sweepSheet.close()
+        self.sweepSheet = None
+
     # Glyphs Table
 
     selectedImageGlyph = None
@@ -489,15 +983,145 @@ class TracerWindowController(ezui.WindowController):
             self.selectedTracedGlyph = None
             self.selectedSimplifiedGlyph = None
         else:
-            glyphName = selectedItems[0]
+            glyphName = selectedItems[0]["glyphName"]
             self.selectedImageGlyph = self.font[glyphName]
             self.selectedTracedGlyph = RGlyph()
             self.selectedTracedGlyph.width = self.selectedImageGlyph.width
             self.selectedSimplifiedGlyph = RGlyph()
             self.selectedSimplifiedGlyph.width = self.selectedImageGlyph.width
-            self.updateTracePreview()
-            self.updateSimplifiedPreview()
+            self.previewTraceLayer.setPath(None)
+            self.previewSimplifiedLayer.setPath(None)
         self.updatePreview()
+        # a new selection doesn't need to wait for
+        # more changes, so don't debounce it.
+        self.schedulePreview(delay=0)
+
+    # Thumbnails
+
+    thumbnailSize = 40
+    thumbnailUpdateDelay = 0.3
+
+    def scheduleThumbnailUpdate(self):
+        """
+        Update the thumbnails once the settings
+        have stopped changing.
+        """
+        self._thumbnailUpdateGeneration += 1
+        callLater(
+            self.thumbnailUpdateDelay,
+            self._updateThumbnailsIfCurrent,
+            self._thumbnailUpdateGeneration
+        )
+
+    def _updateThumbnailsIfCurrent(self, generation):
+        if generation == self._thumbnailUpdateGeneration:
+            self.updateThumbnails()
+
+    def updateThumbnails(self):
+        """
+        Request thumbnails for the visible glyphs with
+        the current settings. Thumbnails made with other
+        settings are shown until they are replaced. The
+        rest are requested when they are scrolled into
+        view, so glyphs aren't loaded until they are seen.
+        """
+        self.thumbnailGenerator.invalidate()
+        items = self.w.getItem("glyphsTable").get()
+        for row in self._getVisibleGlyphRows():
+            self._requestThumbnail(items[row], thumbnails.priorityVisible)
+
+    def _getVisibleGlyphRows(self):
+        tableView = self.w.getItem("glyphsTable").getNSTableView()
+        location, length = tableView.rowsInRect_(tableView.visibleRect())
+        return range(location, location + length)
+
+    def _glyphsTableScrolled(self, notification):
+        items = self.w.getItem("glyphsTable").get()
+        for row in self._getVisibleGlyphRows():
+            self._requestThumbnail(items[row], thumbnails.priorityVisible)
+        self.updateGlyphStatuses()
+
+    def _requestThumbnail(self, item, priority):
+        glyphName = item["glyphName"]
+        imageGlyph = self.font[glyphName]
+        # the glyph is only read on the main thread,
+        # the worker gets the image data.
+        imageData = imageGlyph.image.data
+        transformation = imageGlyph.image.transformation
+        width = imageGlyph.width
+        traceSettings = dict(self.traceSettings)
+        simplifySettings = dict(self.simplifySettings)
+        backend = self._getTraceBackend()
+        key = (
+            self._getImageHash(imageGlyph),
+            cache.hashSettings(traceSettings, simplifySettings),
+            backend
+        )
+
+        def work():
+            # thumbnails are traced with the implementation
+            # the glyphs will be traced with.
+            if backend == cache.traceBackendPortable:
+                return batch.traceAndSimplifyImageData(
+                    imageData,
+                    traceSettings,
+                    simplifySettings,
+                    transformation=Transform(*transformation)
+                )
+            return self._traceRecording(imageData, transformation, traceSettings, simplifySettings)
+
+        def callback(recording):
+            self._thumbnailComputed(glyphName, width, recording)
+
+        self.thumbnailGenerator.request(key, work, callback, priority)
+
+    def _thumbnailComputed(self, glyphName, width, recording):
+        # this is called on the main thread.
+        row = self._glyphRows.get(glyphName)
+        if row is None:
+            return
+        glyphsTable = self.w.getItem("glyphsTable")
+        item = glyphsTable.get()[row]
+        item["thumbnail"] = self._makeThumbnailImage(recording, width)
+        countPen = simplify.CountPen()
+        replayRecording(recording, countPen)
+        item["points"] = str(countPen.pointCount)
+        tableView = glyphsTable.getNSTableView()
+        tableView.reloadDataForRowIndexes_columnIndexes_(
+            AppKit.NSIndexSet.indexSetWithIndex_(row),
+            AppKit.NSIndexSet.indexSetWithIndexesInRange_((0, tableView.numberOfColumns()))
+        )
+
+    def _makeThumbnailImage(self, recording, width):
+        size = self.thumbnailSize
+        info = self.font.info
+        verticalMetrics = [
+            info.descender,
+            info.xHeight,
+            info.capHeight,
+            info.ascender
+        ]
+        bottom = min(verticalMetrics)
+        top = max(verticalMetrics)
+        contentHeight = top - bottom
+        contentWidth = max(width, 1)
+        scale = size / max(contentWidth, contentHeight)
+        pen = CocoaPen(None)
+        replayRecording(recording, pen)
+        transform = AppKit.NSAffineTransform.transform()
+        transform.translateXBy_yBy_(
+            (size - contentWidth * scale) / 2,
+            (size - contentHeight * scale) / 2
+        )
+        transform.scaleBy_(scale)
+        transform.translateXBy_yBy_(0, -bottom)
+        pen.path.transformUsingAffineTransform_(transform)
+        image = AppKit.NSImage.alloc().initWithSize_((size, size))
+        image.lockFocus()
+        AppKit.NSColor.blackColor().set()
+        pen.path.fill()
+        image.unlockFocus()
+        return image
 
     # Preview
 
@@ -508,6 +1132,7 @@ class TracerWindowController(ezui.WindowController):
             self.previewImageLayer.setImage(None)
             self.previewTraceLayer.setPath(None)
             self.previewSimplifiedLayer.setPath(None)
+            self.previewPerformanceLayer.setText("")
             return
         # center
         view = self.previewView
@@ -554,30 +1179,172 @@ class TracerWindowController(ezui.WindowController):
             tracePointCount = simplify.countGlyphPoints(self.selectedTracedGlyph)
             simplifiedPointCount = simplify.countGlyphPoints(self.selectedSimplifiedGlyph)
             text = f"Trace: {tracePointCount} points | Simplified: {simplifiedPointCount} points"
+            # the automatic threshold is calculated with
+            # the trace on the preview worker thread.
+            if self.traceSettings.get("autoThreshold") and self._previewTrace is not None:
+                glyphName, traceSettings, recording, threshold = self._previewTrace
+                if glyphName == self.selectedImageGlyph.name and traceSettings.get("autoThreshold"):
+                    text = f"Threshold: {threshold:.2f} | " + text
         previewLabel.set(text)
         previewLabel.getNSTextField().display()
 
-    def updateTracePreview(self):
+    # images larger than this are first traced
+    # at this size for a quick draft preview.
+    previewDraftImageSize = 300
+    previewMaximumDelay = 0.3
+
+    def schedulePreview(self, delay=None):
+        """
+        Trace and simplify the selected glyph on the
+        preview worker thread. The trace is reused if
+        only the simplify settings have changed. Large
+        images are first traced at a low resolution and
+        the draft is shown until the full trace is done.
+        """
         if self.selectedImageGlyph is None:
+            self.previewWorker.cancel()
             return
-        self.updatePreviewLabel("Tracing...")
-        self._traceGlyph(
-            self.selectedImageGlyph,
-            self.selectedTracedGlyph
-        )
-        path = self.selectedTracedGlyph.getRepresentation("merz.CGPath")
-        self.previewTraceLayer.setPath(path)
+        imageGlyph = self.selectedImageGlyph
+        glyphName = imageGlyph.name
+        # the glyph is only read on the main thread,
+        # the worker gets the image data.
+        imageData = imageGlyph.image.data
+        transformation = imageGlyph.image.transformation
+        traceSettings = dict(self.traceSettings)
+        simplifySettings = dict(self.simplifySettings)
+        tracedRecording = None
+        tracedThreshold = None
+        if self._previewTrace is not None:
+            previousGlyphName, previousTraceSettings, recording, threshold = self._previewTrace
+            if previousGlyphName == glyphName and previousTraceSettings == traceSettings:
+                tracedRecording = recording
+                tracedThreshold = threshold
+        if tracedRecording is None:
+            self.updatePreviewLabel("Tracing...")
+        else:
+            self.updatePreviewLabel("Simplifying...")
+
+        draftImageSize = self.previewDraftImageSize
+        collectStatistics = self.previewSettings["performance"]
+
+        def traceRecording(threshold, maximumImageSize=None):
+            # the threshold is only calculated once
+            # for the draft and the full trace.
+            settings = dict(traceSettings, threshold=threshold, autoThreshold=False)
+            return self._traceRecording(imageData, transformation, settings, maximumImageSize=maximumImageSize)
+
+        def simplifyRecording(traced, statistics=None):
+            recordingPen = RecordingPen()
+            simplifyPen = simplify.SimplifyContoursPen(recordingPen, statistics=statistics, **simplifySettings)
+            replayRecording(traced, simplifyPen)
+            return recordingPen.value
+
+        def work(job):
+            traced = tracedRecording
+            threshold = tracedThreshold
+            performance = dict(
+                threshold=None,
+                thresholdCached=False,
+                trace=None,
+                traceReused=traced is not None,
+                simplify=None
+            )
+            if traced is None:
+                # only the header is read for the size.
+                # the trace decodes the image itself.
+                imageSize = largeImage.getImageSize(imageData)
+                threshold = traceSettings.get("threshold", 0)
+                if traceSettings.get("autoThreshold"):
+                    start = time.perf_counter()
+                    if largeImage.isLargeImage(imageData):
+                        performance["thresholdCached"] = largeImage.isAutomaticThresholdCached(imageData)
+                        threshold = largeImage.getAutomaticThreshold(imageData)
+                    else:
+                        performance["thresholdCached"] = tracerBitmap.isImageDecoded(imageData)
+                        threshold = tracerBitmap.getDecodedImage(imageData).getAutomaticThreshold()
+                    performance["threshold"] = time.perf_counter() - start
+                    job.checkCancelled()
+                if max(imageSize) > draftImageSize:
+                    draft = traceRecording(threshold, draftImageSize)
+                    job.checkCancelled()
+                    job.publish((glyphName, traceSettings, draft, simplifyRecording(draft), threshold, True, None))
+                start = time.perf_counter()
+                traced = traceRecording(threshold)
+                performance["trace"] = time.perf_counter() - start
+                job.checkCancelled()
+            statistics = None
+            if collectStatistics:
+                statistics = performance["simplify"] = simplify.SimplifyStatistics()
+            simplified = simplifyRecording(traced, statistics)
+            return glyphName, traceSettings, traced, simplified, threshold, False, performance
+
+        self.previewWorker.request(work, self._previewComputed, delay=delay)
+
+    def _previewComputed(self, result):
+        # this is called on the main thread.
+        glyphName, traceSettings, traced, simplified, threshold, isDraft, performance = result
+        if self.selectedImageGlyph is None or self.selectedImageGlyph.name != glyphName:
+            return
+        # a draft trace can't be reused
+        if not isDraft:
+            self._previewTrace = (glyphName, traceSettings, traced, threshold)
+        layers = [
+            (self.selectedTracedGlyph, traced, self.previewTraceLayer),
+            (self.selectedSimplifiedGlyph, simplified, self.previewSimplifiedLayer)
+        ]
+        for glyph, recording, layer in layers:
+            glyph.clearContours()
+            replayRecording(recording, glyph.getPen())
+            layer.setPath(glyph.getRepresentation("merz.CGPath"))
+        if isDraft:
+            self.updatePreviewLabel("Draft | Tracing full resolution...")
+        else:
+            self.updatePreviewLabel()
+            self.updatePerformanceDisplay(performance)
 
-    def updateSimplifiedPreview(self):
-        if self.selectedImageGlyph is None:
+    def updatePerformanceDisplay(self, performance):
+        """
+        Show the durations and point counts of the
+        trace and simplify stages for the selected glyph.
+        """
+        layer = self.previewPerformanceLayer
+        if performance is None or performance["simplify"] is None:
+            layer.setText("")
             return
-        self.updatePreviewLabel("Simplifying...")
-        self._simplifyGlyph(
-            self.selectedTracedGlyph,
-            self.selectedSimplifiedGlyph
+
+        def formatDuration(duration):
+            return f"{duration * 1000:8.1f} ms"
+
+        lines = []
+        cacheHits = []
+        if performance["traceReused"]:
+            cacheHits.append("trace")
+            lines.append(f"{'Threshold':<20}{'-':>11}")
+            lines.append(f"{'Trace':<20}{'-':>11}")
+        else:
+            if performance["thresholdCached"]:
+                cacheHits.append("threshold")
+            if performance["threshold"] is None:
+                # the threshold isn't calculated
+                lines.append(f"{'Threshold':<20}{'-':>11}")
+            else:
+                lines.append(f"{'Threshold':<20}{formatDuration(performance['threshold'])}")
+            # the trace includes decoding the image
+            lines.append(f"{'Trace':<20}{formatDuration(performance['trace'])}")
+        statistics = performance["simplify"]
+        for stageName, stage in statistics.stages.items():
+            lines.append(
+                f"{stageName:<20}{formatDuration(stage['duration'])}"
+                f"{stage['pointsIn']:>7} > {stage['pointsOut']}"
+            )
+        lines.append(
+            f"{'Simplify':<20}{formatDuration(statistics.getDuration())}"
+            f"{statistics.getPointsIn():>7} > {statistics.getPointsOut()}"
         )
-        path = self.selectedSimplifiedGlyph.getRepresentation("merz.CGPath")
-        self.previewSimplifiedLayer.setPath(path)
+        if not cacheHits:
+            cacheHits.append("none")
+        lines.append("Cache hits: " + ", ".join(cacheHits))
+        layer.setText("\n".join(lines))
 
     def updatePreviewSettings(self):
         settings = self.previewSettings
@@ -625,6 +1392,7 @@ class TracerWindowController(ezui.WindowController):
             simplifiedStrokeColor = clear
 
         self.previewImageLayer.setVisible(showImage)
+        self.previewPerformanceLayer.setVisible(settings["performance"])
         with self.previewTraceLayer.propertyGroup():
             self.previewTraceLayer.setFillColor(traceFillColor)
             self.previewTraceLayer.setStrokeColor(traceStrokeColor)
@@ -664,6 +1432,16 @@ class TracerWindowController(ezui.WindowController):
         self.previewSettings["simplifiedStroke"] = state
         self.updatePreviewSettings()
 
+    def previewPerformanceItemCallback(self, sender):
+        state = not sender.state()
+        sender.setState_(state)
+        self.previewSettings["performance"] = state
+        self.updatePreviewSettings()
+        # the statistics are only collected
+        # while they are being shown.
+        if state:
+            self.schedulePreview(delay=0)
+
     # Settings
 
     traceSettings = {}
@@ -696,68 +1474,553 @@ class TracerWindowController(ezui.WindowController):
                     simplifyChange = True
             storage[key] = value
         if traceChange:
-            self.updateTracePreview()
+            self.updateThresholdControl()
         if simplifyChange:
-            self.updateSimplifiedPreview()
-        self.updatePreviewLabel()
+            self.schedulePreview()
+            self.scheduleThumbnailUpdate()
+            self.updateGlyphStatuses()
+
+    def updateThresholdControl(self):
+        # the threshold slider has no effect
+        # when the threshold is automatic.
+        automatic = bool(self.traceSettings.get("autoThreshold"))
+        self.w.getItem("traceThreshold").enable(not automatic)
+
+    # Auto Tune
+
+    def getTuneSettings(self):
+        """
+        Get the tune settings if each glyph should
+        be tuned when it is traced.
+        """
+        if not self.w.getItem("destinationAutoTune").get():
+            return None
+        return dict(
+            maximumDeviation=self.w.getItem("autoTuneMaximumDeviation").get(),
+            timeBudget=tune.defaultTimeBudget
+        )
+
+    def autoTuneButtonCallback(self, sender):
+        """
+        Tune the simplify settings for the full resolution
+        trace of the selected glyph on the preview worker
+        thread. The preview may still show a draft, so the
+        glyph is traced first if the trace isn't available.
+        """
+        if self.selectedImageGlyph is None:
+            return
+        imageGlyph = self.selectedImageGlyph
+        glyphName = imageGlyph.name
+        imageData = imageGlyph.image.data
+        transformation = imageGlyph.image.transformation
+        traceSettings = dict(self.traceSettings)
+        initialSettings = dict(self.simplifySettings)
+        maximumDeviation = self.w.getItem("autoTuneMaximumDeviation").get()
+        tracedRecording = None
+        if self._previewTrace is not None:
+            previousGlyphName, previousTraceSettings, recording, threshold = self._previewTrace
+            if previousGlyphName == glyphName and previousTraceSettings == traceSettings:
+                tracedRecording = recording
+        self.updatePreviewLabel("Tuning...")
+
+        def work(job):
+            traced = tracedRecording
+            if traced is None:
+                traced = self._traceRecording(imageData, transformation, traceSettings)
+                job.checkCancelled()
+            tunedSettings, info = tune.tuneSimplifySettings(
+                traced,
+                maximumDeviation=maximumDeviation,
+                initialSettings=initialSettings
+            )
+            return glyphName, tunedSettings
+
+        self.previewWorker.request(work, self._autoTuneComputed, delay=0)
+
+    def _autoTuneComputed(self, result):
+        # this is called on the main thread.
+        glyphName, tunedSettings = result
+        if self.selectedImageGlyph is None or self.selectedImageGlyph.name != glyphName:
+            return
+        for key, value in tunedSettings.items():
+            identifier = "simplify" + key[0].upper() + key[1:]
+            self.w.getItem(identifier).set(value)
+        self.simplifySettings.update(tunedSettings)
+        self.schedulePreview(delay=0)
+        self.scheduleThumbnailUpdate()
+        self.updateGlyphStatuses()
+
+    def _tuneRecording(self, traced, destinationGlyph, tuneSettings):
+        tunedSettings, info = tune.tuneSimplifySettings(
+            traced,
+            initialSettings=self.simplifySettings,
+            **tuneSettings
+        )
+        simplifyPen = simplify.SimplifyContoursPen(
+            destinationGlyph.getPen(),
+            **tunedSettings
+        )
+        replayRecording(traced, simplifyPen)
+        destinationGlyph.lib[tune.tunedSettingsLibKey] = tunedSettings
 
     # Processing
 
     def destinationTraceSelectedGlyphsCallback(self, sender):
-        glyphNames = self.w.getItem("glyphsTable").getSelectedItems()
+        items = self.w.getItem("glyphsTable").getSelectedItems()
+        glyphNames = [item["glyphName"] for item in items]
         if glyphNames:
             self._traceGlyphs(glyphNames)
 
     def destinationTraceAllGlyphsCallback(self, sender):
-        glyphNames = self.w.getItem("glyphsTable").get()
+        items = self.w.getItem("glyphsTable").get()
+        glyphNames = [item["glyphName"] for item in items]
         if glyphNames:
             self._traceGlyphs(glyphNames)
 
-    def _traceGlyphs(self, glyphNames):
-        imageLayer = self.font.defaultLayer
+    def destinationLayerCallback(self, sender):
+        self.updateGlyphStatuses()
+
+    def destinationAutoTuneCallback(self, sender):
+        self.updateGlyphStatuses()
+
+    def autoTuneMaximumDeviationCallback(self, sender):
+        if self.getTuneSettings() is not None:
+            self.updateGlyphStatuses()
+
+    # Fingerprints
+
+    statusTitles = {
+        fingerprint.fingerprintStatusCurrent : "",
+        fingerprint.fingerprintStatusStale : "Stale",
+        fingerprint.fingerprintStatusUntraced : "Untraced"
+    }
+
+    def _getImageHash(self, imageGlyph):
+        # image data is only hashed again if it
+        # is a different data object. the data is
+        # kept with its hash, so its identity can't
+        # be reused by other data. replacing the data
+        # under the same file name makes a new object.
+        imageData = imageGlyph.image.data
+        stored = self._imageHashes.get(imageGlyph.name)
+        if stored is not None and stored[0] is imageData:
+            return stored[1]
+        imageHash = cache.hashImageData(imageData)
+        self._imageHashes[imageGlyph.name] = (imageData, imageHash)
+        return imageHash
+
+    def _makeFingerprint(self, imageGlyph):
+        image = imageGlyph.image
+        return fingerprint.makeFingerprint(
+            imageData=None,
+            traceSettings=self.traceSettings,
+            simplifySettings=tune.combineSettings(self.simplifySettings, self.getTuneSettings()),
+            imageTransformation=image.transformation,
+            imageHash=self._getImageHash(imageGlyph),
+            backend=self._getTraceBackend()
+        )
+
+    def _getDestinationLayer(self):
+        destinationLayerName = self.w.getItem("destinationLayer").get()
+        if destinationLayerName not in self.font.layerOrder:
+            return None
+        return self.font.getLayer(destinationLayerName)
+
+    def updateGlyphStatuses(self):
+        """
+        Update the status of the visible glyphs. The
+        others are updated when they are scrolled into
+        view.
+        """
+        glyphsTable = self.w.getItem("glyphsTable")
+        destinationLayer = self._getDestinationLayer()
+        items = glyphsTable.get()
+        rows = self._getVisibleGlyphRows()
+        for row in rows:
+            item = items[row]
+            glyphName = item["glyphName"]
+            destinationGlyph = None
+            if destinationLayer is not None and glyphName in destinationLayer:
+                destinationGlyph = destinationLayer[glyphName]
+            status = fingerprint.getFingerprintStatus(
+                destinationGlyph,
+                self._makeFingerprint(self.font[glyphName])
+            )
+            item["status"] = self.statusTitles[status]
+        tableView = glyphsTable.getNSTableView()
+        tableView.reloadDataForRowIndexes_columnIndexes_(
+            AppKit.NSIndexSet.indexSetWithIndexesInRange_((rows.start, len(rows))),
+            AppKit.NSIndexSet.indexSetWithIndexesInRange_((0, tableView.numberOfColumns()))
+        )
+
+    traceCache = None
+
+    def getTraceCache(self):
+        if not self.w.getItem("destinationUseCache").get():
+            return None
+        if self.traceCache is None:
+            self.traceCache = cache.TraceCache()
+        return self.traceCache
+
+    def _getOrMakeDestinationLayer(self):
         destinationLayerName = self.w.getItem("destinationLayer").get()
         if destinationLayerName not in self.font.layerOrder:
             self.font.newLayer(destinationLayerName)
-        destinationLayer = self.font.getLayer(destinationLayerName)
-        progressBar = self.startProgress(
-            text="Processing...",
-            maxValue=len(glyphNames),
-            parent=self.w
+        return self.font.getLayer(destinationLayerName)
+
+    def _getCheckpointHash(self, destinationLayer, tuneSettings, glyphNames):
+        return checkpoint.makeCheckpointHash(
+            self.traceSettings,
+            tune.combineSettings(self.simplifySettings, tuneSettings),
+            destinationLayer.name,
+            glyphNames
         )
-        try:
+
+    def _canTraceInParallel(self):
+        # potracer in a pool of threads is slower
+        # than DrawBot, so the glyphs are traced
+        # serially if processes can't be used.
+        return batch is not None and batch.canUseWorkerProcesses()
+
+    def _getTraceBackend(self):
+        # glyphs are traced with the portable trace
+        # implementation when they are traced in
+        # parallel and with DrawBot otherwise.
+        if self._canTraceInParallel():
+            return cache.traceBackendPortable
+        return cache.traceBackendDrawBot
+
+    def _traceGlyphs(self, glyphNames):
+        if self._batchRun is not None:
+            return
+        if self._canTraceInParallel():
+            self._traceGlyphsInParallel(glyphNames)
+        else:
+            self._traceGlyphsSerially(glyphNames)
+
+    # Parallel Batch
+
+    _batchRun = None
+    batchPollInterval = 0.1
+
+    def _traceGlyphsInParallel(self, glyphNames):
+        """
+        Trace glyphs in a pool of worker processes with
+        the portable trace implementation. The image data
+        and settings are gathered on the main thread as the
+        workers need them and the results are written into
+        the destination glyphs on the main thread.
+
+        The names and image hashes of the finished glyphs
+        are stored in the font lib. If the run is cancelled,
+        the next run with the same settings and glyphs skips
+        those glyphs unless their images have changed.
+        """
+        traceCache = self.getTraceCache()
+        incremental = self.w.getItem("destinationIncremental").get()
+        tuneSettings = self.getTuneSettings()
+        traceSettings = dict(self.traceSettings)
+        simplifySettings = dict(self.simplifySettings)
+        destinationLayer = self._getOrMakeDestinationLayer()
+        checkpointHash = self._getCheckpointHash(destinationLayer, tuneSettings, glyphNames)
+        completed = checkpoint.readCheckpointLib(self.font.lib, checkpointHash)
+
+        def iterateJobs():
             for glyphName in glyphNames:
-                progressBar.setText(f"Processing {glyphName}...")
                 imageGlyph = self.font[glyphName]
-                if glyphName not in destinationLayer:
-                    destinationLayer.newGlyph(glyphName)
-                destinationGlyph = destinationLayer[glyphName]
-                with destinationGlyph.holdChanges():
-                    destinationGlyph.unicodes = imageGlyph.unicodes
-                    self._traceGlyph(imageGlyph, destinationGlyph)
-                    self._simplifyGlyph(destinationGlyph, None)
-                progressBar.increment()
-        finally:
-            progressBar.close()
-
-    def _traceGlyph(self, imageGlyph, destinationGlyph):
-        if destinationGlyph is not None:
+                image = imageGlyph.image
+                glyphFingerprint = self._makeFingerprint(imageGlyph)
+                if checkpoint.isCompleted(completed, glyphName, glyphFingerprint["image"]):
+                    yield None
+                    continue
+                if incremental and glyphName in destinationLayer:
+                    status = fingerprint.getFingerprintStatus(destinationLayer[glyphName], glyphFingerprint)
+                    if status == fingerprint.fingerprintStatusCurrent:
+                        yield None
+                        continue
+                imageData = image.data
+                cacheKey = None
+                if traceCache is not None:
+                    cacheKey = cache.makeCacheKey(
+                        imageData,
+                        traceSettings,
+                        tune.combineSettings(simplifySettings, tuneSettings),
+                        image.transformation,
+                        backend=cache.traceBackendPortable
+                    )
+                    entry = traceCache.getWithTunedSettings(cacheKey)
+                    if entry is not None:
+                        contours, tunedSettings = entry
+                        self._commitBatchResult(destinationLayer, glyphName, contours, glyphFingerprint, tunedSettings)
+                        completed[glyphName] = glyphFingerprint["image"]
+                        yield None
+                        continue
+                job = (
+                    glyphName,
+                    imageData,
+                    traceSettings,
+                    simplifySettings,
+                    Transform(*image.transformation),
+                    tuneSettings
+                )
+                yield job, (glyphFingerprint, cacheKey)
+
+        self._openBatchSheet()
+        if completed:
+            self.batchSheet.getItem("batchStatus").set(f"Resuming after {len(completed)} glyphs...")
+        runner = batch.BatchRunner(iterateJobs(), len(glyphNames))
+        self._batchRun = dict(
+            runner=runner,
+            destinationLayer=destinationLayer,
+            traceCache=traceCache,
+            checkpointHash=checkpointHash,
+            completed=completed
+        )
+        callLater(self.batchPollInterval, self._pollBatch)
+
+    def _pollBatch(self):
+        if self._batchRun is None:
+            # the window was closed
+            return
+        runner = self._batchRun["runner"]
+        destinationLayer = self._batchRun["destinationLayer"]
+        traceCache = self._batchRun["traceCache"]
+        completed = self._batchRun["completed"]
+        try:
+            results = runner.poll(timeout=0)
+            for (glyphFingerprint, cacheKey), (glyphName, contours, tunedSettings) in results:
+                self._commitBatchResult(destinationLayer, glyphName, contours, glyphFingerprint, tunedSettings)
+                completed[glyphName] = glyphFingerprint["image"]
+                if cacheKey is not None:
+                    traceCache.set(cacheKey, contours, tunedSettings)
+        except Exception:
+            self._finishBatch()
+            raise
+        if results:
+            checkpoint.writeCheckpointLib(self.font.lib, self._batchRun["checkpointHash"], completed)
+        if runner.cancelled:
+            self.batchSheet.getItem("batchStatus").set("Cancelling...")
+        else:
+            self.batchSheet.getItem("batchStatus").set(runner.getProgressText())
+        if runner.isFinished():
+            self._finishBatch()
+        else:
+            callLater(self.batchPollInterval, self._pollBatch)
+
+    def _commitBatchResult(self, destinationLayer, glyphName, contours, glyphFingerprint, tunedSettings=None):
+        imageGlyph = self.font[glyphName]
+        if glyphName not in destinationLayer:
+            destinationLayer.newGlyph(glyphName)
+        destinationGlyph = destinationLayer[glyphName]
+        with destinationGlyph.holdChanges():
             destinationGlyph.width = imageGlyph.width
+            destinationGlyph.unicodes = imageGlyph.unicodes
             destinationGlyph.clearContours()
-        trace.traceGlyphImage(
-            glyphWithImage=imageGlyph,
-            destinationGlyph=destinationGlyph,
-            **self.traceSettings
+            contours.draw(destinationGlyph.getPen())
+            if tunedSettings is not None:
+                destinationGlyph.lib[tune.tunedSettingsLibKey] = tunedSettings
+            else:
+                destinationGlyph.lib.pop(tune.tunedSettingsLibKey, None)
+            fingerprint.writeFingerprint(destinationGlyph, glyphFingerprint)
+
+    def _finishBatch(self):
+        runner = self._batchRun["runner"]
+        # a cancelled run keeps its checkpoint
+        # so that the next run can resume.
+        if not runner.cancelled:
+            checkpoint.removeCheckpointLib(self.font.lib)
+        runner.close()
+        self._batchRun = None
+        self.batchSheet.close()
+        self.batchSheet = None
+        self.updateGlyphStatuses()
+
+    def _openBatchSheet(self):
+        content = """
+        . @batchStatus
+
+        =---------------------------=
+
+        (Cancel) @batchCancelButton
+        """
+        descriptionData = dict(
+            batchStatus=dict(
+                width=450
+            )
         )
-        destinationGlyph.scaleBy(imageGlyph.image.scale)
-        destinationGlyph.moveBy(imageGlyph.image.transformation[-2:])
+        self.batchSheet = ezui.EZSheet(
+            content=content,
+            descriptionData=descriptionData,
+            parent=self.w,
+            controller=self
+        )
+        self.batchSheet.getItem("batchStatus").set("Preparing...")
+        self.batchSheet.open()
+
+    def batchCancelButtonCallback(self, sender):
+        if self._batchRun is None:
+            return
+        # the jobs that are running are still
+        # committed before the sheet closes.
+        self._batchRun["runner"].cancel()
+        self.batchSheet.getItem("batchStatus").set("Cancelling...")
+
+    # Serial Batch
 
-    def _simplifyGlyph(self, tracedGlyph, destinationGlyph):
-        if destinationGlyph is not None:
+    # the checkpoint is stored in the font lib
+    # after this many glyphs have been traced.
+    serialCheckpointInterval = 50
+
+    def _traceGlyphsSerially(self, glyphNames):
+        """
+        Trace glyphs one at a time with DrawBot. The glyphs
+        are traced in short slices on the main thread, so
+        the run can be cancelled with the progress sheet.
+        The checkpoint works as it does for parallel runs.
+        """
+        traceCache = self.getTraceCache()
+        incremental = self.w.getItem("destinationIncremental").get()
+        tuneSettings = self.getTuneSettings()
+        destinationLayer = self._getOrMakeDestinationLayer()
+        checkpointHash = self._getCheckpointHash(destinationLayer, tuneSettings, glyphNames)
+        completed = checkpoint.readCheckpointLib(self.font.lib, checkpointHash)
+
+        def traceGlyph(glyphName):
+            return self._traceGlyphSerially(
+                glyphName,
+                destinationLayer,
+                traceCache,
+                incremental,
+                tuneSettings,
+                completed
+            )
+
+        self._openBatchSheet()
+        if completed:
+            self.batchSheet.getItem("batchStatus").set(f"Resuming after {len(completed)} glyphs...")
+        self._batchRun = dict(
+            runner=SerialBatchRunner(glyphNames, traceGlyph),
+            checkpointHash=checkpointHash,
+            completed=completed,
+            uncheckpointed=0
+        )
+        callLater(0, self._stepSerialBatch)
+
+    def _stepSerialBatch(self):
+        if self._batchRun is None:
+            # the window was closed
+            return
+        runner = self._batchRun["runner"]
+        try:
+            self._batchRun["uncheckpointed"] += runner.step()
+        except Exception:
+            self._finishBatch()
+            raise
+        finished = runner.isFinished()
+        uncheckpointed = self._batchRun["uncheckpointed"]
+        # a finished run removes the checkpoint, a
+        # cancelled one keeps it so it can resume.
+        if uncheckpointed >= self.serialCheckpointInterval or (runner.cancelled and uncheckpointed):
+            checkpoint.writeCheckpointLib(self.font.lib, self._batchRun["checkpointHash"], self._batchRun["completed"])
+            self._batchRun["uncheckpointed"] = 0
+        if finished:
+            self._finishBatch()
+        else:
+            self.batchSheet.getItem("batchStatus").set(runner.getProgressText())
+            callLater(0, self._stepSerialBatch)
+
+    def _traceGlyphSerially(self, glyphName, destinationLayer, traceCache, incremental, tuneSettings, completed):
+        # returns True if the glyph was traced.
+        imageGlyph = self.font[glyphName]
+        glyphFingerprint = self._makeFingerprint(imageGlyph)
+        if checkpoint.isCompleted(completed, glyphName, glyphFingerprint["image"]):
+            return False
+        destinationGlyph = None
+        if glyphName in destinationLayer:
+            destinationGlyph = destinationLayer[glyphName]
+        if incremental:
+            status = fingerprint.getFingerprintStatus(destinationGlyph, glyphFingerprint)
+            if status == fingerprint.fingerprintStatusCurrent:
+                return False
+        # the glyph is only made when it is traced
+        if destinationGlyph is None:
+            destinationLayer.newGlyph(glyphName)
+            destinationGlyph = destinationLayer[glyphName]
+        with destinationGlyph.holdChanges():
+            destinationGlyph.unicodes = imageGlyph.unicodes
+            if traceCache is None:
+                self._traceAndSimplifyGlyph(imageGlyph, destinationGlyph, tuneSettings)
+            else:
+                self._traceGlyphWithCache(imageGlyph, destinationGlyph, traceCache, tuneSettings)
+            fingerprint.writeFingerprint(destinationGlyph, glyphFingerprint)
+        completed[glyphName] = glyphFingerprint["image"]
+        return True
+
+    def _traceAndSimplifyGlyph(self, imageGlyph, destinationGlyph, tuneSettings=None):
+        destinationGlyph.width = imageGlyph.width
+        destinationGlyph.clearContours()
+        if tuneSettings is None:
+            # the trace goes through the simplify
+            # pen straight into the destination.
+            trace.traceAndSimplifyGlyphImage(
+                imageGlyph,
+                destinationGlyph.getPen(),
+                simplifySettings=self.simplifySettings,
+                transformation=imageGlyph.image.transformation,
+                **self.traceSettings
+            )
+            destinationGlyph.lib.pop(tune.tunedSettingsLibKey, None)
+        else:
+            image = imageGlyph.image
+            traced = self._traceRecording(image.data, image.transformation)
+            self._tuneRecording(traced, destinationGlyph, tuneSettings)
+
+    def _traceGlyphWithCache(self, imageGlyph, destinationGlyph, traceCache, tuneSettings=None):
+        image = imageGlyph.image
+        key = cache.makeCacheKey(
+            image.data,
+            self.traceSettings,
+            tune.combineSettings(self.simplifySettings, tuneSettings),
+            image.transformation,
+            backend=cache.traceBackendDrawBot
+        )
+        entry = traceCache.getWithTunedSettings(key)
+        if entry is None:
+            self._traceAndSimplifyGlyph(imageGlyph, destinationGlyph, tuneSettings)
+            contoursPen = tracerContours.PackedContoursPen()
+            destinationGlyph.draw(contoursPen)
+            tunedSettings = destinationGlyph.lib.get(tune.tunedSettingsLibKey)
+            if tunedSettings is not None:
+                tunedSettings = dict(tunedSettings)
+            traceCache.set(key, contoursPen.getContours(), tunedSettings)
+        else:
+            contours, tunedSettings = entry
+            destinationGlyph.width = imageGlyph.width
             destinationGlyph.clearContours()
-            destinationGlyph.width = tracedGlyph.width
-        simplify.simplifyGlyphContours(
-            glyph=tracedGlyph,
-            destinationGlyph=destinationGlyph,
-            **self.simplifySettings
+            contours.draw(destinationGlyph.getPen())
+            # the lib is set as it would be by a trace.
+            if tunedSettings is not None:
+                destinationGlyph.lib[tune.tunedSettingsLibKey] = tunedSettings
+            else:
+                destinationGlyph.lib.pop(tune.tunedSettingsLibKey, None)
+
+    def _traceRecording(self, imageData, transformation, traceSettings=None, simplifySettings=None, maximumImageSize=None):
+        """
+        Trace, and simplify if simplifySettings is given,
+        into a RecordingPen value without making a glyph.
+        Only image data is used, so this can run on the
+        preview and thumbnail threads.
+        """
+        if traceSettings is None:
+            traceSettings = self.traceSettings
+        recordingPen = RecordingPen()
+        trace.traceAndSimplifyImageData(
+            imageData,
+            recordingPen,
+            simplifySettings=simplifySettings,
+            maximumImageSize=maximumImageSize,
+            transformation=transformation,
+            **traceSettings
         )
+        return recordingPen.value
 